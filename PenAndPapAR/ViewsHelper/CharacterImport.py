@@ -0,0 +1,361 @@
+import hashlib
+import json
+
+from django.db import transaction
+
+from PenAndPapAR.ViewsHelper.CharacterSheetCache import invalidate_character_sheets
+from PenAndPapAR.ViewsHelper.Conditions import ConditionError, sync_condition_fields
+from PenAndPapAR.ViewsHelper.DerivedFormulas import compute_derived_stats
+from PenAndPapAR.ViewsHelper.SheetEvents import publish_sheet_event
+from PenAndPapAR.models import (
+    Attributes,
+    CharacterIdSequence,
+    CharacterStats,
+    AC,
+    SavingThrowProficiencies,
+    Skills,
+    HitPoints,
+    DerivedStats
+)
+from PenAndPapAR.serializers import (
+    CharacterStatsImportSerializer,
+    AttributesImportSerializer,
+    ACImportSerializer,
+    SavingThrowProficienciesImportSerializer,
+    SkillsImportSerializer,
+    HitPointsImportSerializer
+)
+
+TOPICS = ["stats", "attributes", "ac", "saving_throw_proficiencies", "skills", "hit_points"]
+SINGLE_ROW_TOPICS = ["stats", "ac", "hit_points"]
+
+# trait topic -> field that names a row
+TRAIT_NAME_FIELDS = {
+    "attributes": "attribute_name",
+    "saving_throw_proficiencies": "saving_throw_name",
+    "skills": "skill_name",
+}
+
+SKILL_NAMES = [
+    "acrobatics",
+    "animal_handling",
+    "arcana",
+    "athletics",
+    "deception",
+    "history",
+    "insight",
+    "intimidation",
+    "investigation",
+    "medicine",
+    "nature",
+    "perception",
+    "performance",
+    "persuasion",
+    "religion",
+    "sleight_of_hand",
+    "stealth",
+    "survival"
+]
+ATTRIBUTE_NAMES = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
+SAVING_THROW_NAMES = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
+
+IMPORT_SERIALIZERS = {
+    "stats": CharacterStatsImportSerializer,
+    "attributes": AttributesImportSerializer,
+    "ac": ACImportSerializer,
+    "saving_throw_proficiencies": SavingThrowProficienciesImportSerializer,
+    "skills": SkillsImportSerializer,
+    "hit_points": HitPointsImportSerializer,
+}
+
+
+class CharacterImportError(Exception):
+    pass
+
+
+# Templates für Standardwerte
+character_stats_template = {
+    "character_is_inspired": False,
+    "character_name": None,
+    "character_class": None,
+    "character_race": None,
+    "character_background": None,
+    "character_subclass": None,
+    "character_level": 1,
+    "character_alignment": None,
+    "character_conditions": None,
+    "character_source_link": None,
+    "character_proficiency_bonus": 2,
+
+    "character_speed": 30,
+    "character_gender": None,
+    "character_death_save_success": None,
+    "character_death_save_failure": None,
+    "character_exhaustion": None,
+    "character_initiative_adjustment": None,
+    "character_proficiency_bonus_adjustment": 0
+}
+
+attribute_template = {
+    "attribute_name": "strength",
+    "attribute_value": 10,
+    "attribute_adjustment": 0
+}
+
+ac_template = {
+    "ac_base": 10,
+    "ac_modified": 0
+}
+
+saving_throw_proficiencies_template = {
+    "saving_throw_name": "strength",
+    "saving_throw_adjustment": 0,
+    "saving_throw_is_proficient": False}
+
+skills_template = {
+    "skill_name": "athletics",
+    "skill_adjustment": 0,
+    "skill_is_proficient": False,
+    "skill_is_expertise": False
+}
+
+hit_points_template = {
+    "hit_points_current": 30,
+    "hit_points_max": 30,
+    "hit_points_temp": 0,
+    "non_lethal_damage": 0
+}
+
+
+templates = [
+    character_stats_template,
+    attribute_template,
+    ac_template,
+    saving_throw_proficiencies_template,
+    skills_template,
+    hit_points_template
+]
+
+
+def generate_character_ids(count):
+    first = CharacterIdSequence.allocate(count)
+    return [CharacterIdSequence.format_character_id(number) for number in range(first, first + count)]
+
+
+def generate_character_id():
+    return generate_character_ids(1)[0]
+
+
+def validate_post_request(field_names, data):
+
+    for topic in field_names:
+        if topic not in data or not data[topic]:
+            return topic
+        else:
+            for stat in data[topic]:
+                for key, default_value in templates[field_names.index(topic)].items():
+                    if key not in stat or stat[key] is None:
+                        stat[key] = default_value
+    return None
+
+
+def generate_character_trait(name_list, trait_data, field):
+    for trait in trait_data:
+        if trait[f"{field}_name"] not in name_list:
+            raise CharacterImportError(f"Invalid trait name '{trait[f'{field}_name']}'.")
+        else:
+            name_list.remove(trait[f"{field}_name"])
+
+    missing_traits = []
+    for trait in name_list:
+        if field == "attribute":
+            trait_data.append(
+                        {
+                            f"{field}_name": trait,
+                            f"{field}_value": 10,
+                            f"{field}_adjustment": 0,
+                        }
+            )
+        elif field == "saving_throw":
+            trait_data.append(
+                        {
+                            f"{field}_name": trait,
+                            f"{field}_adjustment": 0,
+                            f"{field}_is_proficient": False,
+                        }
+            )
+        elif field == "skill":
+            trait_data.append(
+                        {
+                            f"{field}_name": trait,
+                            f"{field}_adjustment": 0,
+                            f"{field}_is_proficient": False,
+                            f"{field}_is_expertise": False,
+                        }
+            )
+
+    return missing_traits
+
+
+def normalize_character(data):
+    """
+    Fills in defaults and generates missing traits of one character payload in place.
+
+    :raises CharacterImportError: if a topic is missing or a trait name is invalid.
+    """
+    if not isinstance(data, dict):
+        raise CharacterImportError("Character data must be an object.")
+
+    invalid_topic = validate_post_request(TOPICS, data)
+    if invalid_topic is not None:
+        raise CharacterImportError(f"Missing data for topic '{invalid_topic}'.")
+
+    for topic in SINGLE_ROW_TOPICS:
+        if len(data[topic]) > 1:
+            raise CharacterImportError(f"Only one entry allowed for topic '{topic}'.")
+
+    try:
+        data["stats"][0] = sync_condition_fields(data["stats"][0])
+    except ConditionError as e:
+        raise CharacterImportError(str(e))
+
+    # generate missing Traits
+    generate_character_trait(list(ATTRIBUTE_NAMES), data["attributes"], "attribute")
+    generate_character_trait(list(SAVING_THROW_NAMES), data["saving_throw_proficiencies"], "saving_throw")
+    generate_character_trait(list(SKILL_NAMES), data["skills"], "skill")
+
+
+def prepare_characters(payloads):
+    """
+    Validates all payloads before anything is written. Runs without database queries.
+    Returns the validated rows per topic for every character and a list of errors with
+    the index of the failing payload. Nothing should be written if there are errors.
+    """
+    errors = {}
+    normalized = []
+    for index, payload in enumerate(payloads):
+        try:
+            normalize_character(payload)
+            normalized.append((index, payload))
+        except CharacterImportError as e:
+            errors[index] = str(e)
+
+    # one serializer per topic for all characters, building the serializer fields is the expensive part
+    prepared = {index: {} for index, _ in normalized}
+    for topic in TOPICS:
+        rows = []
+        owners = []
+        for index, payload in normalized:
+            rows.extend(payload[topic])
+            owners.extend([index] * len(payload[topic]))
+
+        serializer = IMPORT_SERIALIZERS[topic](data=rows, many=True)
+        if serializer.is_valid():
+            for owner, row in zip(owners, serializer.validated_data):
+                prepared[owner].setdefault(topic, []).append(row)
+            continue
+
+        topic_errors = {}
+        for owner, row_errors in zip(owners, serializer.errors):
+            topic_errors.setdefault(owner, []).append(row_errors)
+        for owner, owner_errors in topic_errors.items():
+            if owner not in errors and any(owner_errors):
+                errors[owner] = f"Invalid data in character {topic}.\n{owner_errors}"
+
+    if errors:
+        return [], [{"index": index, "error": errors[index]} for index in sorted(errors)]
+    return [prepared[index] for index, _ in normalized], []
+
+
+def prepare_character(data):
+    """
+    Fills in defaults, generates missing traits and validates one character payload.
+
+    :raises CharacterImportError: if a topic is missing or contains invalid data.
+    """
+    prepared_characters, errors = prepare_characters([data])
+    if errors:
+        raise CharacterImportError(errors[0]["error"])
+    return prepared_characters[0]
+
+
+def hash_character_sections(data):
+    """
+    Stable sha256 per topic of a character sheet as returned by parse_character_data.
+    Trait rows are hashed in name order, so only a changed value changes a hash.
+    """
+    section_hashes = {}
+    for topic in TOPICS:
+        rows = data.get(topic) or []
+        if topic in TRAIT_NAME_FIELDS:
+            rows = sorted(rows, key=lambda row: str(row.get(TRAIT_NAME_FIELDS[topic])))
+        canonical = json.dumps(rows, sort_keys=True, separators=(",", ":"), default=str)
+        section_hashes[topic] = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+    return section_hashes
+
+
+def hash_character(section_hashes):
+    """Hash of a whole sheet from its section hashes."""
+    canonical = json.dumps(section_hashes, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def changed_sections(parsed, section_hashes, stored_section_hashes):
+    """The topics of parsed whose hash differs from the stored one, all of them if none is stored."""
+    return {topic: rows for topic, rows in parsed.items()
+            if not stored_section_hashes or stored_section_hashes.get(topic) != section_hashes.get(topic)}
+
+
+def write_characters(prepared_characters, section_hashes=None):
+    """
+    Writes prepared characters with one bulk insert per table inside a single transaction,
+    including their DerivedStats. Returns the generated character ids in the order of the
+    given characters.
+
+    :param section_hashes: hash_character_sections() of the upstream sheet per character
+                           (None for characters without one), stored for later re-syncs.
+    """
+    stats, attributes, acs, saving_throws, skills, hit_points, derived = [], [], [], [], [], [], []
+    section_hashes = section_hashes or [None] * len(prepared_characters)
+
+    with transaction.atomic():
+        character_ids = generate_character_ids(len(prepared_characters))
+
+        for character_id, character, hashes in zip(character_ids, prepared_characters, section_hashes):
+            source_fields = {"character_source_hash": hash_character(hashes),
+                             "character_section_hashes": hashes} if hashes else {}
+            character_stats = [CharacterStats(character_id=character_id, **row, **source_fields)
+                               for row in character["stats"]]
+            character_attributes = [Attributes(attribute_character_id=character_id, **row)
+                                    for row in character["attributes"]]
+            character_saving_throws = [SavingThrowProficiencies(saving_throw_proficiency_character_id=character_id,
+                                                                **row)
+                                       for row in character["saving_throw_proficiencies"]]
+            character_skills = [Skills(skill_character_id=character_id, **row) for row in character["skills"]]
+
+            stats.extend(character_stats)
+            attributes.extend(character_attributes)
+            acs.extend(AC(ac_character_id=character_id, **row) for row in character["ac"])
+            saving_throws.extend(character_saving_throws)
+            skills.extend(character_skills)
+            hit_points.extend(HitPoints(hit_points_character_id=character_id, **row)
+                              for row in character["hit_points"])
+            # computed from the instances, so model defaults of omitted fields are included
+            derived.append(DerivedStats(derived_character_id=character_id, **compute_derived_stats(
+                vars(character_stats[0]), [vars(row) for row in character_attributes],
+                [vars(row) for row in character_skills], [vars(row) for row in character_saving_throws])))
+
+        CharacterStats.objects.bulk_create(stats)
+        Attributes.objects.bulk_create(attributes)
+        AC.objects.bulk_create(acs)
+        SavingThrowProficiencies.objects.bulk_create(saving_throws)
+        Skills.objects.bulk_create(skills)
+        HitPoints.objects.bulk_create(hit_points)
+        DerivedStats.objects.bulk_create(derived)
+
+        for character_id in character_ids:
+            publish_sheet_event("create", character_id, version=0)
+
+    # ids are never reused, but an empty sheet may have been cached for an id before it existed
+    invalidate_character_sheets(dict.fromkeys(character_ids, 0))
+    return character_ids
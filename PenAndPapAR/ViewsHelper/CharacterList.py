@@ -0,0 +1,126 @@
+import base64
+import binascii
+
+from django.db import connection
+from django.db.models import F, Q
+from django.db.models.lookups import Exact, GreaterThan
+
+from PenAndPapAR.ViewsHelper.CharacterSheet import section_read_serializer
+from PenAndPapAR.ViewsHelper.Conditions import ConditionError, condition_flags
+from PenAndPapAR.models import CharacterStats
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# stats fields of a list entry, the complete sheet is read from /api/stats/
+LIST_FIELDS = ("character_id", "character_name", "character_class", "character_subclass", "character_race",
+               "character_level", "character_conditions", "character_condition_flags", "character_exhaustion",
+               "character_version")
+
+# the largest code point, a prefix followed by it sorts after every name starting with the prefix
+# when names are compared by code point (SQLite's BINARY collation, the "C" collation of PostgreSQL)
+PREFIX_END = "\U0010ffff"
+
+
+class CharacterListError(Exception):
+    pass
+
+
+def encode_cursor(character_id):
+    return base64.urlsafe_b64encode(character_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        return base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_", validate=True).decode("utf-8")
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise CharacterListError("Invalid cursor.")
+
+
+def parse_int(query_params, name, default=None):
+    value = query_params.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise CharacterListError(f"{name} must be an integer.")
+
+
+def split_values(query_params, name):
+    return [value.strip() for value in query_params.get(name, "").split(",") if value.strip()]
+
+
+def name_prefix_filter(prefix):
+    """
+    Names starting with prefix, case sensitive. SQLite compares names by code point, so the
+    prefix is a range on the name index there, its LIKE would ignore case. Other databases
+    may sort by a language collation where the range is not the prefix, they get LIKE
+    'prefix%', which PostgreSQL answers from the varchar_pattern_ops index of migration 0010.
+    """
+    if connection.vendor == "sqlite":
+        return Q(character_name__gte=prefix, character_name__lt=prefix + PREFIX_END)
+    return Q(character_name__startswith=prefix)
+
+
+def parse_character_filters(query_params):
+    """
+    Filters of the character list from ?class=, ?race= (comma separated for several),
+    ?level_min=, ?level_max=, ?name= (case sensitive prefix), ?condition= (all of the
+    comma separated conditions) and ?condition_any= (at least one of them).
+    """
+    filters = []
+    for parameter, field in (("class", "character_class"), ("race", "character_race")):
+        values = split_values(query_params, parameter)
+        if len(values) == 1:
+            filters.append(Q(**{field: values[0]}))
+        elif values:
+            filters.append(Q(**{f"{field}__in": values}))
+
+    level_min = parse_int(query_params, "level_min")
+    level_max = parse_int(query_params, "level_max")
+    if level_min is not None:
+        filters.append(Q(character_level__gte=level_min))
+    if level_max is not None:
+        filters.append(Q(character_level__lte=level_max))
+
+    name = query_params.get("name")
+    if name:
+        filters.append(name_prefix_filter(name))
+
+    # conditions are tested on the bitmask: flags & mask = mask for all, flags & mask > 0 for any.
+    # A bitmask with these bits is at least mask, or its lowest bit for any, a range the
+    # index on character_condition_flags can answer before the bits are tested.
+    try:
+        all_of = condition_flags(split_values(query_params, "condition"))
+        any_of = condition_flags(split_values(query_params, "condition_any"))
+    except ConditionError as e:
+        raise CharacterListError(str(e))
+    if all_of:
+        filters.append(Q(character_condition_flags__gte=all_of))
+        filters.append(Exact(F("character_condition_flags").bitand(all_of), all_of))
+    if any_of:
+        filters.append(Q(character_condition_flags__gte=any_of & -any_of))
+        filters.append(GreaterThan(F("character_condition_flags").bitand(any_of), 0))
+    return filters
+
+
+def list_characters(filters, cursor=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    One page of characters matching filters, ordered by character_id. Pages are keyed by
+    the last character_id of the previous page (WHERE character_id > ...) instead of an
+    OFFSET, so deep pages cost the same as the first one.
+    Returns the list entries and the cursor of the next page, None on the last page.
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise CharacterListError(f"limit must be between 1 and {MAX_PAGE_SIZE}.")
+
+    serializer = section_read_serializer("stats", LIST_FIELDS)
+    queryset = CharacterStats.objects.filter(*filters)
+    if cursor:
+        queryset = queryset.filter(character_id__gt=decode_cursor(cursor))
+
+    # one row more than the page tells whether there is a next page
+    rows = list(queryset.order_by("character_id").values(*serializer.columns)[:limit + 1])
+    next_cursor = encode_cursor(rows[limit - 1]["character_id"]) if len(rows) > limit else None
+    return serializer.many(rows[:limit]), next_cursor
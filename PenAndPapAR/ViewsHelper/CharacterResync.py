@@ -0,0 +1,160 @@
+import copy
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError
+
+from PenAndPapAR.ViewsHelper.CharacterImport import (
+    CharacterImportError,
+    changed_sections,
+    hash_character,
+    hash_character_sections,
+    prepare_character
+)
+from PenAndPapAR.ViewsHelper.CharacterUpdate import CharacterUpdateError, update_character_sheet
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import DnDBeyondCharacterService, get_client
+from PenAndPapAR.models import CharacterStats
+
+
+class HostRateLimiter:
+    """
+    Spaces out requests to the same host to at most rate per second. wait() blocks the
+    calling thread until its request may be sent, requests to other hosts do not wait.
+    """
+
+    def __init__(self, rate, clock=time.monotonic, sleep=time.sleep):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self.lock:
+            now = self.clock()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            self.sleep(slot - now)
+
+
+# source_hash and section_hashes describe the upstream sheet applied last, None if unknown
+LinkedCharacter = namedtuple("LinkedCharacter", ["upstream_id", "source_hash", "section_hashes"])
+
+
+class ResyncResult:
+    def __init__(self):
+        self.characters = 0
+        self.updated = []
+        self.unchanged = []
+        # upstream sheet has the stored content hash, nothing was read or written
+        self.skipped = []
+        self.failed = {}
+        self.fetch_latencies = []
+        self.elapsed = 0.0
+
+
+def linked_characters():
+    """character_id -> LinkedCharacter of every character with a D&D Beyond update link."""
+    links = CharacterStats.objects.exclude(character_update_link__isnull=True).exclude(
+        character_update_link="").values_list(
+        "character_id", "character_update_link", "character_source_hash", "character_section_hashes")
+    linked = {}
+    for character_id, link, source_hash, section_hashes in links:
+        upstream_id = DnDBeyondCharacterService.extract_character_id(link)
+        if upstream_id:
+            linked[character_id] = LinkedCharacter(upstream_id, source_hash, section_hashes)
+    return linked
+
+
+def resync_characters(linked, workers=8, rate=5.0, force=False):
+    """
+    Fetches the upstream payloads of the linked characters with a bounded thread pool and
+    applies them to the existing rows with update_character_sheet.
+
+    Only the upstream requests run in the pool, every upstream id is fetched once and
+    revalidated even if the payload cache holds it. The sheets are written from the calling
+    thread as the payloads arrive, so the database sees one writer.
+
+    Upstream sheets get the defaults and validation of an import first. Sheets that fail
+    it, and characters whose update fails, end up in result.failed.
+
+    A character whose stored content hash matches the upstream sheet is skipped without a
+    query. Otherwise only the sections whose hash changed are applied, so local edits to the
+    other sections are kept until they change upstream.
+
+    :param linked: character_id -> LinkedCharacter, see linked_characters().
+    :param rate: upstream requests per second and host, 0 for no limit.
+    :param force: apply the whole upstream sheet regardless of the stored hashes.
+    :return: a ResyncResult
+    """
+    result = ResyncResult()
+    result.characters = len(linked)
+    characters_by_upstream_id = {}
+    for character_id, link in linked.items():
+        characters_by_upstream_id.setdefault(link.upstream_id, []).append(character_id)
+
+    service = DnDBeyondCharacterService()
+    limiter = HostRateLimiter(rate)
+    host = urlsplit(get_client().base_url).netloc
+
+    def fetch(upstream_id):
+        limiter.wait(host)
+        start = time.perf_counter()
+        entry = service.load_character(upstream_id, max_age=0)
+        return entry, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(fetch, upstream_id): upstream_id for upstream_id in characters_by_upstream_id}
+        for future in as_completed(futures):
+            character_ids = characters_by_upstream_id[futures[future]]
+            try:
+                entry, latency = future.result()
+            except Exception as e:
+                for character_id in character_ids:
+                    result.failed[character_id] = f"Character data could not be retrieved: {e!r}"
+                continue
+            result.fetch_latencies.append(latency)
+            if entry is None:
+                for character_id in character_ids:
+                    result.failed[character_id] = "Character data could not be retrieved."
+                continue
+
+            # hashed before prepare_character() fills in defaults, like imports do
+            section_hashes = hash_character_sections(entry.parsed)
+            source_hash = hash_character(section_hashes)
+            try:
+                # the same defaults and validation as an import, e.g. a missing armor class or negative HP
+                prepared = prepare_character(copy.deepcopy(entry.parsed))
+            except CharacterImportError as e:
+                for character_id in character_ids:
+                    result.failed[character_id] = str(e)
+                continue
+
+            for character_id in character_ids:
+                link = linked[character_id]
+                if not force and link.source_hash == source_hash:
+                    result.skipped.append(character_id)
+                    continue
+                sections = prepared if force else changed_sections(prepared, section_hashes, link.section_hashes)
+                server_fields = None if link.source_hash == source_hash else {
+                    "character_source_hash": source_hash, "character_section_hashes": section_hashes}
+                # one failing character must not end the re-sync of the others
+                try:
+                    _, changes = update_character_sheet(character_id, copy.deepcopy(sections), server_fields)
+                except (CharacterUpdateError, DatabaseError, ValidationError) as e:
+                    result.failed[character_id] = str(e)
+                    continue
+                except Exception as e:
+                    result.failed[character_id] = f"Unexpected error: {e!r}"
+                    continue
+                (result.updated if changes else result.unchanged).append(character_id)
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,193 @@
+import functools
+
+from django.db.models import Prefetch
+
+from PenAndPapAR.ViewsHelper.RequestTiming import timed
+from PenAndPapAR.models import CharacterStats, Attributes, SavingThrowProficiencies, Skills
+from PenAndPapAR.serializers import (
+    CharacterStatsSerializer,
+    AttributesSerializer,
+    ACSerializer,
+    SavingThrowProficienciesSerializer,
+    SkillsSerializer,
+    HitPointsSerializer,
+    DerivedStatsSerializer,
+    ReadSerializer
+)
+
+SHEET_SECTIONS = ["stats", "attributes", "ac", "saving_throw_proficiencies", "skills", "hit_points", "derived_stats"]
+
+SECTION_SERIALIZERS = {
+    "stats": CharacterStatsSerializer,
+    "attributes": AttributesSerializer,
+    "ac": ACSerializer,
+    "saving_throw_proficiencies": SavingThrowProficienciesSerializer,
+    "skills": SkillsSerializer,
+    "hit_points": HitPointsSerializer,
+    "derived_stats": DerivedStatsSerializer,
+}
+
+# single-row section -> relation on CharacterStats, loaded in the stats query
+JOINED_SECTIONS = {"ac": "ac", "hit_points": "hit_points", "derived_stats": "derived_stats"}
+
+# trait section -> (model, character field, prefetch cache on CharacterStats)
+TRAIT_SECTIONS = {
+    "attributes": (Attributes, "attribute_character", "attributes_set"),
+    "saving_throw_proficiencies": (SavingThrowProficiencies, "saving_throw_proficiency_character",
+                                   "savingthrowproficiencies_set"),
+    "skills": (Skills, "skill_character", "skills_set"),
+}
+
+
+class SheetSelectionError(Exception):
+    pass
+
+
+@functools.cache
+def read_serializers():
+    """section -> ReadSerializer, compiled on first use."""
+    return {section: ReadSerializer(serializer_class) for section, serializer_class in SECTION_SERIALIZERS.items()}
+
+
+@functools.cache
+def section_read_serializer(section, names=None):
+    """ReadSerializer of a section limited to a tuple of field names, all fields for None."""
+    if names is None:
+        return read_serializers()[section]
+    return ReadSerializer(SECTION_SERIALIZERS[section], names)
+
+
+def split_parameter(value):
+    return [item.strip() for item in (value or "").split(",") if item.strip()]
+
+
+def parse_sheet_selection(include=None, fields=None):
+    """
+    Sections and fields of a sparse sheet from the comma separated ?include= and ?fields=
+    parameters, e.g. include=hit_points,ac or fields=hit_points.hit_points_current,character_name.
+    A bare field name selects the field in every included section that has it, or in every
+    section if include is not given. Sections without a selected field keep all fields.
+
+    Returns section -> tuple of field names or None for all fields, in sheet order, or None
+    if neither parameter is given.
+    """
+    serializers = read_serializers()
+    sections = split_parameter(include)
+    unknown = [section for section in sections if section not in serializers]
+    if unknown:
+        raise SheetSelectionError(f"Unknown sections: {', '.join(unknown)}.")
+
+    requested = {}
+    for name in split_parameter(fields):
+        section, _, field = name.rpartition(".")
+        if section:
+            owners = [section] if section in serializers and field in serializers[section].names else []
+        else:
+            owners = [section for section in sections or SHEET_SECTIONS if field in serializers[section].names]
+        if not owners:
+            raise SheetSelectionError(f"Unknown field '{name}'.")
+        for owner in owners:
+            requested.setdefault(owner, set()).add(field)
+
+    if not sections and not requested:
+        return None
+    return {section: tuple(name for name in serializers[section].names if name in requested[section])
+            if section in requested else None
+            for section in SHEET_SECTIONS if section in sections or section in requested}
+
+
+def select_sheet_fields(sheet, selection):
+    """Cuts the sections and fields of a selection out of a complete sheet."""
+    return {section: [{name: row[name] for name in names} for row in sheet[section]] if names else sheet[section]
+            for section, names in selection.items()}
+
+
+def character_sheet_queryset():
+    """
+    Queryset that loads complete character sheets with a fixed number of queries:
+    one for stats joined with AC, hit points and derived stats, and one prefetch per trait table.
+    """
+    return CharacterStats.objects.select_related("ac", "hit_points", "derived_stats").prefetch_related(
+        Prefetch("attributes_set", queryset=Attributes.objects.order_by("id")),
+        Prefetch("savingthrowproficiencies_set", queryset=SavingThrowProficiencies.objects.order_by("id")),
+        Prefetch("skills_set", queryset=Skills.objects.order_by("id")),
+    )
+
+
+def empty_character_sheet(sections=SHEET_SECTIONS):
+    return {section: [] for section in sections}
+
+
+def serialize_character_sheet(character):
+    """
+    Serializes a character loaded through character_sheet_queryset() into the
+    response structure of CharacterStatsView without issuing further queries.
+    """
+    serializers = read_serializers()
+    # missing one-to-one rows raise RelatedObjectDoesNotExist, an AttributeError subclass
+    single_rows = {"stats": character, **{section: getattr(character, relation, None)
+                                          for section, relation in JOINED_SECTIONS.items()}}
+
+    with timed("serialize"):
+        sheet = {section: serializers[section].many([vars(row)] if row else [])
+                 for section, row in single_rows.items()}
+        for section, (_, _, cache_name) in TRAIT_SECTIONS.items():
+            sheet[section] = serializers[section].many(vars(row) for row in getattr(character, cache_name).all())
+        return {section: sheet[section] for section in SHEET_SECTIONS}
+
+
+def load_character_sheet(character_id, selection=None):
+    return load_character_sheets([character_id], selection).get(character_id) or empty_character_sheet(
+        selection or SHEET_SECTIONS)
+
+
+def load_character_sheets(character_ids, selection=None):
+    """
+    Loads the sheets of several characters with the same fixed number of queries
+    as a single sheet: one for stats joined with AC, hit points and derived stats, and one per
+    trait table. Rows are read with .values(), no model instances are built.
+    A selection from parse_sheet_selection() limits the sheets to its sections and fields,
+    trait tables outside of it are not queried and unselected columns are not read.
+    Returns a dict of character_id -> sheet for found characters.
+    """
+    selection = selection or dict.fromkeys(SHEET_SECTIONS)
+    serializers = {section: section_read_serializer(section, names) for section, names in selection.items()}
+    joined_sections = {section: relation for section, relation in JOINED_SECTIONS.items() if section in selection}
+
+    # the primary key of a joined row tells whether the character has one
+    pk_columns = {section: read_serializers()[section].pk_column for section in joined_sections}
+    stats_columns = serializers["stats"].columns if "stats" in selection else []
+    joined_columns = [f"{relation}__{column}" for section, relation in joined_sections.items()
+                      for column in dict.fromkeys([pk_columns[section], *serializers[section].columns])]
+    stats_rows = CharacterStats.objects.filter(character_id__in=character_ids).values(
+        *dict.fromkeys(["character_id", *stats_columns]), *joined_columns)
+    if not stats_rows:
+        return {}
+
+    sheets = {}
+    with timed("serialize"):
+        for row in stats_rows:
+            sheet = {"stats": serializers["stats"].many([row])} if "stats" in selection else {}
+            for section, relation in joined_sections.items():
+                if row[f"{relation}__{pk_columns[section]}"] is None:
+                    sheet[section] = []
+                    continue
+                joined = {column: row[f"{relation}__{column}"] for column in serializers[section].columns}
+                sheet[section] = serializers[section].many([joined])
+            for section in TRAIT_SECTIONS.keys() & selection.keys():
+                sheet[section] = []
+            sheets[row["character_id"]] = sheet
+
+    for section, (model, character_field, _) in TRAIT_SECTIONS.items():
+        if section not in selection:
+            continue
+        serializer = serializers[section]
+        character_column = model._meta.get_field(character_field).attname
+        rows = model.objects.filter(**{f"{character_field}__in": list(sheets)}).order_by("id").values(
+            *dict.fromkeys([character_column, *serializer.columns]))
+        with timed("serialize"):
+            for row in rows:
+                sheets[row[character_column]][section].append(serializer.to_representation(row))
+
+    return {character_id: {section: sheet[section] for section in selection}
+            for character_id, sheet in sheets.items()}
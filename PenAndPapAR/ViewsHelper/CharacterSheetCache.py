@@ -0,0 +1,64 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def sheet_cache():
+    """The cache backend configured for character sheets (see CACHES in settings.py)."""
+    return caches[settings.CHARACTER_SHEET_CACHE_ALIAS]
+
+
+def sheet_cache_key(character_id):
+    return f"character-sheet:{character_id}"
+
+
+def compute_etag(sheet):
+    """Strong ETag over the canonical JSON form of a sheet, so equal sheets get equal tags."""
+    canonical = json.dumps(sheet, sort_keys=True, separators=(",", ":"), default=str)
+    return f'"{hashlib.sha256(canonical.encode("utf-8")).hexdigest()}"'
+
+
+def sheet_version(sheet):
+    """character_version of a serialized sheet, -1 for the empty sheet of an unknown character."""
+    stats = sheet.get("stats")
+    return stats[0].get("character_version", -1) if stats else -1
+
+
+def newer_entry(entry, version):
+    return entry is not None and entry[0] > version
+
+
+def get_cached_sheet(character_id):
+    """Returns (etag, sheet) of a cached sheet or None."""
+    entry = sheet_cache().get(sheet_cache_key(character_id))
+    if entry is None or entry[2] is None:
+        return None
+    return entry[1], entry[2]
+
+
+def cache_sheet(character_id, sheet):
+    """
+    Stores a serialized sheet and returns its ETag. Entries are (version, etag, sheet), a sheet
+    is not stored over an entry of a newer character_version, so a GET that read the sheet
+    before a concurrent update cannot put the old sheet back after the update invalidated it.
+    """
+    sheet = json.loads(json.dumps(sheet, default=str))  # plain dicts and lists, no serializer return types
+    etag = compute_etag(sheet)
+    version = sheet_version(sheet)
+    key = sheet_cache_key(character_id)
+    if not newer_entry(sheet_cache().get(key), version):
+        sheet_cache().set(key, (version, etag, sheet))
+    return etag
+
+
+def invalidate_character_sheets(versions):
+    """
+    Drops the cached sheets of {character_id: new character_version}. The entries are replaced
+    by markers without a sheet that keep older sheets from being cached again.
+    """
+    keys = {sheet_cache_key(character_id): version for character_id, version in versions.items()}
+    entries = sheet_cache().get_many(keys)
+    sheet_cache().set_many({key: (version, None, None) for key, version in keys.items()
+                            if not newer_entry(entries.get(key), version)})
@@ -0,0 +1,322 @@
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import transaction
+from django.db.models import F
+
+from PenAndPapAR.ViewsHelper.CharacterSheet import character_sheet_queryset
+from PenAndPapAR.ViewsHelper.CharacterSheetCache import invalidate_character_sheets
+from PenAndPapAR.ViewsHelper.Conditions import (
+    CONDITION_FIELDS,
+    ConditionError,
+    check_condition_flags,
+    condition_flags_update,
+    parse_conditions,
+    sync_condition_fields
+)
+from PenAndPapAR.ViewsHelper.DerivedFormulas import compute_derived_stats
+from PenAndPapAR.ViewsHelper.DerivedStats import (
+    refresh_derived_stats,
+    store_derived_stats,
+    touches_derived_inputs
+)
+from PenAndPapAR.ViewsHelper.SheetEvents import publish_sheet_event
+from PenAndPapAR.models import CharacterStats, AC, HitPoints, Attributes, SavingThrowProficiencies, Skills
+
+# topic -> one-to-one relation on CharacterStats, None for the stats row itself
+SINGLE_ROW_TOPICS = {
+    "stats": None,
+    "ac": "ac",
+    "hit_points": "hit_points",
+}
+
+# topic -> (prefetch cache of the trait rows, name field, fields a PUT may change)
+TRAIT_TOPICS = {
+    "attributes": ("attributes_set", "attribute_name", ["attribute_value", "attribute_adjustment"]),
+    "saving_throw_proficiencies": ("savingthrowproficiencies_set", "saving_throw_name",
+                                   ["saving_throw_adjustment", "saving_throw_is_proficient"]),
+    "skills": ("skills_set", "skill_name", ["skill_adjustment", "skill_is_proficient", "skill_is_expertise"]),
+}
+
+
+# maintained by the server, values sent by clients are ignored
+READ_ONLY_FIELDS = {"character_version", "character_source_hash", "character_section_hashes"}
+
+
+class CharacterUpdateError(Exception):
+    pass
+
+
+class CharacterNotFound(CharacterUpdateError):
+    pass
+
+
+class CharacterVersionConflict(CharacterUpdateError):
+    pass
+
+
+def apply_row_changes(instance, row, allowed_fields=None):
+    """
+    Sets the values of row on instance and returns the names of the fields whose value changed.
+    Primary key and relation fields are skipped, unknown fields raise CharacterUpdateError.
+    """
+    changed_fields = []
+    for key, value in row.items():
+        if allowed_fields is not None and key not in allowed_fields:
+            continue
+        try:
+            field = instance._meta.get_field(key)
+        except FieldDoesNotExist:
+            raise CharacterUpdateError(f"Unknown field '{key}'.")
+        if field.primary_key or field.is_relation or key in READ_ONLY_FIELDS:
+            continue
+
+        value = field.to_python(value)
+        if getattr(instance, field.attname) != value:
+            setattr(instance, field.attname, value)
+            changed_fields.append(field.attname)
+    return changed_fields
+
+
+def update_character_sheet(character_id, data, server_fields=None):
+    """
+    Applies a (partial) character sheet to the stored character inside one transaction.
+
+    The sheet is loaded once, incoming trait rows are matched by name and only changed
+    fields are written: one UPDATE per single-row table and one bulk_update per trait table.
+
+    :param server_fields: values of READ_ONLY_FIELDS to store on the stats row, they are
+                          written with the other stats changes and do not count as a change.
+
+    :return: the updated character (loaded with character_sheet_queryset()) or None if it
+             does not exist, and the applied changes: topic -> {field: new value} for
+             stats, ac, hit_points and the recomputed derived_stats,
+             topic -> {trait name: {field: new value}} for traits.
+    """
+    changes = {}
+
+    with transaction.atomic():
+        character = character_sheet_queryset().select_for_update(of=("self",)).filter(
+            character_id=character_id).first()
+        if character is None:
+            return None, changes
+
+        for topic, relation in SINGLE_ROW_TOPICS.items():
+            instance = character if relation is None else getattr(character, relation, None)
+            if instance is None or not data.get(topic):
+                continue
+
+            changed_fields = []
+            for row in data[topic]:
+                if instance is character:
+                    try:
+                        row = sync_condition_fields(row, vars(character))
+                    except ConditionError as e:
+                        raise CharacterUpdateError(str(e))
+                changed_fields.extend(apply_row_changes(instance, row))
+            if changed_fields:
+                changed_fields = list(dict.fromkeys(changed_fields))
+                changes[topic] = {field: getattr(instance, field) for field in changed_fields}
+                # the stats row is written last, together with the version increment
+                if instance is not character:
+                    type(instance).objects.filter(pk=instance.pk).update(**changes[topic])
+
+        for topic, (cache_name, name_field, allowed_fields) in TRAIT_TOPICS.items():
+            if not data.get(topic):
+                continue
+
+            rows_by_name = {getattr(row, name_field): row for row in getattr(character, cache_name).all()}
+            changed_rows = {}
+            changed_fields = set()
+            for row in data[topic]:
+                instance = rows_by_name.get(row.get(name_field))
+                if instance is None:
+                    continue
+                row_changes = apply_row_changes(instance, row, allowed_fields)
+                if row_changes:
+                    changed_rows[instance] = row_changes
+                    changed_fields.update(row_changes)
+
+            if changed_rows:
+                type(next(iter(changed_rows))).objects.bulk_update(list(changed_rows), sorted(changed_fields))
+                changes[topic] = {getattr(instance, name_field): {field: getattr(instance, field) for field in fields}
+                                  for instance, fields in changed_rows.items()}
+
+        if touches_derived_inputs(changes):
+            derived = compute_derived_stats(
+                vars(character), [vars(row) for row in character.attributes_set.all()],
+                [vars(row) for row in character.skills_set.all()],
+                [vars(row) for row in character.savingthrowproficiencies_set.all()])
+            character.derived_stats, derived_changes = store_derived_stats(
+                character_id, derived, getattr(character, "derived_stats", None))
+            if derived_changes:
+                changes["derived_stats"] = derived_changes
+
+        if changes:
+            CharacterStats.objects.filter(pk=character_id).update(
+                character_version=F("character_version") + 1, **changes.get("stats", {}), **(server_fields or {}))
+            character.character_version += 1
+            publish_sheet_event("update", character_id, character.character_version, changes)
+        elif server_fields:
+            CharacterStats.objects.filter(pk=character_id).update(**server_fields)
+
+    if changes:
+        invalidate_character_sheets({character_id: character.character_version})
+    return character, changes
+
+
+# topic -> (model, character relation) for PATCH on single-row tables
+PATCH_SINGLE_ROW_TOPICS = {
+    "stats": (CharacterStats, "character_id"),
+    "ac": (AC, "ac_character"),
+    "hit_points": (HitPoints, "hit_points_character"),
+}
+
+# topic -> (model, character relation, name field, fields a PATCH may change)
+PATCH_TRAIT_TOPICS = {
+    "attributes": (Attributes, "attribute_character", "attribute_name",
+                   ["attribute_value", "attribute_adjustment"]),
+    "saving_throw_proficiencies": (SavingThrowProficiencies, "saving_throw_proficiency_character",
+                                   "saving_throw_name", ["saving_throw_adjustment", "saving_throw_is_proficient"]),
+    "skills": (Skills, "skill_character", "skill_name",
+               ["skill_adjustment", "skill_is_proficient", "skill_is_expertise"]),
+}
+
+
+def clean_patch_fields(model, fields, allowed_fields=None):
+    """Validates and converts the values of a PATCH row with the model field definitions."""
+    if not isinstance(fields, dict) or not fields:
+        raise CharacterUpdateError("Expected an object with the fields to change.")
+
+    cleaned = {}
+    for key, value in fields.items():
+        try:
+            field = model._meta.get_field(key)
+        except FieldDoesNotExist:
+            raise CharacterUpdateError(f"Unknown field '{key}'.")
+        if field.primary_key or field.is_relation or key in READ_ONLY_FIELDS or (
+                allowed_fields is not None and key not in allowed_fields):
+            raise CharacterUpdateError(f"Field '{key}' can not be changed.")
+        try:
+            cleaned[field.attname] = field.clean(value, None)
+        except ValidationError as e:
+            raise CharacterUpdateError(f"Invalid value for '{key}': {'; '.join(e.messages)}")
+    return cleaned
+
+
+def clean_patch_conditions(single_rows, conditions=None):
+    """
+    Turns the condition changes of a PATCH into stats fields: the "conditions" topic
+    ({"add": ["Stunned"], "remove": ["Poisoned"]}, see condition_flags_update()) or a
+    character_conditions text become character_condition_flags. Only the "conditions" topic
+    rejects unknown names, a text keeps them without a bit.
+    """
+    stats = single_rows.get("stats", {})
+    if "character_condition_flags" in stats:
+        if conditions is not None:
+            raise ConditionError("Give either conditions or character_condition_flags.")
+        stats["character_condition_flags"] = check_condition_flags(stats["character_condition_flags"])
+    elif conditions is not None:
+        stats["character_condition_flags"] = condition_flags_update(conditions)
+    elif "character_conditions" in stats:
+        stats["character_condition_flags"], exhaustion = parse_conditions(stats["character_conditions"],
+                                                                          strict=False)
+        if exhaustion is not None:
+            stats.setdefault("character_exhaustion", exhaustion)
+    if stats:
+        single_rows["stats"] = stats
+
+
+def sync_stored_conditions(character_id):
+    """
+    Rebuilds the text form of the conditions of a character after its bitmask or exhaustion
+    level changed, returns the stored bitmask and, if it was rebuilt, the text.
+    """
+    current = CharacterStats.objects.values(*CONDITION_FIELDS).get(character_id=character_id)
+    synced = sync_condition_fields({"character_condition_flags": current["character_condition_flags"]}, current)
+    if "character_conditions" in synced:
+        CharacterStats.objects.filter(character_id=character_id).update(
+            character_conditions=synced["character_conditions"])
+    return synced
+
+
+def patch_character(character_id, delta, expected_version=None):
+    """
+    Applies a delta to a character without loading the sheet. Only the tables and fields
+    named in the delta are written, e.g.
+
+        {"hit_points": {"hit_points_current": 12}, "skills": {"stealth": {"skill_is_proficient": true}}}
+
+    Trait topics may also be given as lists of rows with their name field, like in a PUT.
+    Conditions are changed bit by bit with {"conditions": {"add": [...], "remove": [...]}}.
+
+    :param expected_version: if given, the patch is only applied to this version of the sheet.
+    :return: the new version and the applied values per topic.
+    :raises CharacterNotFound, CharacterVersionConflict, CharacterUpdateError:
+    """
+    unknown_topics = set(delta) - set(PATCH_SINGLE_ROW_TOPICS) - set(PATCH_TRAIT_TOPICS) - {"conditions"}
+    if unknown_topics:
+        raise CharacterUpdateError(f"Unknown topic '{sorted(unknown_topics)[0]}'.")
+
+    # validate everything before the first write
+    single_rows = {}
+    for topic, (model, _) in PATCH_SINGLE_ROW_TOPICS.items():
+        if topic in delta:
+            fields = delta[topic]
+            if isinstance(fields, list) and len(fields) == 1:
+                fields = fields[0]
+            single_rows[topic] = clean_patch_fields(model, fields)
+
+    trait_rows = {}
+    for topic, (model, _, name_field, allowed_fields) in PATCH_TRAIT_TOPICS.items():
+        if topic not in delta:
+            continue
+        rows = delta[topic]
+        if isinstance(rows, list):
+            rows = {row.get(name_field): {key: value for key, value in row.items() if key != name_field}
+                    for row in rows if isinstance(row, dict)}
+        if not isinstance(rows, dict) or not rows:
+            raise CharacterUpdateError(f"Expected the changed rows of '{topic}' by {name_field}.")
+        trait_rows[topic] = {name: clean_patch_fields(model, fields, allowed_fields)
+                             for name, fields in rows.items()}
+
+    try:
+        clean_patch_conditions(single_rows, delta.get("conditions"))
+    except ConditionError as e:
+        raise CharacterUpdateError(str(e))
+
+    if not single_rows and not trait_rows:
+        raise CharacterUpdateError("Nothing to change.")
+
+    with transaction.atomic():
+        version_filter = {} if expected_version is None else {"character_version": expected_version}
+        updated = CharacterStats.objects.filter(character_id=character_id, **version_filter).update(
+            character_version=F("character_version") + 1, **single_rows.get("stats", {}))
+        if not updated:
+            if expected_version is not None and CharacterStats.objects.filter(character_id=character_id).exists():
+                raise CharacterVersionConflict("The character has been changed in the meantime.")
+            raise CharacterNotFound(f"Character '{character_id}' does not exist.")
+
+        for topic, fields in single_rows.items():
+            model, relation = PATCH_SINGLE_ROW_TOPICS[topic]
+            if model is not CharacterStats:
+                model.objects.filter(**{relation: character_id}).update(**fields)
+
+        for topic, rows in trait_rows.items():
+            model, relation, name_field, _ = PATCH_TRAIT_TOPICS[topic]
+            for name, fields in rows.items():
+                if not model.objects.filter(**{relation: character_id, name_field: name}).update(**fields):
+                    raise CharacterUpdateError(f"Unknown {name_field} '{name}'.")
+
+        if CONDITION_FIELDS & single_rows.get("stats", {}).keys():
+            single_rows["stats"].update(sync_stored_conditions(character_id))
+
+        changed = {**single_rows, **trait_rows}
+        if touches_derived_inputs(changed):
+            derived_changes = refresh_derived_stats(character_id)
+            if derived_changes:
+                changed["derived_stats"] = derived_changes
+
+        version = CharacterStats.objects.values_list("character_version", flat=True).get(character_id=character_id)
+        publish_sheet_event("update", character_id, version, changed)
+
+    invalidate_character_sheets({character_id: version})
+    return version, changed
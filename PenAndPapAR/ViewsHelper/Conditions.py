@@ -0,0 +1,163 @@
+import re
+
+from django.db.models import F
+
+# D&D Beyond condition id -> name, the bit of a condition in character_condition_flags is 1 << (id - 1)
+CONDITION_NAMES = {
+    1: "Blinded",
+    2: "Charmed",
+    3: "Deafened",
+    4: "Frightened",
+    5: "Grappled",
+    6: "Incapacitated",
+    7: "Invisible",
+    8: "Paralyzed",
+    9: "Petrified",
+    10: "Poisoned",
+    11: "Prone",
+    12: "Restrained",
+    13: "Stunned",
+    14: "Unconscious",
+    15: "Exhaustion",
+}
+CONDITION_IDS = {name.lower(): condition_id for condition_id, name in CONDITION_NAMES.items()}
+EXHAUSTION_ID = 15
+ALL_CONDITION_FLAGS = (1 << len(CONDITION_NAMES)) - 1
+
+# stats fields that make up the conditions of a character, the text form is derived from the others
+CONDITION_FIELDS = {"character_conditions", "character_condition_flags", "character_exhaustion"}
+
+EXHAUSTION_TEXT = re.compile(r"^exhaustion\s*\(\s*level\s*(\d+)\s*\)$", re.IGNORECASE)
+# text of a character without conditions, as written by parse_character_data
+NO_CONDITIONS = "None"
+
+
+class ConditionError(Exception):
+    pass
+
+
+def condition_flag(condition_id):
+    return 1 << (condition_id - 1)
+
+
+def condition_flags(conditions):
+    """Bitmask of condition names (any case) or ids. Raises ConditionError for unknown ones."""
+    flags = 0
+    for condition in conditions:
+        condition_id = condition if isinstance(condition, int) else CONDITION_IDS.get(str(condition).strip().lower())
+        if condition_id not in CONDITION_NAMES:
+            raise ConditionError(f"Unknown condition '{condition}'.")
+        flags |= condition_flag(condition_id)
+    return flags
+
+
+def condition_names(flags):
+    return [name for condition_id, name in CONDITION_NAMES.items() if flags & condition_flag(condition_id)]
+
+
+def parse_conditions(text, strict=True):
+    """
+    Bitmask and exhaustion level (None if the text names none) of a text like
+    "Poisoned, Exhaustion (Level 2)". Empty text and "None" have no conditions.
+    Unknown names raise ConditionError, or are skipped if strict is False.
+    """
+    flags, exhaustion = 0, None
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part or part == NO_CONDITIONS:
+            continue
+        match = EXHAUSTION_TEXT.match(part)
+        if match:
+            flags |= condition_flag(EXHAUSTION_ID)
+            exhaustion = int(match.group(1))
+            continue
+        try:
+            flags |= condition_flags([part])
+        except ConditionError:
+            if strict:
+                raise
+    return flags, exhaustion
+
+
+def check_condition_flags(flags):
+    try:
+        flags = int(flags)
+    except (TypeError, ValueError):
+        raise ConditionError("character_condition_flags must be an integer.")
+    if not 0 <= flags <= ALL_CONDITION_FLAGS:
+        raise ConditionError(f"character_condition_flags must be between 0 and {ALL_CONDITION_FLAGS}.")
+    return flags
+
+
+def condition_flags_update(changes):
+    """
+    New value of character_condition_flags for {"set": [...], "add": [...], "remove": [...]}
+    with condition names or ids. Without "set" this is an expression that sets and clears
+    the bits in the UPDATE itself, so concurrent changes of other conditions are kept.
+    """
+    if not isinstance(changes, dict) or not changes or set(changes) - {"set", "add", "remove"} or not all(
+            isinstance(conditions, list) for conditions in changes.values()):
+        raise ConditionError('Expected lists of conditions to "set", "add" or "remove".')
+    add = condition_flags(changes.get("add", []))
+    remove = condition_flags(changes.get("remove", []))
+    if "set" in changes:
+        return (condition_flags(changes["set"]) | add) & ~remove
+    return F("character_condition_flags").bitor(add).bitand(ALL_CONDITION_FLAGS & ~remove)
+
+
+def format_conditions(flags, exhaustion=0):
+    """The text form of a bitmask, with the exhaustion level if the character is exhausted."""
+    names = [f"{name} (Level {exhaustion})" if name == CONDITION_NAMES[EXHAUSTION_ID] and exhaustion else name
+             for name in condition_names(flags)]
+    return ", ".join(names) if names else NO_CONDITIONS
+
+
+def describes(text, flags, exhaustion):
+    """
+    Whether a text names exactly the conditions of flags and, if exhausted, the exhaustion level.
+    Names that are no known condition do not count, the text may carry them along.
+    """
+    text_flags, text_exhaustion = parse_conditions(text, strict=False)
+    if text_flags != flags:
+        return False
+    return not flags & condition_flag(EXHAUSTION_ID) or text_exhaustion == (exhaustion or None)
+
+
+def sync_condition_fields(values, current=None):
+    """
+    Returns the stats fields in values with character_condition_flags and character_conditions
+    in agreement. A changed bitmask wins, otherwise a changed text is parsed into the bitmask
+    and the exhaustion level it names, unless another level is given as a change. Names that
+    are no known condition get no bit and stay in the text, like "Concentrating". The text is
+    kept if it describes the result and rebuilt from the bitmask and exhaustion level if not.
+
+    :param current: the stored stats fields, None for a new character.
+    :raises ConditionError: for an invalid bitmask.
+    """
+    if not CONDITION_FIELDS & values.keys():
+        return values
+    current = current or {}
+    values = dict(values)
+
+    flags = values.get("character_condition_flags")
+    if flags is not None:
+        flags = check_condition_flags(flags)
+    flags_changed = flags is not None and flags != current.get("character_condition_flags")
+
+    # a text sent back as it was read keeps the stored bitmask, it is not parsed again
+    text_changed = "character_conditions" in values and values["character_conditions"] != current.get(
+        "character_conditions")
+    if text_changed and not flags_changed:
+        flags, exhaustion = parse_conditions(values["character_conditions"], strict=False)
+        given_exhaustion = values.get("character_exhaustion")
+        if exhaustion is not None and (not given_exhaustion or given_exhaustion == current.get("character_exhaustion")):
+            values["character_exhaustion"] = exhaustion
+    if flags is None:
+        flags = current.get("character_condition_flags") or 0
+    values["character_condition_flags"] = flags
+
+    exhaustion = values.get("character_exhaustion", current.get("character_exhaustion")) or 0
+    text = values.get("character_conditions", current.get("character_conditions"))
+    if not describes(text, flags, exhaustion):
+        values["character_conditions"] = format_conditions(flags, exhaustion)
+    return values
@@ -1,6 +1,289 @@
 import requests
 import re
 import json
+import copy
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import HTTPError as UpstreamReadError
+from urllib3.util.retry import Retry
+
+# run as a script (python PenAndPapAR/ViewsHelper/DNDBeyondWebdata.py) the project root is not on the path
+if not __package__:
+    sys.path.insert(0, str(Path(__file__).resolve().parents[2]))
+
+from PenAndPapAR.ViewsHelper.Conditions import CONDITION_NAMES, EXHAUSTION_ID, condition_flag, format_conditions
+from PenAndPapAR.ViewsHelper.DerivedFormulas import skill_or_save_total
+from PenAndPapAR.ViewsHelper.RequestTiming import timed
+
+try:
+    import ijson
+except ImportError:  # optional, without it payloads are read as a whole and pruned afterwards
+    ijson = None
+
+# overridden per key by settings.DNDBEYOND_CLIENT
+DEFAULT_CLIENT_SETTINGS = {
+    "BASE_URL": "https://character-service.dndbeyond.com/character/v5/character/",
+    "CONNECT_TIMEOUT": 3.05,
+    "READ_TIMEOUT": 10,
+    "RETRIES": 2,
+    "BACKOFF_FACTOR": 0.5,
+    # upper bound in seconds of a Retry-After wait between retries
+    "MAX_RETRY_AFTER": 2.0,
+    "POOL_SIZE": 10,
+    "MAX_CONCURRENT_REQUESTS": 8,
+    "STREAMING": True,
+}
+
+# overridden per key by settings.DNDBEYOND_PAYLOAD_CACHE
+DEFAULT_PAYLOAD_CACHE_SETTINGS = {
+    "TTL": 60,
+    "MAX_ENTRIES": 256,
+}
+
+
+# keys of the upstream "data" object parse_character_data reads, everything else is dropped
+PARSED_CHARACTER_KEYS = frozenset({
+    "id", "name", "gender", "inspiration", "alignmentId", "exhaustion", "deathSaves",
+    "currentHp", "maxHp", "tempHp", "armorClass",
+    "stats", "race", "background", "classes", "conditions", "modifiers",
+})
+
+
+def prune_character_payload(payload):
+    """Keeps only the parts of an upstream document parse_character_data needs."""
+    if not isinstance(payload, dict) or not isinstance(payload.get("data"), dict):
+        return None
+    return {"data": {key: value for key, value in payload["data"].items() if key in PARSED_CHARACTER_KEYS}}
+
+
+def read_character_payload(response, streaming):
+    """
+    Reads the body of a 200 response. When streaming with ijson installed, the document is
+    parsed incrementally from the socket and only PARSED_CHARACTER_KEYS of "data" are ever
+    materialized, so large inventories, spell lists and notes are skipped instead of loaded.
+    Returns the pruned payload or None if the body is not a character document.
+    """
+    if streaming and ijson is not None:
+        response.raw.decode_content = True
+        builders = {}
+        keys_by_prefix = {}
+        try:
+            for prefix, event, value in ijson.parse(response.raw, use_float=True):
+                # events of the skipped keys are dropped right away, their values are never built
+                key = keys_by_prefix.get(prefix, False)
+                if key is False:
+                    key = prefix[5:].split(".", 1)[0] if prefix.startswith("data.") else None
+                    key = keys_by_prefix[prefix] = key if key in PARSED_CHARACTER_KEYS else None
+                if key is not None:
+                    builders.setdefault(key, ijson.ObjectBuilder()).event(event, value)
+        except ijson.JSONError:
+            return None
+        return {"data": {key: builder.value for key, builder in builders.items()}} if builders else None
+    try:
+        return prune_character_payload(response.json())
+    except ValueError:
+        return None
+
+
+class CappedRetry(Retry):
+    """
+    Retry that honors Retry-After headers only up to max_retry_after seconds. The wait is
+    not bounded by the request timeouts and holds a request slot, so upstream must not be
+    able to stretch it to hours.
+    """
+
+    def __init__(self, *args, max_retry_after=None, **kwargs):
+        self.max_retry_after = max_retry_after
+        super().__init__(*args, **kwargs)
+
+    def new(self, **kwargs):
+        # urllib3 creates a new instance per attempt from the __init__ arguments
+        retry = super().new(**kwargs)
+        retry.max_retry_after = self.max_retry_after
+        return retry
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None or self.max_retry_after is None:
+            return retry_after
+        return min(retry_after, self.max_retry_after)
+
+
+class DnDBeyondClient:
+    """
+    HTTP client for the character service. All requests share one pooled session, so
+    imports reuse open TLS connections. Every request is bounded by the connect and
+    read timeouts, failed connections and 429/5xx answers are retried with exponential
+    backoff (or after their Retry-After, at most max_retry_after seconds), and at most max_concurrent_requests requests are in flight per process.
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url, connect_timeout, read_timeout, retries, backoff_factor, pool_size,
+                 max_concurrent_requests, streaming=True, max_retry_after=2.0):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.streaming = streaming
+        self.slots = threading.BoundedSemaphore(max_concurrent_requests)
+
+        retry = CappedRetry(total=retries, backoff_factor=backoff_factor, status_forcelist=self.RETRY_STATUSES,
+                            allowed_methods={"GET"}, raise_on_status=False, max_retry_after=max_retry_after)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0',
+            'Accept': 'application/json'
+        })
+
+    def get_character(self, character_id, headers=None):
+        """
+        Requests a character and reads its body, see read_character_payload().
+
+        :return: the response and the pruned payload. The payload is None unless the upstream
+                 answered 200 with a character document, both are None if the upstream could
+                 not be reached in time.
+        """
+        with timed("upstream"):
+            # waiting for a free slot is bounded as well, a busy upstream must not queue workers forever
+            if not self.slots.acquire(timeout=sum(self.timeout)):
+                return None, None
+            try:
+                # the body is read while the slot is held, it is part of the request in flight
+                with self.session.get(f"{self.base_url}{character_id}", headers=headers, timeout=self.timeout,
+                                      stream=self.streaming) as response:
+                    payload = read_character_payload(response, self.streaming) if response.status_code == 200 else None
+                return response, payload
+            except (requests.exceptions.RequestException, UpstreamReadError):
+                # streamed bodies are read from urllib3 directly, its errors are not wrapped by requests
+                return None, None
+            finally:
+                self.slots.release()
+
+    def close(self):
+        self.session.close()
+
+
+class CachedCharacter:
+    """Pruned raw and parsed payload of one upstream character with the validators of its response."""
+
+    def __init__(self, raw, parsed, etag=None, last_modified=None, fetched_at=0.0):
+        self.raw = raw
+        self.parsed = parsed
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class CharacterPayloadCache:
+    """
+    Thread safe LRU cache of CachedCharacter entries keyed by the upstream character id.
+    Entries younger than ttl seconds are used as they are, older ones are revalidated with
+    the upstream. At most max_entries are kept, the least recently used one is evicted first.
+    """
+    COUNTERS = ("hits", "misses", "revalidated", "stale", "errors", "evictions")
+
+    def __init__(self, ttl, max_entries, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+    def get(self, character_id):
+        with self.lock:
+            entry = self.entries.get(character_id)
+            if entry is not None:
+                self.entries.move_to_end(character_id)
+            return entry
+
+    def put(self, character_id, entry):
+        if self.max_entries <= 0:
+            return
+        with self.lock:
+            self.entries[character_id] = entry
+            self.entries.move_to_end(character_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def is_fresh(self, entry, max_age=None):
+        ttl = self.ttl if max_age is None else min(self.ttl, max_age)
+        return self.clock() - entry.fetched_at < ttl
+
+    def count(self, counter):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.counters["hits"] + self.counters["revalidated"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_ratio": (self.counters["hits"] + self.counters["revalidated"]) / lookups if lookups else 0.0,
+                "entries": len(self.entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.counters = dict.fromkeys(self.COUNTERS, 0)
+
+
+_clients = {}
+_payload_caches = {}
+_shared_lock = threading.Lock()
+
+
+def django_setting(name):
+    """The value of a Django setting, or {} when the module runs without Django."""
+    try:
+        from django.conf import settings
+        return getattr(settings, name, {}) if settings.configured else {}
+    except ImportError:
+        return {}
+
+
+def client_settings():
+    """DEFAULT_CLIENT_SETTINGS updated with settings.DNDBEYOND_CLIENT when running inside Django."""
+    return {**DEFAULT_CLIENT_SETTINGS, **django_setting("DNDBEYOND_CLIENT")}
+
+
+def get_client():
+    """The shared DnDBeyondClient for the current settings, one instance per process."""
+    config = client_settings()
+    key = tuple(sorted(config.items()))
+    with _shared_lock:
+        if key not in _clients:
+            _clients[key] = DnDBeyondClient(**{name.lower(): value for name, value in config.items()})
+        return _clients[key]
+
+
+def get_payload_cache():
+    """The shared CharacterPayloadCache configured with settings.DNDBEYOND_PAYLOAD_CACHE."""
+    config = {**DEFAULT_PAYLOAD_CACHE_SETTINGS, **django_setting("DNDBEYOND_PAYLOAD_CACHE")}
+    key = (config["TTL"], config["MAX_ENTRIES"])
+    with _shared_lock:
+        if key not in _payload_caches:
+            _payload_caches[key] = CharacterPayloadCache(config["TTL"], config["MAX_ENTRIES"])
+        return _payload_caches[key]
+
 
 class DnDBeyondCharacterService:
     @staticmethod
@@ -10,37 +293,12 @@ class DnDBeyondCharacterService:
 
     @staticmethod
     def fetch_character_data(character_id):
-        api_url = f'https://character-service.dndbeyond.com/character/v5/character/{character_id}'
-        headers = {
-            'User-Agent': 'Mozilla/5.0',
-            'Accept': 'application/json'
-        }
-        response = requests.get(api_url, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return None
+        _, payload = get_client().get_character(character_id)
+        return payload
 
     @staticmethod
     def map_condition_id_to_name(condition_id):
-        condition_mapping = {
-            1: "Blinded",
-            2: "Charmed",
-            3: "Deafened",
-            4: "Frightened",
-            5: "Grappled",
-            6: "Incapacitated",
-            7: "Invisible",
-            8: "Paralyzed",
-            9: "Petrified",
-            10: "Poisoned",
-            11: "Prone",
-            12: "Restrained",
-            13: "Stunned",
-            14: "Unconscious",
-            15: "Exhaustion"
-        }
-        return condition_mapping.get(condition_id, "Unknown Condition")
+        return CONDITION_NAMES.get(condition_id, "Unknown Condition")
 
     @staticmethod
     def map_alignment_id_to_name(alignment_id):
@@ -84,8 +342,21 @@ class DnDBeyondCharacterService:
 
     @staticmethod
     def calculate_skill_or_save_value(attribute_modifier, proficiency_bonus, is_proficient, is_expertise):
-        # Set all adjustments to 0
-        return 0
+        return skill_or_save_total(attribute_modifier, proficiency_bonus, is_proficient, is_expertise)
+
+    @staticmethod
+    def normalize_sub_type(sub_type):
+        # "Sleight-of-Hand" and "sleight_of_hand" both become the skill name "sleight_of_hand"
+        return (sub_type or "").strip().lower().replace("-", "_")
+
+    @staticmethod
+    def index_modifiers(modifiers):
+        """Groups modifiers by (type, normalized subType) so traits are looked up instead of scanned."""
+        index = {}
+        for modifier in modifiers:
+            key = (modifier.get("type"), DnDBeyondCharacterService.normalize_sub_type(modifier.get("subType")))
+            index.setdefault(key, []).append(modifier)
+        return index
 
     @staticmethod
     def parse_character_data(data):
@@ -98,6 +369,7 @@ class DnDBeyondCharacterService:
         modifiers = []
         for modifier_type in ["race", "feats", "magic-items", "class", "background"]:
             modifiers.extend(character.get("modifiers", {}).get(modifier_type, []))
+        modifier_index = DnDBeyondCharacterService.index_modifiers(modifiers)
 
         # Calculate character level
         level = sum(cls.get("level", 0) for cls in character.get("classes", []))
@@ -123,27 +395,22 @@ class DnDBeyondCharacterService:
         alignment = DnDBeyondCharacterService.map_alignment_id_to_name(alignment_id)
 
         # Process conditions
-        conditions = []
+        condition_flags = 0
+        exhaustion_level = None
         for cond in character.get("conditions", []):
-            if isinstance(cond, dict):
-                condition_id = cond.get("id")
-                condition_name = DnDBeyondCharacterService.map_condition_id_to_name(condition_id)
-                if condition_id == 15:  # Exhaustion
-                    exhaustion_level = cond.get("level", 0)  # Extract exhaustion level
-                    conditions.append(f"{condition_name} (Level {exhaustion_level})")
-                else:
-                    conditions.append(condition_name)
-            elif isinstance(cond, int):
-                condition_name = DnDBeyondCharacterService.map_condition_id_to_name(cond)
-                conditions.append(condition_name)
-        
-        conditions_str = ", ".join(conditions) if conditions else "None"
+            condition_id = cond.get("id") if isinstance(cond, dict) else cond
+            if condition_id not in CONDITION_NAMES:
+                continue
+            condition_flags |= condition_flag(condition_id)
+            if condition_id == EXHAUSTION_ID and isinstance(cond, dict):
+                exhaustion_level = cond.get("level", 0)  # Extract exhaustion level
 
         update_link = f"https://www.dndbeyond.com/characters/{character.get('id', '')}"
         gender = character.get("gender", "Unknown")
         death_save_success = character.get("deathSaves", {}).get("successes", 0)
         death_save_failure = character.get("deathSaves", {}).get("failures", 0)
-        exhaustion = character.get("exhaustion", 0)  # Extract exhaustion level
+        exhaustion = character.get("exhaustion", 0) if exhaustion_level is None else exhaustion_level
+        conditions_str = format_conditions(condition_flags, exhaustion)
         initiative_adjustment = 0  # Set to 0
         proficiency_bonus_adjustment = 0  # Set to 0
 
@@ -159,9 +426,13 @@ class DnDBeyondCharacterService:
             5: "wisdom",
             6: "charisma"
         }
+        stats_by_id = {}
+        for stat in character.get("stats", []):
+            stats_by_id.setdefault(stat.get("id"), stat)
+            stats_by_id.setdefault(stat.get("statId"), stat)
         attributes = []
         for stat_id, stat_name in stat_names.items():
-            stat = next((s for s in character.get("stats", []) if s.get("id") == stat_id or s.get("statId") == stat_id), None)
+            stat = stats_by_id.get(stat_id)
             base_value = stat.get("value", 10) if stat else 10
             total_value = DnDBeyondCharacterService.calculate_attribute_value(base_value, modifiers, stat_id, stat_name)
             attributes.append({
@@ -191,24 +462,17 @@ class DnDBeyondCharacterService:
             "stealth": "dexterity",
             "survival": "wisdom"
         }
+        attribute_adjustments = {attr["attribute_name"]: attr["attribute_adjustment"] for attr in attributes}
         skills = []
         for skill_name, ability in skill_names.items():
             # Find the attribute modifier for the skill
-            attribute_modifier = next((attr["attribute_adjustment"] for attr in attributes if attr["attribute_name"] == ability), 0)
+            attribute_modifier = attribute_adjustments.get(ability, 0)
             
             # Check if the character is proficient in the skill
-            is_proficient = any(
-                modifier.get("type") == "proficiency" and
-                skill_name in modifier.get("subType", "").lower()  # Check if skill_name is in subType
-                for modifier in modifiers
-            )
+            is_proficient = ("proficiency", skill_name) in modifier_index
             
             # Check if the character has expertise in the skill
-            is_expertise = any(
-                modifier.get("type") == "expertise" and
-                skill_name in modifier.get("subType", "").lower()  # Check if skill_name is in subType
-                for modifier in modifiers
-            )
+            is_expertise = ("expertise", skill_name) in modifier_index
             
             # Calculate the skill value
             skill_value = DnDBeyondCharacterService.calculate_skill_or_save_value(
@@ -234,16 +498,12 @@ class DnDBeyondCharacterService:
         saving_throws = []
         for stat_id, stat_name in saving_throw_names.items():
             # Find the attribute modifier for the saving throw
-            attribute_modifier = next((attr["attribute_adjustment"] for attr in attributes if attr["attribute_name"] == stat_name), 0)
+            attribute_modifier = attribute_adjustments.get(stat_name, 0)
             
             # Check if the character is proficient in the saving throw
-            is_proficient = any(
-                modifier.get("type") == "proficiency" and
-                (
-                    f"{stat_name}-saving-throws" in modifier.get("subType", "").lower() or  # Check for stat name
-                    f"{stat_id}-saving-throws" in modifier.get("subType", "").lower()      # Check for stat ID
-                )
-                for modifier in modifiers
+            is_proficient = (
+                ("proficiency", f"{stat_name}_saving_throws") in modifier_index or  # Check for stat name
+                ("proficiency", f"{stat_id}_saving_throws") in modifier_index      # Check for stat ID
             )
             
             # Calculate the saving throw value
@@ -283,6 +543,7 @@ class DnDBeyondCharacterService:
                 "character_level": level,
                 "character_alignment": alignment,
                 "character_conditions": conditions_str,
+                "character_condition_flags": condition_flags,
                 "character_update_link": update_link,
                 "character_proficiency_bonus": proficiency_bonus,
                 "character_speed": speed,
@@ -305,11 +566,51 @@ class DnDBeyondCharacterService:
         if not character_id:
             return {"error": "Invalid URL or character ID not found."}
         
-        char_data = self.fetch_character_data(character_id)
-        if not char_data:
+        entry = self.load_character(character_id)
+        if entry is None:
             return {"error": "Character data could not be retrieved."}
-        
-        return self.parse_character_data(char_data)
+
+        # callers normalize the payload in place, the cached one has to stay untouched
+        return copy.deepcopy(entry.parsed)
+
+    def load_character(self, character_id, max_age=None):
+        """
+        Returns the CachedCharacter for an upstream id, fetched through the payload cache:
+        fresh entries are used without a request, stale ones are revalidated with
+        If-None-Match/If-Modified-Since and kept on 304. If the upstream fails, a stale
+        entry is still better than nothing. Returns None if nothing could be loaded.
+
+        :param max_age: seconds after which an entry is revalidated if shorter than the cache TTL,
+                        0 always asks the upstream.
+        """
+        cache = get_payload_cache()
+        entry = cache.get(character_id)
+        if entry is not None and cache.is_fresh(entry, max_age):
+            cache.count("hits")
+            return entry
+
+        response, raw = get_client().get_character(character_id, entry.conditional_headers() if entry else None)
+        if entry is not None and response is not None and response.status_code == 304:
+            cache.count("revalidated")
+            entry.fetched_at = cache.clock()
+            return entry
+
+        if not raw:
+            cache.count("errors")
+            if entry is not None:
+                cache.count("stale")
+            return entry
+
+        parsed = self.parse_character_data(raw)
+        if "error" in parsed:
+            cache.count("errors")
+            return None
+
+        cache.count("misses")
+        entry = CachedCharacter(raw, parsed, response.headers.get("ETag"), response.headers.get("Last-Modified"),
+                                cache.clock())
+        cache.put(character_id, entry)
+        return entry
 
 
 class DjangoDBService:
@@ -335,7 +636,7 @@ class DjangoDBService:
             return {"error": f"Fehler beim Senden der Daten an die Django-Datenbank: {e}"}
 
 
-# Main program
+# Main program, run with python -m PenAndPapAR.ViewsHelper.DNDBeyondWebdata or as a script, no Django settings needed
 if __name__ == "__main__":
     # Instanz der DnDBeyondCharacterService-Klasse erstellen
     service = DnDBeyondCharacterService()
@@ -0,0 +1,68 @@
+# the rules behind DerivedStats, without models so DNDBeyondWebdata runs without Django settings
+
+# skill -> ability it is rolled with
+SKILL_ABILITIES = {
+    "acrobatics": "dexterity",
+    "animal_handling": "wisdom",
+    "arcana": "intelligence",
+    "athletics": "strength",
+    "deception": "charisma",
+    "history": "intelligence",
+    "insight": "wisdom",
+    "intimidation": "charisma",
+    "investigation": "intelligence",
+    "medicine": "wisdom",
+    "nature": "intelligence",
+    "perception": "wisdom",
+    "performance": "charisma",
+    "persuasion": "charisma",
+    "religion": "intelligence",
+    "sleight_of_hand": "dexterity",
+    "stealth": "dexterity",
+    "survival": "wisdom",
+}
+
+def ability_modifier(score):
+    return (score - 10) // 2
+
+
+def skill_or_save_total(attribute_modifier, proficiency_bonus, is_proficient, is_expertise, adjustment=0):
+    """Modifier plus adjustment, plus the proficiency bonus if proficient, twice with expertise."""
+    if is_expertise:
+        proficiency = 2 * proficiency_bonus
+    elif is_proficient:
+        proficiency = proficiency_bonus
+    else:
+        proficiency = 0
+    return attribute_modifier + proficiency + (adjustment or 0)
+
+
+def compute_derived_stats(stats, attributes, skills, saving_throws):
+    """
+    Computes the DerivedStats fields of one character from its rows, given as mappings by
+    attname (rows of a sheet, .values() rows or the __dict__ of model instances).
+    Abilities without a row count as a score of 10.
+    """
+    proficiency_bonus = (stats.get("character_proficiency_bonus") or 0) + (
+        stats.get("character_proficiency_bonus_adjustment") or 0)
+    modifiers = {row["attribute_name"]: ability_modifier(
+        (row.get("attribute_value") or 0) + (row.get("attribute_adjustment") or 0)) for row in attributes}
+
+    skill_totals = {row["skill_name"]: skill_or_save_total(
+        modifiers.get(SKILL_ABILITIES.get(row["skill_name"]), 0), proficiency_bonus,
+        row.get("skill_is_proficient"), row.get("skill_is_expertise"), row.get("skill_adjustment"))
+        for row in skills}
+    saving_throw_totals = {row["saving_throw_name"]: skill_or_save_total(
+        modifiers.get(row["saving_throw_name"], 0), proficiency_bonus,
+        row.get("saving_throw_is_proficient"), False, row.get("saving_throw_adjustment"))
+        for row in saving_throws}
+
+    perception = skill_totals.get("perception", modifiers.get("wisdom", 0))
+    return {
+        "derived_proficiency_bonus": proficiency_bonus,
+        "derived_initiative": modifiers.get("dexterity", 0) + (stats.get("character_initiative_adjustment") or 0),
+        "derived_passive_perception": 10 + perception,
+        "derived_ability_modifiers": modifiers,
+        "derived_skill_totals": skill_totals,
+        "derived_saving_throw_totals": saving_throw_totals,
+    }
@@ -0,0 +1,47 @@
+from PenAndPapAR.ViewsHelper.DerivedFormulas import compute_derived_stats
+from PenAndPapAR.models import Attributes, CharacterStats, DerivedStats, SavingThrowProficiencies, Skills
+
+# stats fields the derived values depend on
+STATS_INPUT_FIELDS = {"character_proficiency_bonus", "character_proficiency_bonus_adjustment",
+                      "character_initiative_adjustment"}
+
+# sheet topics whose rows are inputs of the derived values
+TRAIT_INPUT_TOPICS = {"attributes", "saving_throw_proficiencies", "skills"}
+
+
+def touches_derived_inputs(changes):
+    """Whether applied changes (topic -> fields or trait rows) include an input of the derived values."""
+    return bool(TRAIT_INPUT_TOPICS & set(changes) or STATS_INPUT_FIELDS & set(changes.get("stats", {})))
+
+
+def store_derived_stats(character_id, derived, current=None):
+    """
+    Writes the fields of derived that differ from current, the DerivedStats row of the
+    character or None if it has none yet. Returns the row and the changed fields.
+    """
+    if current is None:
+        current, _ = DerivedStats.objects.update_or_create(derived_character_id=character_id, defaults=derived)
+        return current, derived
+    changed = {field: value for field, value in derived.items() if getattr(current, field) != value}
+    if changed:
+        DerivedStats.objects.filter(pk=character_id).update(**changed)
+        for field, value in changed.items():
+            setattr(current, field, value)
+    return current, changed
+
+
+def refresh_derived_stats(character_id):
+    """Recomputes the derived values of a character from the database, returns the changed fields."""
+    stats = CharacterStats.objects.filter(pk=character_id).values(*STATS_INPUT_FIELDS).first()
+    if stats is None:
+        return {}
+    derived = compute_derived_stats(
+        stats,
+        Attributes.objects.filter(attribute_character=character_id).values(
+            "attribute_name", "attribute_value", "attribute_adjustment"),
+        Skills.objects.filter(skill_character=character_id).values(
+            "skill_name", "skill_adjustment", "skill_is_proficient", "skill_is_expertise"),
+        SavingThrowProficiencies.objects.filter(saving_throw_proficiency_character=character_id).values(
+            "saving_throw_name", "saving_throw_adjustment", "saving_throw_is_proficient"),
+    )
+    return store_derived_stats(character_id, derived, DerivedStats.objects.filter(pk=character_id).first())[1]
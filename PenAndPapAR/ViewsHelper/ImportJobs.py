@@ -0,0 +1,182 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from PenAndPapAR.ViewsHelper.CharacterImport import (
+    CharacterImportError,
+    changed_sections,
+    hash_character,
+    hash_character_sections,
+    prepare_character,
+    write_characters
+)
+from PenAndPapAR.ViewsHelper.CharacterUpdate import CharacterUpdateError, update_character_sheet
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import DnDBeyondCharacterService
+from PenAndPapAR.models import CharacterStats, ImportJob
+
+logger = logging.getLogger(__name__)
+
+# overridden per key by settings.IMPORT_JOBS
+DEFAULT_IMPORT_JOB_SETTINGS = {
+    "WORKERS": 4,
+    "MAX_PENDING": 100,
+    "EAGER": False,
+}
+
+
+class ImportQueueFull(Exception):
+    pass
+
+
+class ImportJobRunner:
+    """
+    Runs import jobs on a bounded pool of worker threads. At most max_pending jobs are
+    queued or running per process, further submissions are refused instead of piling up.
+    """
+
+    def __init__(self, workers, max_pending):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import-job")
+        self.pending = threading.BoundedSemaphore(max_pending)
+        self.submitted = 0
+        self.idle = threading.Condition()
+
+    def reserve(self):
+        """Takes a pending slot for a job that is about to be submitted."""
+        if not self.pending.acquire(blocking=False):
+            raise ImportQueueFull("Too many imports are pending, try again later.")
+
+    def release(self):
+        self.pending.release()
+
+    def submit(self, job_id):
+        """Runs a job with a slot taken by reserve(), the slot is released when the job is done."""
+        with self.idle:
+            self.submitted += 1
+        self.executor.submit(self.run, job_id)
+
+    def wait_idle(self, timeout=None):
+        """Blocks until every submitted job has finished, returns False on timeout."""
+        with self.idle:
+            return self.idle.wait_for(lambda: self.submitted == 0, timeout)
+
+    def run(self, job_id):
+        # like a request, the worker thread drops connections that are broken or past CONN_MAX_AGE
+        close_old_connections()
+        try:
+            run_import_job(job_id)
+        except Exception:
+            # e.g. the database could not record the outcome, the executor would swallow it otherwise
+            logger.exception("Import job %s failed.", job_id)
+        finally:
+            self.release()
+            close_old_connections()
+            with self.idle:
+                self.submitted -= 1
+                self.idle.notify_all()
+
+
+_runners = {}
+_runners_lock = threading.Lock()
+
+
+def import_job_settings():
+    return {**DEFAULT_IMPORT_JOB_SETTINGS, **getattr(settings, "IMPORT_JOBS", {})}
+
+
+def get_runner():
+    """The shared ImportJobRunner for the current settings, one instance per process."""
+    config = import_job_settings()
+    key = (config["WORKERS"], config["MAX_PENDING"])
+    with _runners_lock:
+        if key not in _runners:
+            _runners[key] = ImportJobRunner(config["WORKERS"], config["MAX_PENDING"])
+        return _runners[key]
+
+
+def submit_import_job(source_link):
+    """
+    Creates an import job for a D&D Beyond link and hands it to the worker pool once the job
+    row is committed. With IMPORT_JOBS["EAGER"] the job runs right away in the calling thread.
+
+    :raises ImportQueueFull: if the pool has too many pending jobs, the job is not created then.
+    """
+    if import_job_settings()["EAGER"]:
+        job = ImportJob.objects.create(job_source_link=source_link)
+        run_import_job(job.job_id)
+        job.refresh_from_db()
+        return job
+
+    runner = get_runner()
+    runner.reserve()
+    try:
+        job = ImportJob.objects.create(job_source_link=source_link)
+    except Exception:
+        runner.release()
+        raise
+    # the worker must not look for the job before its row is visible to other connections
+    transaction.on_commit(lambda: runner.submit(job.job_id))
+    return job
+
+
+def set_job_status(job_id, status, **fields):
+    ImportJob.objects.filter(job_id=job_id).update(job_status=status, **fields)
+
+
+def imported_character(update_link, source_hash):
+    """
+    (character_id, source_hash, section_hashes) of the character an earlier import of the same
+    D&D Beyond character wrote, preferably one with the given source_hash. None if there is none.
+    """
+    if not update_link:
+        return None
+    # the lowest id with the same hash, otherwise the lowest id
+    candidates = CharacterStats.objects.filter(character_update_link=update_link).exclude(
+        character_source_hash=None).order_by("character_id").values_list(
+        "character_id", "character_source_hash", "character_section_hashes")
+    return candidates.filter(character_source_hash=source_hash).first() or candidates.first()
+
+
+def write_imported_character(prepared_character, section_hashes):
+    """
+    Writes an imported character and returns its id. A character imported from the same link
+    before is reused: as it is if the upstream sheet did not change, otherwise with only the
+    changed sections applied, like a re-sync.
+    """
+    source_hash = hash_character(section_hashes)
+    existing = imported_character(prepared_character["stats"][0].get("character_update_link"), source_hash)
+    if existing is None:
+        return write_characters([prepared_character], [section_hashes])[0]
+
+    character_id, stored_hash, stored_section_hashes = existing
+    if stored_hash != source_hash:
+        update_character_sheet(
+            character_id, changed_sections(prepared_character, section_hashes, stored_section_hashes),
+            {"character_source_hash": source_hash, "character_section_hashes": section_hashes})
+    return character_id
+
+
+def run_import_job(job_id):
+    """Fetches, validates and writes the character of a job and records the outcome on the job."""
+    set_job_status(job_id, ImportJob.FETCHING, job_started_at=timezone.now())
+    try:
+        source_link = ImportJob.objects.values_list("job_source_link", flat=True).get(job_id=job_id)
+        character_info = DnDBeyondCharacterService().get_character_info(source_link)
+        if "error" in character_info:
+            raise CharacterImportError(character_info["error"])
+
+        # hashed before prepare_character() fills in defaults, re-syncs hash the parser output as well
+        section_hashes = hash_character_sections(character_info)
+        prepared_character = prepare_character(character_info)
+        set_job_status(job_id, ImportJob.WRITING)
+        character_id = write_imported_character(prepared_character, section_hashes)
+    except (CharacterImportError, CharacterUpdateError) as e:
+        set_job_status(job_id, ImportJob.FAILED, job_error=str(e), job_finished_at=timezone.now())
+    except Exception as e:
+        # a job must never stay "fetching" because of an unexpected error
+        set_job_status(job_id, ImportJob.FAILED, job_error=f"An error occurred: {e}", job_finished_at=timezone.now())
+    else:
+        set_job_status(job_id, ImportJob.SUCCEEDED, job_character_id=character_id, job_finished_at=timezone.now())
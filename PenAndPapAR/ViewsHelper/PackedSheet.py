@@ -0,0 +1,44 @@
+from PenAndPapAR.ViewsHelper.CharacterImport import ATTRIBUTE_NAMES, SAVING_THROW_NAMES, SKILL_NAMES
+
+PACKED_FORMAT = "packed-v1"
+
+# topic -> (name field, fixed row order, fields of a packed row in order)
+PACKED_TRAIT_TOPICS = {
+    "attributes": ("attribute_name", ATTRIBUTE_NAMES, ["attribute_value", "attribute_adjustment"]),
+    "saving_throw_proficiencies": ("saving_throw_name", SAVING_THROW_NAMES,
+                                   ["saving_throw_adjustment", "saving_throw_is_proficient"]),
+    "skills": ("skill_name", SKILL_NAMES, ["skill_adjustment", "skill_is_proficient", "skill_is_expertise"]),
+}
+
+
+def pack_character_sheet(sheet):
+    """
+    Returns the packed representation of a serialized sheet: attributes, saving throws and
+    skills become one array of field values per trait in the fixed order of PACKED_TRAIT_TOPICS,
+    e.g. "attributes": [[8, -1], [14, 2], ...] starting with strength. Traits missing on the
+    character are null, row ids and the character relation are left out.
+    Stats, ac and hit points stay as they are, topics missing in a sparse sheet stay missing.
+    """
+    packed = dict(sheet)
+    for topic, (name_field, names, fields) in PACKED_TRAIT_TOPICS.items():
+        if topic not in sheet:
+            continue
+        rows_by_name = {row[name_field]: row for row in sheet[topic]}
+        if not rows_by_name:
+            packed[topic] = []
+            continue
+        packed[topic] = [[rows_by_name[name][field] for field in fields] if name in rows_by_name else None
+                         for name in names]
+    packed["packed"] = PACKED_FORMAT
+    return packed
+
+
+def unpack_character_sheet(packed):
+    """Turns the trait arrays of a packed sheet back into rows with their name field."""
+    sheet = {key: value for key, value in packed.items() if key != "packed"}
+    for topic, (name_field, names, fields) in PACKED_TRAIT_TOPICS.items():
+        if topic not in packed:
+            continue
+        sheet[topic] = [{name_field: name, **dict(zip(fields, values))}
+                        for name, values in zip(names, packed[topic]) if values is not None]
+    return sheet
@@ -0,0 +1,180 @@
+try:
+    import numpy as np
+except ImportError:  # optional, the party endpoint answers 503 without it
+    np = None
+
+from PenAndPapAR.ViewsHelper.CharacterImport import ATTRIBUTE_NAMES, SAVING_THROW_NAMES, SKILL_NAMES
+from PenAndPapAR.ViewsHelper.DerivedFormulas import SKILL_ABILITIES
+from PenAndPapAR.models import Attributes, CharacterStats, SavingThrowProficiencies, Skills
+
+ATTRIBUTE_INDEX = {name: index for index, name in enumerate(ATTRIBUTE_NAMES)}
+SKILL_INDEX = {name: index for index, name in enumerate(SKILL_NAMES)}
+SAVING_THROW_INDEX = {name: index for index, name in enumerate(SAVING_THROW_NAMES)}
+
+MAX_TRIALS = 100_000
+# rolls simulated at once, larger simulations run in chunks of trials
+MAX_ROLLS_PER_CHUNK = 2_000_000
+
+
+class PartyStatsError(Exception):
+    pass
+
+
+class PartyArrays:
+    """
+    Inputs of the derived values of several characters, one row per character in the order
+    of character_ids. Abilities without a row have a score of 10, skills and saving throws
+    without a row have no proficiency and no adjustment.
+    """
+
+    def __init__(self, character_ids):
+        count = len(character_ids)
+        self.character_ids = character_ids
+        self.proficiency_bonus = np.zeros(count, dtype=np.int16)
+        self.initiative_adjustment = np.zeros(count, dtype=np.int16)
+        self.scores = np.full((count, len(ATTRIBUTE_NAMES)), 10, dtype=np.int16)
+        self.skill_adjustment = np.zeros((count, len(SKILL_NAMES)), dtype=np.int16)
+        self.skill_is_proficient = np.zeros((count, len(SKILL_NAMES)), dtype=bool)
+        self.skill_is_expertise = np.zeros((count, len(SKILL_NAMES)), dtype=bool)
+        self.saving_throw_adjustment = np.zeros((count, len(SAVING_THROW_NAMES)), dtype=np.int16)
+        self.saving_throw_is_proficient = np.zeros((count, len(SAVING_THROW_NAMES)), dtype=bool)
+
+
+def load_party_arrays(character_ids):
+    """
+    Reads the inputs of the given characters with one .values() query per table into a
+    PartyArrays. Unknown ids are left out, the order of the others is kept.
+    """
+    stats = {row["character_id"]: row for row in CharacterStats.objects.filter(
+        character_id__in=character_ids).values("character_id", "character_proficiency_bonus",
+                                               "character_proficiency_bonus_adjustment",
+                                               "character_initiative_adjustment")}
+    found = [character_id for character_id in character_ids if character_id in stats]
+    rows_by_id = {character_id: index for index, character_id in enumerate(found)}
+    party = PartyArrays(found)
+
+    for character_id, index in rows_by_id.items():
+        row = stats[character_id]
+        party.proficiency_bonus[index] = (row["character_proficiency_bonus"] or 0) + (
+            row["character_proficiency_bonus_adjustment"] or 0)
+        party.initiative_adjustment[index] = row["character_initiative_adjustment"] or 0
+
+    def fill(queryset, character_field, name_field, columns, names):
+        """Copies the named fields of all rows into the arrays with one fancy assignment per field."""
+        rows = list(queryset.filter(**{f"{character_field}__in": found}).values_list(
+            f"{character_field}_id", name_field, *columns))
+        rows = [row for row in rows if row[1] in names]
+        if not rows:
+            return
+        character_column, name_column, *value_columns = zip(*rows)
+        index = ([rows_by_id[character_id] for character_id in character_column],
+                 [names[name] for name in name_column])
+        for target, values in zip(columns.values(), value_columns):
+            target[index] = [value or 0 for value in values]
+
+    # attribute rows hold value and adjustment, the score is their sum
+    attribute_adjustments = np.zeros_like(party.scores)
+    fill(Attributes.objects, "attribute_character", "attribute_name",
+         {"attribute_value": party.scores, "attribute_adjustment": attribute_adjustments}, ATTRIBUTE_INDEX)
+    party.scores += attribute_adjustments
+    fill(Skills.objects, "skill_character", "skill_name",
+         {"skill_adjustment": party.skill_adjustment, "skill_is_proficient": party.skill_is_proficient,
+          "skill_is_expertise": party.skill_is_expertise}, SKILL_INDEX)
+    fill(SavingThrowProficiencies.objects, "saving_throw_proficiency_character", "saving_throw_name",
+         {"saving_throw_adjustment": party.saving_throw_adjustment,
+          "saving_throw_is_proficient": party.saving_throw_is_proficient}, SAVING_THROW_INDEX)
+    return party
+
+
+def compute_party_bonuses(party):
+    """
+    Derived values of all characters at once, with the same rules as compute_derived_stats:
+    arrays of shape (characters,) or (characters, names) keyed like the DerivedStats fields.
+    """
+    modifiers = (party.scores - 10) // 2
+    skill_ability = np.array([ATTRIBUTE_INDEX[SKILL_ABILITIES[name]] for name in SKILL_NAMES])
+    proficiency = party.proficiency_bonus[:, None]
+    skill_multiplier = np.where(party.skill_is_expertise, 2, party.skill_is_proficient.astype(np.int16))
+
+    skill_totals = modifiers[:, skill_ability] + party.skill_adjustment + proficiency * skill_multiplier
+    saving_throw_totals = (modifiers[:, [ATTRIBUTE_INDEX[name] for name in SAVING_THROW_NAMES]]
+                           + party.saving_throw_adjustment + proficiency * party.saving_throw_is_proficient)
+    return {
+        "derived_proficiency_bonus": party.proficiency_bonus,
+        "derived_initiative": modifiers[:, ATTRIBUTE_INDEX["dexterity"]] + party.initiative_adjustment,
+        "derived_passive_perception": 10 + skill_totals[:, SKILL_INDEX["perception"]],
+        "derived_ability_modifiers": modifiers,
+        "derived_skill_totals": skill_totals,
+        "derived_saving_throw_totals": saving_throw_totals,
+    }
+
+
+def party_bonus_rows(party, bonuses):
+    """The arrays of compute_party_bonuses() as one dict per character, named like DerivedStats."""
+    columns = {
+        "derived_ability_modifiers": ATTRIBUTE_NAMES,
+        "derived_skill_totals": SKILL_NAMES,
+        "derived_saving_throw_totals": SAVING_THROW_NAMES,
+    }
+    values = {field: array.tolist() for field, array in bonuses.items()}
+    rows = []
+    for index, character_id in enumerate(party.character_ids):
+        row = {"character_id": character_id}
+        for field, column_values in values.items():
+            row[field] = (dict(zip(columns[field], column_values[index])) if field in columns
+                          else column_values[index])
+        rows.append(row)
+    return rows
+
+
+def check_bonuses(bonuses, check):
+    """
+    The bonus of every character for a check: a skill name, an ability name for a plain
+    ability check or "<ability>_save" for a saving throw.
+    """
+    if check in SKILL_INDEX:
+        return bonuses["derived_skill_totals"][:, SKILL_INDEX[check]]
+    if check in ATTRIBUTE_INDEX:
+        return bonuses["derived_ability_modifiers"][:, ATTRIBUTE_INDEX[check]]
+    if check.endswith("_save") and check[:-len("_save")] in SAVING_THROW_INDEX:
+        return bonuses["derived_saving_throw_totals"][:, SAVING_THROW_INDEX[check[:-len("_save")]]]
+    raise PartyStatsError(f"Unknown check '{check}'.")
+
+
+def simulate_group_check(bonuses, dc, trials=10_000, advantage=False, disadvantage=False, seed=None):
+    """
+    Monte Carlo estimate of a group check: every character rolls a d20 plus their bonus (one
+    entry of bonuses per character, see check_bonuses()) against
+    dc, the group succeeds if at least half of them succeed. Returns the success probability of
+    every character and of the group, and the probabilities that all or any of them succeed.
+    """
+    count = len(bonuses)
+    if not count:
+        raise PartyStatsError("No characters to roll for.")
+    if not 1 <= trials <= MAX_TRIALS:
+        raise PartyStatsError(f"trials must be between 1 and {MAX_TRIALS}.")
+
+    rng = np.random.default_rng(seed)
+    needed = (count + 1) // 2
+    successes = np.zeros(count, dtype=np.int64)
+    group = every = some = 0
+    chunk = max(1, MAX_ROLLS_PER_CHUNK // (count * (2 if advantage or disadvantage else 1)))
+    for start in range(0, trials, chunk):
+        size = min(chunk, trials - start)
+        rolls = rng.integers(1, 21, size=(size, count), dtype=np.int16)
+        if advantage != disadvantage:
+            second = rng.integers(1, 21, size=(size, count), dtype=np.int16)
+            rolls = np.maximum(rolls, second) if advantage else np.minimum(rolls, second)
+        passed = rolls + bonuses >= dc
+        passed_per_trial = passed.sum(axis=1)
+        successes += passed.sum(axis=0)
+        group += int((passed_per_trial >= needed).sum())
+        every += int((passed_per_trial == count).sum())
+        some += int((passed_per_trial > 0).sum())
+
+    return {
+        "character_probabilities": successes / trials,
+        "group_probability": group / trials,
+        "all_probability": every / trials,
+        "any_probability": some / trials,
+    }
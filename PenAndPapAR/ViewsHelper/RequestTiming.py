@@ -0,0 +1,81 @@
+import contextlib
+import contextvars
+import time
+
+from django.conf import settings
+
+# overridden per key by settings.REQUEST_TIMING
+DEFAULT_REQUEST_TIMING_SETTINGS = {
+    "ENABLED": True,
+    "SERVER_TIMING_HEADER": True,
+    # requests taking at least this many milliseconds log their SQL, None never does
+    "QUERY_LOG_THRESHOLD_MS": None,
+}
+
+
+class RequestMetrics:
+    """Durations in seconds and counts of one request, filled by timed() and the DB wrapper."""
+
+    def __init__(self, record_queries=False):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.counts = {}
+        self.record_queries = record_queries
+        self.queries = []
+
+    def add(self, name, seconds, count=1):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def duration_ms(self, name):
+        return self.durations.get(name, 0.0) * 1000
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """connection.execute_wrapper() hook adding the time of every statement to "db"."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            self.add("db", seconds)
+            if self.record_queries:
+                self.queries.append({"sql": sql, "ms": round(seconds * 1000, 3)})
+
+
+_current_metrics = contextvars.ContextVar("request_metrics", default=None)
+
+
+def request_timing_settings():
+    return {**DEFAULT_REQUEST_TIMING_SETTINGS, **getattr(settings, "REQUEST_TIMING", {})}
+
+
+def current_metrics():
+    """The RequestMetrics of the request handled by this thread, None outside of requests."""
+    return _current_metrics.get()
+
+
+@contextlib.contextmanager
+def measure_request(record_queries=False):
+    metrics = RequestMetrics(record_queries)
+    token = _current_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Adds the time spent in the block to metric name of the current request, if there is one."""
+    metrics = _current_metrics.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULT_BROKER = "PenAndPapAR.ViewsHelper.SheetEvents.InProcessBroker"
+
+
+class SheetEventBroker(ABC):
+    """
+    Interface between the write paths that publish sheet changes and the event stream
+    that pushes them to subscribed clients.
+
+    Events are dicts like {"type": "update", "character_id": "#0001", "version": 5, "changes": {...}}.
+    """
+
+    @abstractmethod
+    def publish(self, event):
+        """Delivers event to every subscription of event["character_id"]. Called from sync code."""
+
+    @abstractmethod
+    def subscribe(self, character_ids):
+        """Returns a Subscription for the given character ids. Called from the event loop of the stream."""
+
+    @abstractmethod
+    def unsubscribe(self, subscription):
+        """Ends a subscription returned by subscribe()."""
+
+
+class Subscription:
+    def __init__(self, broker, character_ids, max_queued_events=100):
+        self.broker = broker
+        self.character_ids = list(character_ids)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_queued_events)
+        self.overflowed = False
+
+    def deliver(self, event):
+        """Thread safe, hands the event over to the event loop of the subscriber."""
+        self.loop.call_soon_threadsafe(self._put, event)
+
+    def _put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # a client that does not keep up gets told to reload its sheets instead of blocking writers
+            self.overflowed = True
+
+    async def get(self):
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {"type": "resync", "character_ids": self.character_ids}
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker(SheetEventBroker):
+    """
+    Delivers events to subscribers in the same process. With several server processes every
+    process only sees its own writes, use a broker backed by a shared message bus then.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = {}
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(event["character_id"], ()))
+        for subscription in subscriptions:
+            subscription.deliver(event)
+
+    def subscribe(self, character_ids):
+        subscription = Subscription(self, character_ids)
+        with self.lock:
+            for character_id in subscription.character_ids:
+                self.subscriptions.setdefault(character_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for character_id in subscription.character_ids:
+                subscribers = self.subscriptions.get(character_id)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscriptions[character_id]
+
+
+class SheetEventStream:
+    """
+    Formats the events of a subscription as Server-Sent Events. Django calls close() when the
+    response is finished or the client disconnected, which ends the subscription.
+    """
+
+    def __init__(self, subscription, keepalive_seconds=15, retry_ms=3000):
+        self.subscription = subscription
+        self.keepalive_seconds = keepalive_seconds
+        self.retry_ms = retry_ms
+
+    async def __aiter__(self):
+        yield f"retry: {self.retry_ms}\n: subscribed to {', '.join(self.subscription.character_ids)}\n\n"
+        while True:
+            try:
+                event = await asyncio.wait_for(self.subscription.get(), timeout=self.keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            event_id = f"id: {event['version']}\n" if event.get("version") is not None else ""
+            yield f"{event_id}event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+    def close(self):
+        self.subscription.close()
+
+
+_brokers = {}
+
+
+def get_broker():
+    """The broker configured with settings.CHARACTER_EVENT_BROKER, one instance per process."""
+    path = getattr(settings, "CHARACTER_EVENT_BROKER", DEFAULT_BROKER)
+    if path not in _brokers:
+        _brokers[path] = import_string(path)()
+    return _brokers[path]
+
+
+def publish_sheet_event(event_type, character_id, version=None, changes=None):
+    """Publishes a sheet change once the surrounding transaction has been committed."""
+    event = {"type": event_type, "character_id": character_id, "version": version, "changes": changes or {}}
+    transaction.on_commit(lambda: get_broker().publish(event))
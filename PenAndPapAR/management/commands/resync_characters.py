@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from PenAndPapAR.ViewsHelper.CharacterResync import linked_characters, resync_characters
+
+
+class Command(BaseCommand):
+    help = "Re-syncs every character with a D&D Beyond update link from the character service."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Concurrent upstream requests.")
+        parser.add_argument("--rate", type=float, default=5.0,
+                            help="Upstream requests per second and host, 0 for no limit.")
+        parser.add_argument("--force", action="store_true",
+                            help="Apply the whole upstream sheet even if its content hash is unchanged.")
+
+    def handle(self, *args, **options):
+        linked = linked_characters()
+        if not linked:
+            self.stdout.write("No linked characters.")
+            return
+
+        result = resync_characters(linked, workers=options["workers"], rate=options["rate"],
+                                   force=options["force"])
+
+        for character_id, error in sorted(result.failed.items()):
+            self.stderr.write(f"{character_id}: {error}")
+
+        latencies = sorted(result.fetch_latencies)
+
+        def percentile(fraction):
+            return latencies[min(len(latencies) - 1, int(round(fraction * (len(latencies) - 1))))] * 1000
+
+        self.stdout.write(
+            f"Re-synced {result.characters} characters in {result.elapsed:.2f}s "
+            f"({result.characters / result.elapsed if result.elapsed else 0:.1f} characters/s): "
+            f"{len(result.updated)} updated, {len(result.unchanged)} unchanged, "
+            f"{len(result.skipped)} skipped by content hash, {len(result.failed)} failed.")
+        if not latencies:
+            # every fetch raised before its request was timed
+            self.stdout.write("Upstream requests: none timed.")
+            return
+        self.stdout.write(
+            f"Upstream requests: {len(latencies)}, latency p50 {percentile(0.5):.1f} ms, "
+            f"p95 {percentile(0.95):.1f} ms, max {latencies[-1] * 1000:.1f} ms.")
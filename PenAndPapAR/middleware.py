@@ -0,0 +1,82 @@
+import contextlib
+import json
+import logging
+import time
+
+from django.db import connections
+
+from PenAndPapAR.ViewsHelper.RequestTiming import current_metrics, measure_request, request_timing_settings
+
+logger = logging.getLogger("PenAndPapAR.timing")
+
+# metric -> Server-Timing description
+SERVER_TIMING_METRICS = {
+    "db": "database",
+    "upstream": "D&D Beyond",
+    "serialize": "serialization",
+}
+
+
+class RequestTimingMiddleware:
+    """
+    Measures every request: number and time of database queries, time spent waiting for
+    D&D Beyond, serialization (building and rendering the response body) and the total.
+
+    The values are sent as a Server-Timing header and logged as one JSON line to the
+    "PenAndPapAR.timing" logger. Requests slower than REQUEST_TIMING["QUERY_LOG_THRESHOLD_MS"]
+    also log their SQL statements. Should be the first entry of MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        config = request_timing_settings()
+        if not config["ENABLED"]:
+            return self.get_response(request)
+
+        threshold = config["QUERY_LOG_THRESHOLD_MS"]
+        with measure_request(record_queries=threshold is not None) as metrics, contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics.execute_wrapper))
+            response = self.get_response(request)
+
+        total_ms = metrics.total_ms()
+        if config["SERVER_TIMING_HEADER"]:
+            response["Server-Timing"] = server_timing_header(metrics, total_ms)
+
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 3),
+            "db_queries": metrics.counts.get("db", 0),
+            **{f"{name}_ms": round(metrics.duration_ms(name), 3) for name in SERVER_TIMING_METRICS},
+            "upstream_requests": metrics.counts.get("upstream", 0),
+        }
+        if threshold is not None and total_ms >= threshold:
+            record["queries"] = metrics.queries
+        logger.info(json.dumps(record), extra={"timing": record})
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returned, time the rendering as well
+        metrics = current_metrics()
+        if metrics is not None:
+            start = time.perf_counter()
+
+            def rendered(response):
+                metrics.add("serialize", time.perf_counter() - start)
+
+            response.add_post_render_callback(rendered)
+        return response
+
+
+def server_timing_header(metrics, total_ms):
+    entries = []
+    for name, description in SERVER_TIMING_METRICS.items():
+        if name == "db":
+            description = f"{metrics.counts.get('db', 0)} queries"
+        entries.append(f'{name};dur={metrics.duration_ms(name):.3f};desc="{description}"')
+    entries.append(f"total;dur={total_ms:.3f}")
+    return ", ".join(entries)
@@ -0,0 +1,99 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CharacterStats',
+            fields=[
+                ('character_id', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('character_is_inspired', models.BooleanField(default=False, null=True)),
+                ('character_name', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_class', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_race', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_background', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_subclass', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_level', models.PositiveSmallIntegerField(default=3, null=True)),
+                ('character_alignment', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_conditions', models.TextField(blank=True, null=True)),
+                ('character_update_link', models.URLField(blank=True, null=True)),
+                ('character_proficiency_bonus', models.PositiveSmallIntegerField(blank=True, default=2, null=True)),
+                ('character_gender', models.CharField(blank=True, max_length=50, null=True)),
+                ('character_death_save_success', models.PositiveSmallIntegerField(default=0, null=True)),
+                ('character_death_save_failure', models.PositiveSmallIntegerField(default=0, null=True)),
+                ('character_exhaustion', models.PositiveSmallIntegerField(default=0, null=True)),
+                ('character_speed', models.PositiveSmallIntegerField(default=30, null=True)),
+                ('character_initiative_adjustment', models.PositiveSmallIntegerField(default=0, null=True)),
+                ('character_proficiency_bonus_adjustment', models.PositiveSmallIntegerField(default=0, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AC',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ac_base', models.PositiveSmallIntegerField(max_length=20)),
+                ('ac_modified', models.PositiveSmallIntegerField(default=10)),
+                ('ac_character', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ac', to='PenAndPapAR.characterstats')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='HitPoints',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hit_points_current', models.PositiveSmallIntegerField(default=10)),
+                ('hit_points_max', models.PositiveSmallIntegerField(default=10)),
+                ('hit_points_temp', models.PositiveSmallIntegerField(default=0)),
+                ('non_lethal_damage', models.PositiveSmallIntegerField(default=0)),
+                ('hit_points_character', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='hit_points', to='PenAndPapAR.characterstats')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Attributes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute_name', models.CharField(max_length=20)),
+                ('attribute_value', models.PositiveSmallIntegerField(default=10)),
+                ('attribute_adjustment', models.PositiveSmallIntegerField(default=0)),
+                ('attribute_character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PenAndPapAR.characterstats')),
+            ],
+            options={
+                'unique_together': {('attribute_name', 'attribute_character')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SavingThrowProficiencies',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('saving_throw_name', models.CharField(max_length=20)),
+                ('saving_throw_adjustment', models.PositiveSmallIntegerField(default=0)),
+                ('saving_throw_is_proficient', models.BooleanField(default=False)),
+                ('saving_throw_proficiency_character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PenAndPapAR.characterstats')),
+            ],
+            options={
+                'unique_together': {('saving_throw_name', 'saving_throw_proficiency_character')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Skills',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('skill_name', models.CharField(max_length=20)),
+                ('skill_adjustment', models.PositiveSmallIntegerField(default=0)),
+                ('skill_is_proficient', models.BooleanField(default=False)),
+                ('skill_is_expertise', models.BooleanField(default=False)),
+                ('skill_character', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='PenAndPapAR.characterstats')),
+            ],
+            options={
+                'unique_together': {('skill_name', 'skill_character')},
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+def seed_character_id_sequence(apps, schema_editor):
+    # continue after the highest existing "#NNNN" id, ids that do not follow the pattern are ignored
+    CharacterStats = apps.get_model('PenAndPapAR', 'CharacterStats')
+    CharacterIdSequence = apps.get_model('PenAndPapAR', 'CharacterIdSequence')
+
+    next_value = 0
+    for character_id in CharacterStats.objects.values_list('character_id', flat=True).iterator():
+        if character_id.startswith('#') and character_id[1:].isdigit():
+            next_value = max(next_value, int(character_id[1:]) + 1)
+    CharacterIdSequence.objects.create(name='character_id', next_value=next_value)
+
+
+def remove_character_id_sequence(apps, schema_editor):
+    apps.get_model('PenAndPapAR', 'CharacterIdSequence').objects.filter(name='character_id').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CharacterIdSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_character_id_sequence, remove_character_id_sequence),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0002_characteridsequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='characterstats',
+            name='character_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
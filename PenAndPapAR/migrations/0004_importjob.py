@@ -0,0 +1,28 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:16
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0003_characterstats_character_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('job_id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('job_status', models.CharField(choices=[('queued', 'Queued'), ('fetching', 'Fetching'), ('writing', 'Writing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('job_source_link', models.URLField()),
+                ('job_error', models.TextField(blank=True, null=True)),
+                ('job_created_at', models.DateTimeField(auto_now_add=True)),
+                ('job_started_at', models.DateTimeField(blank=True, null=True)),
+                ('job_finished_at', models.DateTimeField(blank=True, null=True)),
+                ('job_character', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='PenAndPapAR.characterstats')),
+            ],
+        ),
+    ]
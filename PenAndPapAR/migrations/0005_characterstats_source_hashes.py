@@ -0,0 +1,23 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='characterstats',
+            name='character_section_hashes',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='characterstats',
+            name='character_source_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
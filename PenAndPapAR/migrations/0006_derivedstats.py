@@ -0,0 +1,89 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# the rules of compute_derived_stats as of this migration, later changes to them must not change it
+SKILL_ABILITIES = {
+    'acrobatics': 'dexterity', 'animal_handling': 'wisdom', 'arcana': 'intelligence', 'athletics': 'strength',
+    'deception': 'charisma', 'history': 'intelligence', 'insight': 'wisdom', 'intimidation': 'charisma',
+    'investigation': 'intelligence', 'medicine': 'wisdom', 'nature': 'intelligence', 'perception': 'wisdom',
+    'performance': 'charisma', 'persuasion': 'charisma', 'religion': 'intelligence',
+    'sleight_of_hand': 'dexterity', 'stealth': 'dexterity', 'survival': 'wisdom',
+}
+
+
+def skill_or_save_total(attribute_modifier, proficiency_bonus, is_proficient, is_expertise, adjustment):
+    proficiency = 2 * proficiency_bonus if is_expertise else proficiency_bonus if is_proficient else 0
+    return attribute_modifier + proficiency + (adjustment or 0)
+
+
+def compute_derived_stats(stats, attributes, skills, saving_throws):
+    proficiency_bonus = (stats.get('character_proficiency_bonus') or 0) + (
+        stats.get('character_proficiency_bonus_adjustment') or 0)
+    modifiers = {row['attribute_name']: ((row.get('attribute_value') or 0) + (row.get('attribute_adjustment') or 0)
+                                         - 10) // 2 for row in attributes}
+    skill_totals = {row['skill_name']: skill_or_save_total(
+        modifiers.get(SKILL_ABILITIES.get(row['skill_name']), 0), proficiency_bonus,
+        row.get('skill_is_proficient'), row.get('skill_is_expertise'), row.get('skill_adjustment'))
+        for row in skills}
+    saving_throw_totals = {row['saving_throw_name']: skill_or_save_total(
+        modifiers.get(row['saving_throw_name'], 0), proficiency_bonus,
+        row.get('saving_throw_is_proficient'), False, row.get('saving_throw_adjustment'))
+        for row in saving_throws}
+    return {
+        'derived_proficiency_bonus': proficiency_bonus,
+        'derived_initiative': modifiers.get('dexterity', 0) + (stats.get('character_initiative_adjustment') or 0),
+        'derived_passive_perception': 10 + skill_totals.get('perception', modifiers.get('wisdom', 0)),
+        'derived_ability_modifiers': modifiers,
+        'derived_skill_totals': skill_totals,
+        'derived_saving_throw_totals': saving_throw_totals,
+    }
+
+
+def compute_existing_derived_stats(apps, schema_editor):
+    CharacterStats = apps.get_model('PenAndPapAR', 'CharacterStats')
+    Attributes = apps.get_model('PenAndPapAR', 'Attributes')
+    Skills = apps.get_model('PenAndPapAR', 'Skills')
+    SavingThrowProficiencies = apps.get_model('PenAndPapAR', 'SavingThrowProficiencies')
+    DerivedStats = apps.get_model('PenAndPapAR', 'DerivedStats')
+
+    def rows_by_character(model, character_field):
+        rows = {}
+        for row in model.objects.values().iterator():
+            rows.setdefault(row[character_field], []).append(row)
+        return rows
+
+    attributes = rows_by_character(Attributes, 'attribute_character_id')
+    skills = rows_by_character(Skills, 'skill_character_id')
+    saving_throws = rows_by_character(SavingThrowProficiencies, 'saving_throw_proficiency_character_id')
+    DerivedStats.objects.bulk_create(
+        [DerivedStats(derived_character_id=stats['character_id'], **compute_derived_stats(
+            stats, attributes.get(stats['character_id'], []), skills.get(stats['character_id'], []),
+            saving_throws.get(stats['character_id'], [])))
+         for stats in CharacterStats.objects.values().iterator()],
+        batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0005_characterstats_source_hashes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DerivedStats',
+            fields=[
+                ('derived_character', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='derived_stats', serialize=False, to='PenAndPapAR.characterstats')),
+                ('derived_proficiency_bonus', models.SmallIntegerField(default=0)),
+                ('derived_initiative', models.SmallIntegerField(default=0)),
+                ('derived_passive_perception', models.SmallIntegerField(default=10)),
+                ('derived_ability_modifiers', models.JSONField(default=dict)),
+                ('derived_skill_totals', models.JSONField(default=dict)),
+                ('derived_saving_throw_totals', models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.RunPython(compute_existing_derived_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0006_derivedstats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_class', 'character_id'], name='character_class_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_race', 'character_id'], name='character_race_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_level', 'character_id'], name='character_level_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_name'], name='character_name_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.1.5 on 2026-10-18 10:48
+
+import re
+
+from django.db import migrations, models
+
+# condition name -> bit in character_condition_flags as of this migration, 1 << (D&D Beyond id - 1)
+CONDITION_BITS = {name: 1 << index for index, name in enumerate([
+    'blinded', 'charmed', 'deafened', 'frightened', 'grappled', 'incapacitated', 'invisible', 'paralyzed',
+    'petrified', 'poisoned', 'prone', 'restrained', 'stunned', 'unconscious', 'exhaustion'])}
+EXHAUSTION_TEXT = re.compile(r'^exhaustion\s*\(\s*level\s*(\d+)\s*\)$', re.IGNORECASE)
+
+
+def parse_conditions(text):
+    """Bitmask and exhaustion level of a text like "Poisoned, Exhaustion (Level 2)", unknown names get no bit."""
+    flags, exhaustion = 0, None
+    for part in text.split(','):
+        part = part.strip()
+        match = EXHAUSTION_TEXT.match(part)
+        if match:
+            flags |= CONDITION_BITS['exhaustion']
+            exhaustion = int(match.group(1))
+        else:
+            flags |= CONDITION_BITS.get(part.lower(), 0)
+    return flags, exhaustion
+
+
+def parse_existing_conditions(apps, schema_editor):
+    # the text is left as it is, names that are no known condition get no bit
+    CharacterStats = apps.get_model('PenAndPapAR', 'CharacterStats')
+    changed = []
+    for character in CharacterStats.objects.exclude(character_conditions=None).only(
+            'character_id', 'character_conditions', 'character_exhaustion').iterator():
+        flags, exhaustion = parse_conditions(character.character_conditions)
+        if not flags:
+            continue
+        character.character_condition_flags = flags
+        if exhaustion is not None and not character.character_exhaustion:
+            character.character_exhaustion = exhaustion
+        changed.append(character)
+    CharacterStats.objects.bulk_update(changed, ['character_condition_flags', 'character_exhaustion'],
+                                       batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0007_characterstats_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='characterstats',
+            name='character_condition_flags',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_condition_flags', 'character_id'], name='character_conditions_idx'),
+        ),
+        migrations.RunPython(parse_existing_conditions, migrations.RunPython.noop),
+    ]
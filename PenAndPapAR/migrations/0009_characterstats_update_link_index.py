@@ -0,0 +1,17 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0008_characterstats_condition_flags'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='characterstats',
+            index=models.Index(fields=['character_update_link'], name='character_update_link_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.5 on 2026-10-18 11:24
+
+from django.db import migrations
+
+# name prefixes are LIKE 'prefix%' on PostgreSQL (see ViewsHelper/CharacterList.py), an index
+# answers them only with a pattern operator class unless the database uses the "C" collation.
+# Other databases compare names by a range on character_name_idx and get no extra index.
+CREATE_INDEX = (
+    'CREATE INDEX character_name_pattern_idx ON "PenAndPapAR_characterstats" (character_name varchar_pattern_ops)'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS character_name_pattern_idx'
+
+
+def create_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_name_pattern_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('PenAndPapAR', '0009_characterstats_update_link_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_name_pattern_index, drop_name_pattern_index),
+    ]
@@ -1,4 +1,7 @@
-from django.db import models
+import uuid
+
+from django.db import models, transaction
+from django.db.models import F
 from django.utils.functional import empty
 
 
@@ -13,6 +16,8 @@ class CharacterStats(models.Model):
     character_level = models.PositiveSmallIntegerField(default=3, null=True)
     character_alignment = models.CharField(max_length=50, null=True, blank=True)
     character_conditions = models.TextField(null=True, blank=True)
+    # one bit per condition id, see ViewsHelper/Conditions.py, character_conditions is its text form
+    character_condition_flags = models.PositiveIntegerField(default=0)
     character_update_link = models.URLField(null=True, blank=True)
     character_proficiency_bonus = models.PositiveSmallIntegerField(default=2, null=True, blank=True)
 
@@ -23,6 +28,66 @@ class CharacterStats(models.Model):
     character_speed = models.PositiveSmallIntegerField(default=30, null=True)
     character_initiative_adjustment = models.PositiveSmallIntegerField(default=0, null=True)
     character_proficiency_bonus_adjustment = models.PositiveSmallIntegerField(default=0, null=True)
+    # incremented on every change of the sheet, lets clients order PATCH responses and pushed diffs
+    character_version = models.PositiveIntegerField(default=0)
+    # hashes of the last D&D Beyond sheet applied to the character, re-syncs skip unchanged sections
+    character_source_hash = models.CharField(max_length=64, null=True, blank=True)
+    character_section_hashes = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        # filters of the character list, ending in character_id so a filtered page is read in
+        # keyset order straight from the index, see ViewsHelper/CharacterList.py
+        indexes = [
+            models.Index(fields=["character_class", "character_id"], name="character_class_idx"),
+            models.Index(fields=["character_race", "character_id"], name="character_race_idx"),
+            models.Index(fields=["character_level", "character_id"], name="character_level_idx"),
+            models.Index(fields=["character_name"], name="character_name_idx"),
+            models.Index(fields=["character_condition_flags", "character_id"], name="character_conditions_idx"),
+            # imports look up the character an earlier import of the same link wrote
+            models.Index(fields=["character_update_link"], name="character_update_link_idx"),
+        ]
+
+class CharacterIdSequence(models.Model):
+    """
+    Counter for character ids. Allocating a block of ids is a single UPDATE on one row,
+    so concurrent workers are serialized by the database row lock instead of racing.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.PositiveBigIntegerField(default=0)
+
+    CHARACTER_ID = "character_id"
+
+    @staticmethod
+    def format_character_id(number):
+        # at least four digits like the original "#0000" ids, longer once the counter passes 9999
+        return f"#{number:04d}"
+
+    @staticmethod
+    def parse_character_id(character_id):
+        try:
+            return int(character_id[1:]) if character_id.startswith("#") else None
+        except ValueError:
+            return None
+
+    @classmethod
+    def next_free_value(cls):
+        numbers = [cls.parse_character_id(character_id)
+                   for character_id in CharacterStats.objects.values_list("character_id", flat=True)]
+        return max((number for number in numbers if number is not None), default=-1) + 1
+
+    @classmethod
+    def allocate(cls, count=1, name=CHARACTER_ID):
+        """
+        Reserves count consecutive values and returns the first one.
+        The row is seeded from the existing character ids the first time it is used.
+        """
+        with transaction.atomic():
+            # the UPDATE takes the lock before the value is read, so no two callers get the same block
+            if not cls.objects.filter(name=name).update(next_value=F("next_value") + count):
+                cls.objects.get_or_create(name=name, defaults={"next_value": cls.next_free_value()})
+                cls.objects.filter(name=name).update(next_value=F("next_value") + count)
+            return cls.objects.get(name=name).next_value - count
+
 
 class Attributes(models.Model):
     attribute_name = models.CharField(max_length=20)
@@ -66,3 +131,45 @@ class HitPoints(models.Model):
     non_lethal_damage = models.PositiveSmallIntegerField(default=0)
     hit_points_character = models.OneToOneField(CharacterStats, on_delete=models.CASCADE, related_name="hit_points")
 
+
+class DerivedStats(models.Model):
+    """
+    Values computed from the sheet (ability modifiers, skill and saving throw totals, passive
+    perception, initiative), updated on every write that changes their inputs, see
+    ViewsHelper/DerivedStats.py. Reads never compute them.
+    """
+    derived_character = models.OneToOneField(CharacterStats, on_delete=models.CASCADE, primary_key=True,
+                                             related_name="derived_stats")
+    derived_proficiency_bonus = models.SmallIntegerField(default=0)
+    derived_initiative = models.SmallIntegerField(default=0)
+    derived_passive_perception = models.SmallIntegerField(default=10)
+    # name -> value
+    derived_ability_modifiers = models.JSONField(default=dict)
+    derived_skill_totals = models.JSONField(default=dict)
+    derived_saving_throw_totals = models.JSONField(default=dict)
+
+
+class ImportJob(models.Model):
+    """A character import from a D&D Beyond link that runs in the background, see ViewsHelper/ImportJobs.py."""
+    QUEUED = "queued"
+    FETCHING = "fetching"
+    WRITING = "writing"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    STATUS_CHOICES = [
+        (QUEUED, "Queued"),
+        (FETCHING, "Fetching"),
+        (WRITING, "Writing"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+    ]
+    FINISHED = (SUCCEEDED, FAILED)
+
+    job_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    job_status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    job_source_link = models.URLField()
+    job_character = models.ForeignKey(CharacterStats, null=True, blank=True, on_delete=models.SET_NULL)
+    job_error = models.TextField(null=True, blank=True)
+    job_created_at = models.DateTimeField(auto_now_add=True)
+    job_started_at = models.DateTimeField(null=True, blank=True)
+    job_finished_at = models.DateTimeField(null=True, blank=True)
@@ -0,0 +1,18 @@
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+try:
+    import msgpack
+except ImportError:  # optional, settings.py only registers the parser when it is installed
+    msgpack = None
+
+
+class MessagePackParser(BaseParser):
+    """Parses request bodies sent with Content-Type: application/msgpack."""
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except ValueError as e:  # truncated, malformed and trailing data
+            raise ParseError(f"MessagePack parse error - {e}")
@@ -0,0 +1,24 @@
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import msgpack
+except ImportError:  # optional, settings.py only registers the renderer when it is installed
+    msgpack = None
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders responses as MessagePack for clients sending Accept: application/msgpack
+    or ?format=msgpack. Keys and values are the same as in the JSON responses.
+    """
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        # dates, decimals etc. are converted the same way the JSON renderer does it
+        return msgpack.packb(data, use_bin_type=True, default=JSONEncoder().default)
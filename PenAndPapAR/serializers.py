@@ -1,12 +1,24 @@
 # PenAndPapAR/serializers.py
+from operator import itemgetter
+
 from rest_framework import serializers
 
-from PenAndPapAR.models import CharacterStats, Attributes, AC, SavingThrowProficiencies, Skills, HitPoints
+from PenAndPapAR.models import (
+    CharacterStats,
+    Attributes,
+    AC,
+    SavingThrowProficiencies,
+    Skills,
+    HitPoints,
+    DerivedStats,
+    ImportJob
+)
 
 class CharacterStatsSerializer(serializers.ModelSerializer):
     class Meta:
         model = CharacterStats
-        fields = '__all__'
+        # hashes of the last upstream sheet are bookkeeping of imports and re-syncs, not part of the sheet
+        exclude = ['character_source_hash', 'character_section_hashes']
 
 class AttributesSerializer(serializers.ModelSerializer):
     class Meta:
@@ -31,4 +43,85 @@ class SkillsSerializer(serializers.ModelSerializer):
 class HitPointsSerializer(serializers.ModelSerializer):
     class Meta:
         model = HitPoints
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class DerivedStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DerivedStats
+        fields = '__all__'
+
+class ImportJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ImportJob
+        fields = '__all__'
+
+# Read-only serialization of sheet rows. Builds the output of a ModelSerializer above from
+# rows by attname (.values() rows or the __dict__ of model instances) with the fields
+# resolved once, instead of binding fields and calling to_representation per row.
+class ReadSerializer:
+    # DRF fields whose to_representation returns the database value unchanged
+    PASSTHROUGH_FIELDS = (serializers.CharField, serializers.IntegerField, serializers.BooleanField,
+                          serializers.PrimaryKeyRelatedField)
+
+    def __init__(self, serializer_class, names=None):
+        # names limits the output to these fields of the serializer, None keeps all of them
+        model = serializer_class.Meta.model
+        self.pk_column = model._meta.pk.attname
+        self.names = []
+        self.columns = []
+        self.converters = []
+        for name, field in serializer_class().fields.items():
+            if names is not None and name not in names:
+                continue
+            self.names.append(name)
+            self.columns.append(model._meta.get_field(field.source).attname)
+            if not isinstance(field, self.PASSTHROUGH_FIELDS):
+                self.converters.append((name, field.to_representation))
+        if len(self.columns) == 1:
+            # itemgetter of a single item returns the value itself, not a tuple
+            column = self.columns[0]
+            self.getter = lambda row: (row[column],)
+        else:
+            self.getter = itemgetter(*self.columns)
+
+    def to_representation(self, row):
+        data = dict(zip(self.names, self.getter(row)))
+        for name, convert in self.converters:
+            if data[name] is not None:
+                data[name] = convert(data[name])
+        return data
+
+    def many(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+# Serializers used to validate imported characters before their character id exists.
+# They leave out the character relation, so validation runs without database queries.
+class CharacterStatsImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CharacterStats
+        exclude = ['character_id', 'character_version', 'character_source_hash', 'character_section_hashes']
+
+class AttributesImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Attributes
+        exclude = ['id', 'attribute_character']
+
+class ACImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AC
+        exclude = ['id', 'ac_character']
+
+class SavingThrowProficienciesImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SavingThrowProficiencies
+        exclude = ['id', 'saving_throw_proficiency_character']
+
+class SkillsImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Skills
+        exclude = ['id', 'skill_character']
+
+class HitPointsImportSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = HitPoints
+        exclude = ['id', 'hit_points_character']
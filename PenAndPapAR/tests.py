@@ -1,3 +1,1626 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from PenAndPapAR.models import (
+    AC,
+    CharacterIdSequence,
+    CharacterStats,
+    Attributes,
+    DerivedStats,
+    HitPoints,
+    ImportJob,
+    Skills
+)
+from PenAndPapAR.serializers import (
+    ACSerializer,
+    AttributesSerializer,
+    CharacterStatsSerializer,
+    DerivedStatsSerializer,
+    HitPointsSerializer,
+    SavingThrowProficienciesSerializer,
+    SkillsSerializer
+)
+from PenAndPapAR.ViewsHelper.CharacterImport import generate_character_ids, hash_character, hash_character_sections
+from PenAndPapAR.ViewsHelper.CharacterResync import HostRateLimiter, linked_characters
+from PenAndPapAR.ViewsHelper.CharacterSheet import (
+    character_sheet_queryset,
+    load_character_sheet,
+    load_character_sheets,
+    serialize_character_sheet
+)
+from PenAndPapAR.ViewsHelper.CharacterSheetCache import cache_sheet, get_cached_sheet, sheet_cache
+from PenAndPapAR.ViewsHelper.Conditions import condition_flags, format_conditions, parse_conditions
+from PenAndPapAR.ViewsHelper.ImportJobs import get_runner, run_import_job
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import (
+    CachedCharacter,
+    CappedRetry,
+    CharacterPayloadCache,
+    DnDBeyondCharacterService,
+    get_payload_cache
+)
+from PenAndPapAR.ViewsHelper.PackedSheet import pack_character_sheet, unpack_character_sheet
+from PenAndPapAR.ViewsHelper.PartyStats import simulate_group_check
+from PenAndPapAR.ViewsHelper.SheetEvents import InProcessBroker, SheetEventBroker, get_broker
+from PenAndPapAR.upstream_stand_in import StandInCharacterService
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+TEST_JSONS = settings.BASE_DIR / "PenAndPapARDB" / "TestJsons"
+
+
+# one line per request would bury the test output, assertLogs() still sees the records
+logging.getLogger("PenAndPapAR.timing").setLevel(logging.WARNING)
+
+
+def load_test_json(name):
+    with open(TEST_JSONS / name, encoding="utf-8") as file:
+        return json.load(file)
+
+
+def complete_character_post():
+    data = load_test_json("CompleteCharacterPost.json")
+    data["stats"][0]["character_source_link"] = None
+    return data
+
+
+def upstream_character():
+    return load_test_json("DnDBeyondCharacter.json")
+
+
+def import_link_response(client, source_link):
+    data = complete_character_post()
+    data["stats"][0]["character_source_link"] = source_link
+    return client.post(reverse("char-stats"), data, format="json")
+
+
+def import_link(client, source_link):
+    """Posts a character link and returns the state of its import job."""
+    response = import_link_response(client, source_link)
+    assert response.status_code == status.HTTP_202_ACCEPTED, response.data
+    return client.get(response["Location"]).data
+
+
+def stand_in_client_settings(upstream, **overrides):
+    # no backoff sleeps in tests
+    return {**settings.DNDBEYOND_CLIENT, "BASE_URL": upstream.base_url, "BACKOFF_FACTOR": 0, **overrides}
+
+
+# link imports run inside the request, so tests see the finished job right away
+@override_settings(IMPORT_JOBS={**settings.IMPORT_JOBS, "EAGER": True})
+class PenAndPapARTestCase(APITestCase):
+    def setUp(self):
+        # the database is rolled back after every test, cached sheets have to go as well
+        sheet_cache().clear()
+        get_payload_cache().clear()
+
+
+class CharacterStatsGetTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        response = self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_get_returns_complete_sheet(self):
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stats"][0]["character_name"], "Faelyndiira")
+        self.assertEqual(len(response.data["attributes"]), 6)
+        self.assertEqual(len(response.data["saving_throw_proficiencies"]), 6)
+        self.assertEqual(len(response.data["skills"]), 18)
+        self.assertEqual(response.data["ac"][0]["ac_character"], "#0000")
+        self.assertEqual(response.data["hit_points"][0]["hit_points_character"], "#0000")
+
+    def test_get_query_count(self):
+        # stats joined with ac/hit_points + one prefetch per trait table
+        with self.assertNumQueries(4):
+            self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+
+    def test_get_unknown_character(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse("char-stats"), {"character_id": "#9999"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stats"], [])
+        self.assertEqual(response.data["skills"], [])
+
+
+class SparseSheetTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def test_include_queries_only_selected_tables(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("char-stats"), {"character_id": "#0000", "include": "hit_points,ac"})
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("character_name", queries[0]["sql"])
+        self.assertEqual(list(response.data), ["ac", "hit_points"])
+        self.assertEqual(response.data["hit_points"][0]["hit_points_character"], "#0000")
+
+    def test_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("char-stats"), {
+                "character_id": "#0000", "fields": "hit_points.hit_points_current,character_name,skill_name"})
+
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(list(response.data), ["stats", "skills", "hit_points"])
+        self.assertEqual(response.data["stats"], [{"character_name": "Faelyndiira"}])
+        self.assertEqual(list(response.data["hit_points"][0]), ["hit_points_current"])
+        self.assertEqual(len(response.data["skills"]), 18)
+        self.assertEqual(list(response.data["skills"][0]), ["skill_name"])
+
+    def test_sparse_sheet_matches_cached_sheet(self):
+        params = {"character_id": "#0000", "include": "stats,skills", "fields": "skill_name,skill_is_proficient"}
+        uncached = self.client.get(reverse("char-stats"), params)
+        self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+        with self.assertNumQueries(0):
+            cached = self.client.get(reverse("char-stats"), params)
+
+        self.assertEqual(cached.data, uncached.data)
+        self.assertEqual(cached["ETag"], uncached["ETag"])
+
+    def test_sparse_sheet_is_not_cached(self):
+        self.client.get(reverse("char-stats"), {"character_id": "#0000", "include": "hit_points"})
+
+        self.assertIsNone(get_cached_sheet("#0000"))
+
+    def test_batch_and_unknown_character(self):
+        response = self.client.get(reverse("char-stats-batch"), {
+            "character_ids": "#0000,#0001,#9999", "fields": "derived_initiative"})
+
+        self.assertEqual(response.data["characters"], [{"derived_stats": [{"derived_initiative": 2}]}] * 2)
+        self.assertEqual(response.data["missing"], ["#9999"])
+        response = self.client.get(reverse("char-stats"), {"character_id": "#9999", "include": "ac"})
+        self.assertEqual(response.data, {"ac": []})
+
+    def test_packed_include(self):
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000", "include": "skills",
+                                                           "packed": "1"})
+
+        self.assertEqual(set(response.data), {"skills", "packed"})
+        self.assertEqual(len(response.data["skills"]), 18)
+
+    def test_invalid_selection(self):
+        for params in ({"include": "spells"}, {"fields": "hit_points.character_name"}, {"fields": "mana"},
+                       {"fields": "character_name", "packed": "1"}):
+            response = self.client.get(reverse("char-stats"), {"character_id": "#0000", **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class ReadSerializerTests(PenAndPapARTestCase):
+    def model_serializer_sheet(self, character_id):
+        character = CharacterStats.objects.get(character_id=character_id)
+        ac = AC.objects.filter(ac_character=character).first()
+        hit_points = HitPoints.objects.filter(hit_points_character=character).first()
+        return {
+            "stats": CharacterStatsSerializer([character], many=True).data,
+            "attributes": AttributesSerializer(character.attributes_set.order_by("id"), many=True).data,
+            "ac": ACSerializer([ac] if ac else [], many=True).data,
+            "saving_throw_proficiencies": SavingThrowProficienciesSerializer(
+                character.savingthrowproficiencies_set.order_by("id"), many=True).data,
+            "skills": SkillsSerializer(character.skills_set.order_by("id"), many=True).data,
+            "hit_points": HitPointsSerializer([hit_points] if hit_points else [], many=True).data,
+            "derived_stats": DerivedStatsSerializer(DerivedStats.objects.filter(derived_character=character),
+                                                    many=True).data,
+        }
+
+    def test_sheets_match_model_serializers(self):
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        self.client.post(reverse("char-stats"), load_test_json("EmptyCharacterMinimalPost.json"), format="json")
+        AC.objects.filter(ac_character="#0001").delete()
+
+        loaded = load_character_sheets(["#0000", "#0001"])
+        for character_id in ["#0000", "#0001"]:
+            expected = self.model_serializer_sheet(character_id)
+            instance = character_sheet_queryset().get(character_id=character_id)
+            for sheet in [loaded[character_id], serialize_character_sheet(instance)]:
+                # same values, keys in the same order
+                self.assertEqual(json.dumps(sheet, default=str), json.dumps(expected, default=str))
+        self.assertEqual(loaded["#0001"]["ac"], [])
+
+
+class CharacterSheetCacheTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def get_sheet(self, **headers):
+        return self.client.get(reverse("char-stats"), {"character_id": "#0000"}, headers=headers)
+
+    def test_cached_get_runs_no_queries(self):
+        first = self.get_sheet()
+        with self.assertNumQueries(0):
+            second = self.get_sheet()
+
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first["ETag"], second["ETag"])
+
+    def test_if_none_match_returns_not_modified(self):
+        etag = self.get_sheet()["ETag"]
+        with self.assertNumQueries(0):
+            response = self.get_sheet(if_none_match=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_stale_if_none_match_returns_sheet(self):
+        response = self.get_sheet(if_none_match='"outdated"')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["stats"][0]["character_id"], "#0000")
+
+    def test_put_invalidates_cached_sheet(self):
+        etag = self.get_sheet()["ETag"]
+        self.client.put(reverse("char-stats"), load_test_json("MinimalCharacterPut.json"), format="json")
+        response = self.get_sheet(if_none_match=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()["stats"][0]["character_name"], "Symonya")
+
+    def test_sheet_read_before_put_is_not_cached_after_it(self):
+        # a GET misses the cache and reads the sheet, a PUT updates and invalidates it,
+        # then the GET stores what it read
+        stale = load_character_sheet("#0000")
+        self.client.put(reverse("char-stats"), load_test_json("MinimalCharacterPut.json"), format="json")
+        cache_sheet("#0000", stale)
+
+        self.assertEqual(self.get_sheet().json()["stats"][0]["character_name"], "Symonya")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get_sheet().json()["stats"][0]["character_name"], "Symonya")
+
+    def test_cached_empty_sheet_is_not_stored_after_post(self):
+        empty = load_character_sheet("#0001")
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        cache_sheet("#0001", empty)
+
+        self.assertEqual(len(self.client.get(reverse("char-stats"), {"character_id": "#0001"}).json()["skills"]), 18)
+
+    def test_post_invalidates_cached_empty_sheet(self):
+        self.client.get(reverse("char-stats"), {"character_id": "#0001"})
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0001"})
+
+        self.assertEqual(len(response.json()["skills"]), 18)
+
+    def test_file_based_backend(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            file_cache = {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": cache_dir,
+            }
+            with self.settings(CACHES={**settings.CACHES, "character_sheets": file_cache}):
+                etag = self.get_sheet()["ETag"]
+                self.assertTrue(os.listdir(cache_dir))
+                with self.assertNumQueries(0):
+                    self.assertEqual(self.get_sheet(if_none_match=etag).status_code,
+                                     status.HTTP_304_NOT_MODIFIED)
+
+
+class CharacterStatsBatchTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        for _ in range(3):
+            self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def test_batch_returns_requested_sheets_in_order(self):
+        response = self.client.get(reverse("char-stats-batch"), {"character_id": ["#0002", "#0000", "#0404"]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([sheet["stats"][0]["character_id"] for sheet in response.data["characters"]],
+                         ["#0002", "#0000"])
+        self.assertEqual(response.data["missing"], ["#0404"])
+        self.assertEqual(len(response.data["characters"][0]["skills"]), 18)
+
+    def test_batch_query_count_is_constant(self):
+        with self.assertNumQueries(4):
+            self.client.get(reverse("char-stats-batch"), {"character_ids": "#0000"})
+        with self.assertNumQueries(4):
+            self.client.get(reverse("char-stats-batch"), {"character_ids": "#0000,#0001,#0002"})
+
+    def test_batch_without_ids(self):
+        response = self.client.get(reverse("char-stats-batch"))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@unittest.skipUnless(msgpack, "msgpack is not installed")
+class MessagePackTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def test_get_renders_msgpack(self):
+        json_response = self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000"},
+                                   headers={"accept": "application/msgpack"})
+
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack.unpackb(response.content), json_response.json())
+        self.assertLess(len(response.content), len(json_response.content))
+        self.assertNotEqual(response["ETag"], json_response["ETag"])
+
+    def test_post_parses_msgpack(self):
+        response = self.client.post(reverse("char-stats"), msgpack.packb(complete_character_post()),
+                                    content_type="application/msgpack")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["character_id"], "#0001")
+        self.assertEqual(Skills.objects.filter(skill_character="#0001").count(), 18)
+
+    def test_malformed_msgpack(self):
+        response = self.client.post(reverse("char-stats"), b"\xc1", content_type="application/msgpack")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PackedSheetTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def test_packed_get_uses_fixed_order_arrays(self):
+        sheet = self.client.get(reverse("char-stats"), {"character_id": "#0000"}).json()
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000", "packed": "1"})
+        packed = response.json()
+
+        self.assertEqual(packed["packed"], "packed-v1")
+        self.assertEqual(len(packed["attributes"]), 6)
+        self.assertEqual(len(packed["skills"]), 18)
+        strength = next(row for row in sheet["attributes"] if row["attribute_name"] == "strength")
+        self.assertEqual(packed["attributes"][0], [strength["attribute_value"], strength["attribute_adjustment"]])
+        self.assertEqual(packed["stats"], sheet["stats"])
+        self.assertTrue(response["ETag"].endswith('-packed"'))
+
+    def test_packed_etag_answers_not_modified(self):
+        etag = self.client.get(reverse("char-stats"), {"character_id": "#0000", "packed": "1"})["ETag"]
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000", "packed": "1"},
+                                   headers={"if-none-match": etag})
+        unpacked_response = self.client.get(reverse("char-stats"), {"character_id": "#0000"},
+                                            headers={"if-none-match": etag})
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(unpacked_response.status_code, status.HTTP_200_OK)
+
+    def test_unpack_restores_trait_rows(self):
+        sheet = self.client.get(reverse("char-stats"), {"character_id": "#0000"}).json()
+        unpacked = unpack_character_sheet(pack_character_sheet(sheet))
+
+        skills = {row["skill_name"]: row for row in sheet["skills"]}
+        for row in unpacked["skills"]:
+            self.assertEqual(row, {key: skills[row["skill_name"]][key] for key in row})
+        self.assertEqual(len(unpacked["skills"]), 18)
+
+    def test_packed_batch(self):
+        response = self.client.get(reverse("char-stats-batch"), {"character_id": "#0000", "packed": "true"})
+
+        self.assertEqual(len(response.json()["characters"][0]["saving_throw_proficiencies"]), 6)
+        self.assertIsInstance(response.json()["characters"][0]["saving_throw_proficiencies"][0], list)
+
+
+class CharacterStatsPostTests(PenAndPapARTestCase):
+    def test_post_returns_character_id(self):
+        response = self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["character_id"], "#0000")
+
+    def test_post_fills_missing_traits(self):
+        data = load_test_json("EmptyCharacterMinimalPost.json")
+        response = self.client.post(reverse("char-stats"), data, format="json")
+        sheet = self.client.get(reverse("char-stats"), {"character_id": response.data["character_id"]}).data
+
+        self.assertEqual(len(sheet["attributes"]), 6)
+        self.assertEqual(len(sheet["saving_throw_proficiencies"]), 6)
+        self.assertEqual(len(sheet["skills"]), 18)
+
+    def test_invalid_skill_writes_nothing(self):
+        data = complete_character_post()
+        data["skills"][0]["skill_adjustment"] = -1
+        response = self.client.post(reverse("char-stats"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CharacterStats.objects.exists())
+
+    def test_invalid_trait_name(self):
+        data = complete_character_post()
+        data["skills"][0]["skill_name"] = "juggling"
+        response = self.client.post(reverse("char-stats"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(CharacterStats.objects.exists())
+
+
+class ParseCharacterDataTests(SimpleTestCase):
+    def parse(self, data):
+        parsed = DnDBeyondCharacterService.parse_character_data(data)
+        skills = {row["skill_name"]: row for row in parsed["skills"]}
+        saves = {row["saving_throw_name"]: row["saving_throw_is_proficient"]
+                 for row in parsed["saving_throw_proficiencies"]}
+        return parsed, skills, saves
+
+    def test_proficiencies_from_modifiers(self):
+        parsed, skills, saves = self.parse(upstream_character())
+
+        self.assertTrue(skills["athletics"]["skill_is_proficient"])
+        self.assertTrue(skills["athletics"]["skill_is_expertise"])
+        self.assertTrue(skills["perception"]["skill_is_proficient"])
+        self.assertFalse(skills["perception"]["skill_is_expertise"])
+        self.assertFalse(skills["stealth"]["skill_is_proficient"])
+        self.assertEqual([name for name, proficient in saves.items() if proficient], ["strength", "constitution"])
+        self.assertEqual(parsed["attributes"][0], {"attribute_name": "strength", "attribute_value": 16,
+                                                   "attribute_adjustment": 0})
+
+    def test_conditions(self):
+        parsed, _, _ = self.parse(upstream_character())
+
+        self.assertEqual(parsed["stats"][0]["character_conditions"], "Frightened, Exhaustion (Level 1)")
+        self.assertEqual(parsed["stats"][0]["character_condition_flags"], 0b100000000001000)
+        self.assertEqual(parsed["stats"][0]["character_exhaustion"], 1)
+
+    def test_sub_types_are_normalized(self):
+        data = upstream_character()
+        data["data"]["modifiers"]["class"] = [
+            {"type": "proficiency", "subType": "Sleight-of-Hand"},
+            {"type": "proficiency", "subType": "animal-handling"},
+            {"type": "proficiency", "subType": "Wisdom-Saving-Throws"},
+            {"type": "proficiency", "subType": None},
+        ]
+        _, skills, saves = self.parse(data)
+
+        self.assertTrue(skills["sleight_of_hand"]["skill_is_proficient"])
+        self.assertTrue(skills["animal_handling"]["skill_is_proficient"])
+        self.assertTrue(saves["wisdom"])
+
+    def test_stats_by_stat_id(self):
+        data = upstream_character()
+        data["data"]["stats"] = [{"statId": 6, "value": 18}]
+        parsed, _, _ = self.parse(data)
+
+        self.assertEqual({row["attribute_name"]: row["attribute_value"] for row in parsed["attributes"]},
+                         {"strength": 10, "dexterity": 10, "constitution": 10, "intelligence": 10, "wisdom": 10,
+                          "charisma": 18})
+
+
+    def run_script(self, *args):
+        # the script is run on its own, without the Django settings of the test run
+        env = {name: value for name, value in os.environ.items() if name != "DJANGO_SETTINGS_MODULE"}
+        return subprocess.run([sys.executable, *args], input="not a link\n", capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, env=env, timeout=60)
+
+    def test_module_runs_without_django_settings(self):
+        result = self.run_script("-m", "PenAndPapAR.ViewsHelper.DNDBeyondWebdata")
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Invalid URL", result.stdout)
+
+    def test_script_runs_without_django_settings(self):
+        result = self.run_script(os.path.join("PenAndPapAR", "ViewsHelper", "DNDBeyondWebdata.py"))
+
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("Invalid URL", result.stdout)
+
+class DnDBeyondImportTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstream = StandInCharacterService({"123456789": upstream_character()}).start()
+        self.addCleanup(self.upstream.stop)
+
+    def upstream_settings(self, **overrides):
+        return override_settings(DNDBEYOND_CLIENT=stand_in_client_settings(self.upstream, **overrides))
+
+    def import_link(self, character_id="123456789"):
+        return import_link(self.client, self.upstream.character_url(character_id))
+
+    def test_post_link_imports_upstream_character(self):
+        with self.upstream_settings():
+            job = self.import_link()
+
+        self.assertEqual(job["job_status"], "succeeded")
+        character = CharacterStats.objects.get(character_id=job["job_character"])
+        self.assertEqual(character.character_name, "Thorin Emberforge")
+        self.assertEqual(character.character_level, 5)
+        self.assertEqual(Skills.objects.filter(skill_character=character).count(), 18)
+        self.assertEqual(self.upstream.requests[0]["path"], "/character/v5/character/123456789")
+
+    def test_unchanged_link_is_not_imported_twice(self):
+        with self.upstream_settings():
+            first = self.import_link()
+            second = self.import_link()
+
+        self.assertEqual(second["job_status"], "succeeded")
+        self.assertEqual(second["job_character"], first["job_character"])
+        self.assertEqual(CharacterStats.objects.count(), 1)
+        self.assertEqual(CharacterStats.objects.get(character_id=first["job_character"]).character_version, 0)
+
+    def test_changed_link_updates_imported_character(self):
+        with self.upstream_settings():
+            first = self.import_link()
+            Skills.objects.filter(skill_character=first["job_character"], skill_name="stealth").update(
+                skill_adjustment=3)
+            changed = upstream_character()
+            changed["data"]["currentHp"] = 27
+            self.upstream.characters["123456789"] = changed
+            get_payload_cache().clear()
+            second = self.import_link()
+
+        self.assertEqual(second["job_character"], first["job_character"])
+        self.assertEqual(CharacterStats.objects.count(), 1)
+        self.assertEqual(HitPoints.objects.get(hit_points_character=first["job_character"]).hit_points_current, 27)
+        # only the changed sections are applied, local edits of the others are kept
+        self.assertEqual(Skills.objects.get(skill_character=first["job_character"],
+                                            skill_name="stealth").skill_adjustment, 3)
+
+    def test_connections_are_reused(self):
+        with self.upstream_settings():
+            for _ in range(3):
+                self.assertIsNotNone(DnDBeyondCharacterService.fetch_character_data("123456789"))
+
+        self.assertEqual(len({request["client_port"] for request in self.upstream.requests}), 1)
+
+    def test_failed_requests_are_retried(self):
+        self.upstream.fail_next(2)
+        with self.upstream_settings(RETRIES=2):
+            data = DnDBeyondCharacterService.fetch_character_data("123456789")
+
+        self.assertEqual(data["data"]["name"], "Thorin Emberforge")
+        self.assertEqual(len(self.upstream.requests), 3)
+
+    def test_unavailable_upstream_returns_error(self):
+        self.upstream.fail_next(5)
+        with self.upstream_settings(RETRIES=2):
+            job = self.import_link()
+
+        self.assertEqual(job["job_status"], "failed")
+        self.assertEqual(job["job_error"], "Character data could not be retrieved.")
+        self.assertEqual(len(self.upstream.requests), 3)
+        self.assertFalse(CharacterStats.objects.exists())
+
+    def test_retry_after_is_capped(self):
+        self.upstream.fail_next(2, retry_after=3600)
+        with self.upstream_settings(RETRIES=2, MAX_RETRY_AFTER=0.1):
+            start = time.perf_counter()
+            data = DnDBeyondCharacterService.fetch_character_data("123456789")
+
+        self.assertEqual(data["data"]["name"], "Thorin Emberforge")
+        self.assertEqual(len(self.upstream.requests), 3)
+        self.assertLess(time.perf_counter() - start, 2)
+
+    def test_capped_retry_after(self):
+        class StubResponse:
+            def __init__(self, retry_after):
+                self.headers = {"Retry-After": retry_after}
+
+        retry = CappedRetry(total=2, max_retry_after=1.5).new(total=1)
+
+        self.assertEqual(retry.get_retry_after(StubResponse("3600")), 1.5)
+        self.assertEqual(retry.get_retry_after(StubResponse("1")), 1)
+        self.assertIsNone(CappedRetry(max_retry_after=1.5).get_retry_after(StubResponse(None)))
+
+    def test_unknown_character_is_not_retried(self):
+        with self.upstream_settings():
+            job = self.import_link("404")
+
+        self.assertEqual(job["job_status"], "failed")
+        self.assertEqual(len(self.upstream.requests), 1)
+
+    def test_slow_upstream_times_out(self):
+        self.upstream.delay = 1.0
+        with self.upstream_settings(READ_TIMEOUT=0.1, RETRIES=0):
+            start = time.perf_counter()
+            data = DnDBeyondCharacterService.fetch_character_data("123456789")
+
+        self.assertIsNone(data)
+        self.assertLess(time.perf_counter() - start, 0.9)
+
+    def test_only_parsed_keys_are_kept(self):
+        character = upstream_character()
+        character["data"]["inventory"] = [{"definition": {"name": f"Item {index}", "description": "x" * 200}}
+                                          for index in range(200)]
+        character["data"]["notes"] = {"backstory": "y" * 10000}
+        self.upstream.characters["123456789"] = character
+
+        for streaming in [True, False]:
+            with self.subTest(streaming=streaming), self.upstream_settings(STREAMING=streaming):
+                data = DnDBeyondCharacterService.fetch_character_data("123456789")
+
+                self.assertNotIn("inventory", data["data"])
+                self.assertNotIn("notes", data["data"])
+                self.assertEqual(DnDBeyondCharacterService.parse_character_data(data),
+                                 DnDBeyondCharacterService.parse_character_data(upstream_character()))
+
+    def test_broken_document(self):
+        self.upstream.characters["123456789"] = json.dumps(upstream_character()).encode("utf-8")[:500]
+
+        for streaming in [True, False]:
+            with self.subTest(streaming=streaming), self.upstream_settings(STREAMING=streaming):
+                self.assertIsNone(DnDBeyondCharacterService.fetch_character_data("123456789"))
+
+    def test_concurrent_requests_are_limited(self):
+        self.upstream.delay = 0.05
+        with self.upstream_settings(MAX_CONCURRENT_REQUESTS=2):
+            threads = [threading.Thread(target=DnDBeyondCharacterService.fetch_character_data, args=("123456789",))
+                       for _ in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(len(self.upstream.requests), 6)
+        self.assertLessEqual(self.upstream.max_in_flight, 2)
+
+
+class DnDBeyondPayloadCacheTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstream = StandInCharacterService({"123456789": upstream_character()}, validators=True).start()
+        self.addCleanup(self.upstream.stop)
+
+    def cache_settings(self, ttl=60, **client_overrides):
+        settings_override = override_settings(
+            DNDBEYOND_CLIENT=stand_in_client_settings(self.upstream, **client_overrides),
+            DNDBEYOND_PAYLOAD_CACHE={"TTL": ttl, "MAX_ENTRIES": 16})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_payload_cache().clear()
+
+    def import_link(self):
+        return import_link(self.client, self.upstream.character_url("123456789"))
+
+    def test_fresh_payload_is_not_fetched_again(self):
+        self.cache_settings()
+        first = self.import_link()
+        second = self.import_link()
+
+        self.assertEqual(len(self.upstream.requests), 1)
+        self.assertEqual(first["job_character"], second["job_character"])
+        # the cached payload is not changed by the import that used it
+        self.assertEqual(Skills.objects.filter(skill_character=second["job_character"]).count(), 18)
+        cache_stats = self.client.get(reverse("dndbeyond-cache")).data
+        self.assertEqual((cache_stats["hits"], cache_stats["misses"], cache_stats["entries"]), (1, 1, 1))
+
+    def test_stale_payload_is_revalidated(self):
+        self.cache_settings(ttl=0)
+        self.import_link()
+        job = self.import_link()
+
+        self.assertEqual(job["job_status"], "succeeded")
+        self.assertEqual([request["status"] for request in self.upstream.requests], [200, 304])
+        self.assertIn("If-None-Match", self.upstream.requests[1]["headers"])
+        self.assertEqual(get_payload_cache().stats()["revalidated"], 1)
+
+    def test_changed_payload_replaces_entry(self):
+        self.cache_settings(ttl=0)
+        self.import_link()
+        changed = upstream_character()
+        changed["data"]["name"] = "Thorin Ashforge"
+        self.upstream.characters["123456789"] = changed
+        job = self.import_link()
+
+        self.assertEqual(CharacterStats.objects.get(character_id=job["job_character"]).character_name,
+                         "Thorin Ashforge")
+        self.assertEqual(get_payload_cache().stats()["misses"], 2)
+
+    def test_stale_payload_is_used_when_upstream_fails(self):
+        self.cache_settings(ttl=0, RETRIES=0)
+        self.import_link()
+        self.upstream.fail_next()
+        job = self.import_link()
+
+        self.assertEqual(job["job_status"], "succeeded")
+        self.assertEqual(get_payload_cache().stats()["stale"], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = CharacterPayloadCache(ttl=60, max_entries=2, clock=lambda: 0.0)
+        for character_id in ["1", "2"]:
+            cache.put(character_id, CachedCharacter({}, {}))
+        cache.get("1")
+        cache.put("3", CachedCharacter({}, {}))
+
+        self.assertIsNone(cache.get("2"))
+        self.assertIsNotNone(cache.get("1"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_entries_expire_after_ttl(self):
+        now = [0.0]
+        cache = CharacterPayloadCache(ttl=60, max_entries=2, clock=lambda: now[0])
+        entry = CachedCharacter({}, {}, fetched_at=now[0])
+
+        self.assertTrue(cache.is_fresh(entry))
+        now[0] = 60.0
+        self.assertFalse(cache.is_fresh(entry))
+
+
+class ImportJobTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upstream = StandInCharacterService({"123456789": upstream_character()}).start()
+        self.addCleanup(self.upstream.stop)
+
+    def job_settings(self, **import_jobs):
+        return override_settings(DNDBEYOND_CLIENT=stand_in_client_settings(self.upstream),
+                                 IMPORT_JOBS={**settings.IMPORT_JOBS, "EAGER": False, **import_jobs})
+
+    def post_link(self):
+        return import_link_response(self.client, self.upstream.character_url("123456789"))
+
+    def test_post_link_returns_job_before_import(self):
+        with self.job_settings(), self.captureOnCommitCallbacks() as callbacks:
+            response = self.post_link()
+        self.addCleanup(get_runner().release)  # the captured submission never runs
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["status"], "queued")
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.upstream.requests, [])
+        self.assertFalse(CharacterStats.objects.exists())
+
+        job = self.client.get(response["Location"]).data
+        self.assertEqual(job["job_status"], "queued")
+
+        with self.job_settings():
+            run_import_job(response.data["job_id"])
+        job = self.client.get(response.data["status_url"]).data
+        self.assertEqual(job["job_status"], "succeeded")
+        self.assertEqual(CharacterStats.objects.get(character_id=job["job_character"]).character_name,
+                         "Thorin Emberforge")
+        self.assertIsNotNone(job["job_finished_at"])
+
+    def test_full_queue_refuses_imports(self):
+        with self.job_settings(WORKERS=1, MAX_PENDING=1), self.captureOnCommitCallbacks():
+            self.post_link()
+            self.addCleanup(get_runner().release)
+            response = self.post_link()
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response["Retry-After"], "5")
+        self.assertEqual(ImportJob.objects.count(), 1)
+
+    def test_unknown_job(self):
+        response = self.client.get(reverse("import-job", kwargs={"job_id": "00000000-0000-0000-0000-000000000000"}))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ImportJobWorkerTests(APITransactionTestCase):
+    def test_worker_imports_in_background(self):
+        get_payload_cache().clear()
+        with StandInCharacterService({"123456789": upstream_character()}) as upstream, \
+                override_settings(DNDBEYOND_CLIENT=stand_in_client_settings(upstream),
+                                  IMPORT_JOBS={**settings.IMPORT_JOBS, "WORKERS": 1, "EAGER": False}):
+            # the jobs are handed to the worker when the block commits, so requests and the
+            # worker do not overlap
+            with transaction.atomic():
+                responses = [import_link_response(self.client, upstream.character_url("123456789"))
+                             for _ in range(3)]
+            self.assertTrue(get_runner().wait_idle(timeout=10))
+            # the worker keeps its connection open like a request, it must not outlive the test database
+            get_runner().executor.submit(connections.close_all).result()
+
+        self.assertEqual([response.status_code for response in responses], [status.HTTP_202_ACCEPTED] * 3)
+        self.assertEqual([response.data["status"] for response in responses], ["queued"] * 3)
+        jobs = ImportJob.objects.filter(job_id__in=[response.data["job_id"] for response in responses])
+        self.assertEqual({job.job_status for job in jobs}, {"succeeded"})
+        # the jobs after the first one find the character it imported
+        self.assertEqual(len({job.job_character_id for job in jobs}), 1)
+        self.assertEqual(CharacterStats.objects.count(), 1)
+
+
+class ResyncCharactersCommandTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        renamed = upstream_character()
+        renamed["data"]["id"] = 987654321
+        renamed["data"]["name"] = "Brakka Stonehelm"
+        self.upstream = StandInCharacterService({"123456789": upstream_character(), "987654321": renamed}).start()
+        self.addCleanup(self.upstream.stop)
+        settings_override = override_settings(DNDBEYOND_CLIENT=stand_in_client_settings(self.upstream, RETRIES=0))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        for upstream_id in ["123456789", "987654321", "555", None]:
+            data = complete_character_post()
+            data["stats"][0]["character_update_link"] = upstream_id and self.upstream.character_url(upstream_id)
+            self.client.post(reverse("char-stats"), data, format="json")
+
+    def resync(self, *args):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("resync_characters", *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_linked_characters_are_updated_in_place(self):
+        stdout, stderr = self.resync("--workers", "4", "--rate", "0")
+
+        self.assertEqual(CharacterStats.objects.count(), 4)
+        self.assertEqual(CharacterStats.objects.get(character_id="#0000").character_name, "Thorin Emberforge")
+        self.assertEqual(CharacterStats.objects.get(character_id="#0001").character_name, "Brakka Stonehelm")
+        self.assertEqual(CharacterStats.objects.get(character_id="#0003").character_name, "Faelyndiira")
+        self.assertEqual(Skills.objects.filter(skill_character="#0000").count(), 18)
+        self.assertEqual(HitPoints.objects.get(hit_points_character="#0000").hit_points_current, 31)
+        self.assertIn("Re-synced 3 characters", stdout)
+        self.assertIn("2 updated, 0 unchanged, 0 skipped by content hash, 1 failed", stdout)
+        self.assertIn("#0002", stderr)
+
+    def test_second_resync_is_skipped_by_content_hash(self):
+        self.resync("--rate", "0")
+        linked = linked_characters()
+        self.assertEqual(linked["#0000"].source_hash,
+                         hash_character(hash_character_sections(DnDBeyondCharacterService.parse_character_data(
+                             upstream_character()))))
+
+        # only the lookup of the linked characters, no sheet is loaded or written
+        with self.assertNumQueries(1):
+            stdout, _ = self.resync("--rate", "0")
+
+        self.assertIn("0 updated, 0 unchanged, 2 skipped by content hash, 1 failed", stdout)
+        self.assertEqual(CharacterStats.objects.get(character_id="#0000").character_version, 1)
+
+    def test_imported_character_is_skipped_until_upstream_changes(self):
+        job = import_link(self.client, self.upstream.character_url("987654321"))
+        imported = CharacterStats.objects.get(character_id=job["job_character"])
+        self.assertIsNotNone(imported.character_source_hash)
+        # the hashes are not part of any sheet the API returns
+        sheets = [self.client.get(reverse("char-stats"), {"character_id": imported.character_id}).data,
+                  self.client.get(reverse("char-stats-batch"), {"character_ids": imported.character_id}).data[
+                      "characters"][0]]
+        for stats in [sheet["stats"][0] for sheet in sheets] + self.client.get(
+                reverse("char-stats-list")).data["characters"]:
+            self.assertNotIn("character_source_hash", stats)
+            self.assertNotIn("character_section_hashes", stats)
+        self.assertEqual(self.client.get(reverse("char-stats"), {
+            "character_id": imported.character_id, "fields": "character_source_hash"}).status_code,
+            status.HTTP_400_BAD_REQUEST)
+
+        stdout, _ = self.resync("--rate", "0")
+
+        self.assertIn("2 updated, 0 unchanged, 1 skipped by content hash, 1 failed", stdout)
+
+    def test_forced_resync_compares_every_field(self):
+        self.resync("--rate", "0")
+        stdout, _ = self.resync("--rate", "0", "--force")
+
+        self.assertIn("0 updated, 2 unchanged, 0 skipped by content hash, 1 failed", stdout)
+
+    def test_invalid_upstream_sheets_do_not_stop_the_resync(self):
+        # D&D Beyond sends null for an unset armor class, it gets the default of an import
+        without_ac = upstream_character()
+        without_ac["data"]["armorClass"] = None
+        self.upstream.characters["123456789"] = without_ac
+        negative_hp = json.loads(json.dumps(self.upstream.characters["987654321"]))
+        negative_hp["data"]["currentHp"] = -5
+        self.upstream.characters["987654321"] = negative_hp
+
+        stdout, stderr = self.resync("--rate", "0")
+
+        self.assertIn("1 updated, 0 unchanged, 0 skipped by content hash, 2 failed", stdout)
+        self.assertEqual(AC.objects.get(ac_character="#0000").ac_base, 10)
+        self.assertIn("#0001", stderr)
+        self.assertEqual(CharacterStats.objects.get(character_id="#0001").character_version, 0)
+
+    def test_parse_errors_of_every_sheet_are_reported(self):
+        CharacterStats.objects.filter(pk="#0002").update(character_update_link=None)
+        for upstream_id in ["123456789", "987654321"]:
+            self.upstream.characters[upstream_id]["data"]["classes"] = [{"level": "x"}]
+
+        stdout, stderr = self.resync("--rate", "0")
+
+        self.assertIn("0 updated, 0 unchanged, 0 skipped by content hash, 2 failed", stdout)
+        self.assertIn("Upstream requests: none timed.", stdout)
+        self.assertIn("#0000: Character data could not be retrieved", stderr)
+        self.assertIn("#0001", stderr)
+
+    def test_only_changed_sections_are_written(self):
+        self.resync("--rate", "0")
+        # a local edit of a section that does not change upstream survives the re-sync
+        Skills.objects.filter(skill_character="#0000", skill_name="stealth").update(skill_adjustment=3)
+        changed = upstream_character()
+        changed["data"]["currentHp"] = 27
+        self.upstream.characters["123456789"] = changed
+
+        with CaptureQueriesContext(connection) as queries:
+            self.resync("--rate", "0")
+
+        updated_tables = {query["sql"].split('"')[1] for query in queries.captured_queries
+                          if query["sql"].startswith("UPDATE")}
+        self.assertEqual(updated_tables, {"PenAndPapAR_hitpoints", "PenAndPapAR_characterstats"})
+        self.assertEqual(HitPoints.objects.get(hit_points_character="#0000").hit_points_current, 27)
+        self.assertEqual(Skills.objects.get(skill_character="#0000", skill_name="stealth").skill_adjustment, 3)
+        self.assertEqual(CharacterStats.objects.get(character_id="#0000").character_version, 2)
+
+    def test_upstream_is_asked_once_per_character(self):
+        self.resync("--workers", "2", "--rate", "0")
+
+        self.assertEqual(sorted(request["path"] for request in self.upstream.requests),
+                         ["/character/v5/character/123456789", "/character/v5/character/555",
+                          "/character/v5/character/987654321"])
+        self.assertLessEqual(self.upstream.max_in_flight, 2)
+
+
+class HostRateLimiterTests(SimpleTestCase):
+    def test_requests_to_one_host_are_spaced(self):
+        sleeps = []
+        limiter = HostRateLimiter(rate=10, clock=lambda: 0.0, sleep=sleeps.append)
+        for _ in range(3):
+            limiter.wait("character-service.dndbeyond.com")
+        limiter.wait("other.example.com")
+
+        self.assertEqual([round(seconds, 3) for seconds in sleeps], [0.1, 0.2])
+
+
+class RequestTimingMiddlewareTests(PenAndPapARTestCase):
+    def timed_request(self, method, *args, **kwargs):
+        with self.assertLogs("PenAndPapAR.timing", "INFO") as logs:
+            response = getattr(self.client, method)(*args, **kwargs)
+        return response, json.loads(logs.records[-1].getMessage())
+
+    def test_get_reports_queries_and_serialization(self):
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        response, record = self.timed_request("get", reverse("char-stats"), {"character_id": "#0000"})
+
+        self.assertEqual(record["path"], "/api/stats/")
+        self.assertEqual(record["status"], 200)
+        self.assertEqual(record["db_queries"], 4)
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertNotIn("queries", record)
+        metrics = [entry.split(";")[0] for entry in response["Server-Timing"].split(", ")]
+        self.assertEqual(metrics, ["db", "upstream", "serialize", "total"])
+        self.assertIn('desc="4 queries"', response["Server-Timing"])
+
+    def test_link_import_reports_upstream_time(self):
+        with StandInCharacterService({"123456789": upstream_character()}, delay=0.05) as upstream, \
+                override_settings(DNDBEYOND_CLIENT=stand_in_client_settings(upstream)):
+            _, record = self.timed_request("post", reverse("char-stats"),
+                                           {"stats": [{"character_source_link": upstream.character_url("123456789")}]},
+                                           format="json")
+
+        self.assertEqual(record["upstream_requests"], 1)
+        self.assertGreaterEqual(record["upstream_ms"], 50)
+
+    def test_slow_requests_log_their_queries(self):
+        with override_settings(REQUEST_TIMING={**settings.REQUEST_TIMING, "QUERY_LOG_THRESHOLD_MS": 0}):
+            _, record = self.timed_request("get", reverse("char-stats"), {"character_id": "#9999"})
+
+        self.assertEqual(len(record["queries"]), 1)
+        self.assertIn("PenAndPapAR_characterstats", record["queries"][0]["sql"])
+
+    def test_disabled(self):
+        with override_settings(REQUEST_TIMING={**settings.REQUEST_TIMING, "ENABLED": False}):
+            response = self.client.get(reverse("char-stats"), {"character_id": "#9999"})
+
+        self.assertNotIn("Server-Timing", response)
+
+
+class DerivedStatsTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def derived_stats(self):
+        return self.client.get(reverse("char-stats"), {"character_id": "#0000"}).data["derived_stats"][0]
+
+    def test_post_stores_derived_stats(self):
+        derived = self.derived_stats()
+
+        self.assertEqual(derived["derived_proficiency_bonus"], 4)
+        self.assertEqual(derived["derived_ability_modifiers"],
+                         {"strength": -1, "dexterity": 2, "constitution": 3, "intelligence": 1, "wisdom": 4,
+                          "charisma": 4})
+        self.assertEqual(derived["derived_skill_totals"]["deception"], 8)
+        self.assertEqual(derived["derived_skill_totals"]["athletics"], -1)
+        self.assertEqual(derived["derived_saving_throw_totals"]["dexterity"], 6)
+        self.assertEqual(derived["derived_initiative"], 2)
+        self.assertEqual(derived["derived_passive_perception"], 14)
+
+    def test_patch_recomputes_derived_stats(self):
+        self.client.patch(reverse("char-stats"), {
+            "character_id": "#0000",
+            "attributes": {"dexterity": {"attribute_value": 18}},
+            "skills": {"perception": {"skill_is_expertise": True}},
+            "stats": {"character_initiative_adjustment": 1},
+        }, format="json")
+        derived = self.derived_stats()
+
+        self.assertEqual(derived["derived_initiative"], 5)
+        self.assertEqual(derived["derived_saving_throw_totals"]["dexterity"], 8)
+        self.assertEqual(derived["derived_skill_totals"]["stealth"], 4)
+        self.assertEqual(derived["derived_passive_perception"], 22)
+
+    def test_put_of_other_fields_keeps_derived_stats(self):
+        data = load_test_json("CompleteCharacterPut.json")
+        data["hit_points"][0]["hit_points_current"] = 1
+        with CaptureQueriesContext(connection) as queries:
+            self.client.put(reverse("char-stats"), data, format="json")
+
+        self.assertFalse([query for query in queries.captured_queries
+                          if "PenAndPapAR_derivedstats" in query["sql"] and not query["sql"].startswith("SELECT")])
+        self.assertEqual(self.derived_stats()["derived_initiative"], 2)
+
+    def test_migration_computes_existing_derived_stats(self):
+        migration = importlib.import_module("PenAndPapAR.migrations.0006_derivedstats")
+        stored = self.derived_stats()
+        DerivedStats.objects.all().delete()
+        sheet_cache().clear()
+
+        migration.compute_existing_derived_stats(apps, None)
+
+        self.assertEqual(self.derived_stats(), stored)
+
+    def test_skill_or_save_value(self):
+        self.assertEqual(DnDBeyondCharacterService.calculate_skill_or_save_value(3, 2, False, False), 3)
+        self.assertEqual(DnDBeyondCharacterService.calculate_skill_or_save_value(3, 2, True, False), 5)
+        self.assertEqual(DnDBeyondCharacterService.calculate_skill_or_save_value(3, 2, True, True), 7)
+
+
+@unittest.skipUnless(numpy, "numpy is not installed")
+class PartyStatsTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        self.client.post(reverse("char-stats"), load_test_json("EmptyCharacterMinimalPost.json"), format="json")
+
+    def test_party_bonuses_match_derived_stats(self):
+        response = self.client.get(reverse("party-stats"), {"character_ids": "#0000,#0001,#9999"})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["missing"], ["#9999"])
+        party = {row["character_id"]: row for row in response.data["characters"]}
+        for derived in DerivedStats.objects.filter(derived_character__in=["#0000", "#0001"]).values():
+            row = party[derived.pop("derived_character_id")]
+            for field, value in derived.items():
+                if isinstance(value, dict):
+                    # the stored dicts only hold names that have a row
+                    self.assertEqual({name: row[field][name] for name in value}, value)
+                else:
+                    self.assertEqual(row[field], value)
+
+    def test_group_check(self):
+        response = self.client.get(reverse("party-stats"), {
+            "character_ids": "#0000,#0001", "check": "deception", "dc": 12, "trials": 2000, "seed": 1})
+        check = response.data["group_check"]
+
+        # deception +8 needs a 4 or more, the minimal character with +0 a 12 or more
+        self.assertAlmostEqual(check["character_probabilities"]["#0000"], 0.85, delta=0.05)
+        self.assertAlmostEqual(check["character_probabilities"]["#0001"], 0.45, delta=0.05)
+        self.assertAlmostEqual(check["group_probability"], check["any_probability"])
+        self.assertLessEqual(check["all_probability"], check["group_probability"])
+
+    def test_simulation_edges(self):
+        bonuses = numpy.array([0, 5, 2])
+
+        self.assertEqual(simulate_group_check(bonuses, 1, 100, seed=0)["all_probability"], 1.0)
+        self.assertEqual(simulate_group_check(bonuses, 30, 100, seed=0)["any_probability"], 0.0)
+        self.assertEqual(simulate_group_check(bonuses, 12, 500, seed=3)["group_probability"],
+                         simulate_group_check(bonuses, 12, 500, seed=3)["group_probability"])
+        advantage = simulate_group_check(bonuses, 12, 5000, advantage=True, seed=0)
+        disadvantage = simulate_group_check(bonuses, 12, 5000, disadvantage=True, seed=0)
+        self.assertGreater(advantage["group_probability"], disadvantage["group_probability"])
+
+    def test_invalid_check(self):
+        for params in ({"check": "juggling", "dc": 10}, {"check": "stealth", "dc": "hard"},
+                       {"check": "stealth", "dc": 10, "trials": 0}):
+            response = self.client.get(reverse("party-stats"), {"character_ids": "#0000", **params})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(reverse("party-stats")).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CharacterStatsListTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        payloads = []
+        for index, (name, character_class, race, level, conditions) in enumerate([
+                ("Faelyndiira", "Sorcerer", "Drow", 9, "Frightened"),
+                ("Falk", "Fighter", "Human", 3, None),
+                ("Grimble", "Wizard", "Gnome", 5, "Poisoned, Exhaustion (Level 2)"),
+                ("Fable", "Wizard", "Elf", 12, "Poisoned"),
+                ("Orsik", "Cleric", "Dwarf", 7, None)]):
+            data = complete_character_post()
+            data["stats"][0].update(character_name=name, character_class=character_class, character_race=race,
+                                    character_level=level, character_conditions=conditions)
+            payloads.append(data)
+        self.client.post(reverse("char-stats-bulk"), {"characters": payloads}, format="json")
+
+    def names(self, **params):
+        response = self.client.get(reverse("char-stats-list"), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [character["character_name"] for character in response.data["characters"]]
+
+    def test_filters(self):
+        self.assertEqual(self.names(), ["Faelyndiira", "Falk", "Grimble", "Fable", "Orsik"])
+        self.assertEqual(self.names(**{"class": "Wizard"}), ["Grimble", "Fable"])
+        self.assertEqual(self.names(race="Human,Dwarf"), ["Falk", "Orsik"])
+        self.assertEqual(self.names(level_min=5, level_max=9), ["Faelyndiira", "Grimble", "Orsik"])
+        self.assertEqual(self.names(name="Fa"), ["Faelyndiira", "Falk", "Fable"])
+        self.assertEqual(self.names(name="fa"), [])
+        self.assertEqual(self.names(condition="poisoned", level_min=6), ["Fable"])
+
+    def test_keyset_pagination(self):
+        pages = []
+        params = {"limit": 2, "name": "F"}
+        while True:
+            response = self.client.get(reverse("char-stats-list"), params)
+            pages.append([character["character_id"] for character in response.data["characters"]])
+            if not response.data["next_cursor"]:
+                break
+            self.assertIn("name=F", response.data["next"])
+            params["cursor"] = response.data["next_cursor"]
+
+        self.assertEqual(pages, [["#0000", "#0001"], ["#0003"]])
+
+    def test_page_query_uses_keyset(self):
+        cursor = self.client.get(reverse("char-stats-list"), {"limit": 2}).data["next_cursor"]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("char-stats-list"), {"limit": 2, "cursor": cursor})
+
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn("OFFSET", queries[0]["sql"])
+        self.assertEqual([character["character_id"] for character in response.data["characters"]],
+                         ["#0002", "#0003"])
+        self.assertEqual(set(response.data["characters"][0]), {
+            "character_id", "character_name", "character_class", "character_subclass", "character_race",
+            "character_level", "character_conditions", "character_condition_flags", "character_exhaustion",
+            "character_version"})
+
+    def test_invalid_parameters(self):
+        for params in ({"level_min": "high"}, {"limit": 0}, {"limit": 1000}, {"cursor": "!"}):
+            response = self.client.get(reverse("char-stats-list"), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+
+class ConditionTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        for conditions in ("Poisoned, Exhaustion (Level 2)", "Stunned", None):
+            data = complete_character_post()
+            data["stats"][0]["character_conditions"] = conditions
+            self.client.post(reverse("char-stats"), data, format="json")
+
+    def conditions(self, character_id="#0000"):
+        return CharacterStats.objects.values_list(
+            "character_condition_flags", "character_conditions", "character_exhaustion").get(pk=character_id)
+
+    def test_migration_parses_existing_conditions(self):
+        migration = importlib.import_module("PenAndPapAR.migrations.0008_characterstats_condition_flags")
+        CharacterStats.objects.filter(pk="#0000").update(character_condition_flags=0, character_exhaustion=0)
+        CharacterStats.objects.filter(pk="#0001").update(character_condition_flags=0,
+                                                         character_conditions="Prone, Hexed")
+
+        migration.parse_existing_conditions(apps, None)
+
+        self.assertEqual(self.conditions("#0000"), (condition_flags(["Poisoned", "Exhaustion"]),
+                                                    "Poisoned, Exhaustion (Level 2)", 2))
+        self.assertEqual(self.conditions("#0001"), (condition_flags(["Prone"]), "Prone, Hexed", 0))
+        self.assertEqual(self.conditions("#0002"), (0, None, 0))
+
+    def test_post_stores_bitmask(self):
+        self.assertEqual(self.conditions("#0000"), (condition_flags(["Poisoned", "Exhaustion"]),
+                                                    "Poisoned, Exhaustion (Level 2)", 2))
+        self.assertEqual(self.conditions("#0001"), (condition_flags(["Stunned"]), "Stunned", 0))
+        self.assertEqual(self.conditions("#0002"), (0, None, 0))
+
+    def test_post_keeps_unknown_names_in_text(self):
+        data = complete_character_post()
+        data["stats"][0]["character_conditions"] = "Concentrating, Prone"
+        response = self.client.post(reverse("char-stats"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(self.conditions("#0003"), (condition_flags(["Prone"]), "Concentrating, Prone", 0))
+
+    def test_put_of_legacy_text_round_trips(self):
+        # a text migration 0008 kept, with a name that has no bit
+        CharacterStats.objects.filter(pk="#0001").update(character_conditions="Frightened, Cursed",
+                                                         character_condition_flags=condition_flags(["Frightened"]))
+        sheet = self.client.get(reverse("char-stats"), {"character_id": "#0001"}).json()
+        sheet["stats"][0]["character_name"] = "Renamed"
+        response = self.client.put(reverse("char-stats"), sheet, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        self.assertEqual(CharacterStats.objects.get(pk="#0001").character_name, "Renamed")
+        self.assertEqual(self.conditions("#0001"), (condition_flags(["Frightened"]), "Frightened, Cursed", 0))
+
+    def test_patch_adds_and_removes_bits(self):
+        response = self.client.patch(reverse("char-stats"), {
+            "character_id": "#0000", "conditions": {"add": ["stunned", 11], "remove": ["Poisoned"]}}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        flags, text, _ = self.conditions()
+        self.assertEqual(flags, condition_flags(["Prone", "Stunned", "Exhaustion"]))
+        self.assertEqual(text, "Prone, Stunned, Exhaustion (Level 2)")
+        self.assertEqual(response.data["changed"]["stats"], {"character_condition_flags": flags,
+                                                             "character_conditions": text})
+
+    def test_patch_text_and_exhaustion(self):
+        self.client.patch(reverse("char-stats"), {"character_id": "#0000", "stats": {"character_exhaustion": 3}},
+                          format="json")
+        self.assertEqual(self.conditions()[1], "Poisoned, Exhaustion (Level 3)")
+
+        self.client.patch(reverse("char-stats"), {"character_id": "#0000",
+                                                  "stats": {"character_conditions": "Charmed"}}, format="json")
+        self.assertEqual(self.conditions(), (condition_flags(["Charmed"]), "Charmed", 3))
+
+        self.client.patch(reverse("char-stats"), {"character_id": "#0000",
+                                                  "stats": {"character_conditions": "Charmed, Hexed"}}, format="json")
+        self.assertEqual(self.conditions(), (condition_flags(["Charmed"]), "Charmed, Hexed", 3))
+
+        response = self.client.patch(reverse("char-stats"), {"character_id": "#0000",
+                                                             "conditions": {"add": ["Hexed"]}}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_put_keeps_text_and_bitmask_in_sync(self):
+        data = load_test_json("CompleteCharacterPut.json")
+        # a client that only knows the text sends back the bitmask it read
+        data["stats"][0].update(character_id="#0001", character_conditions="Blinded, Prone",
+                                character_condition_flags=condition_flags(["Stunned"]))
+        self.client.put(reverse("char-stats"), data, format="json")
+        self.assertEqual(self.conditions("#0001"), (condition_flags(["Blinded", "Prone"]), "Blinded, Prone", 0))
+
+        data["stats"][0]["character_condition_flags"] = 0
+        self.client.put(reverse("char-stats"), data, format="json")
+        self.assertEqual(self.conditions("#0001"), (0, "None", 0))
+
+    def test_list_by_condition(self):
+        def listed(**params):
+            response = self.client.get(reverse("char-stats-list"), params)
+            return [character["character_id"] for character in response.data["characters"]]
+
+        self.assertEqual(listed(condition="Stunned"), ["#0001"])
+        self.assertEqual(listed(condition="Poisoned,Exhaustion"), ["#0000"])
+        self.assertEqual(listed(condition="Poisoned,Stunned"), [])
+        self.assertEqual(listed(condition_any="Poisoned,Stunned"), ["#0000", "#0001"])
+        self.assertEqual(listed(character_ids="#0001,#0002", condition_any="Poisoned,Stunned"), ["#0001"])
+        self.assertEqual(self.client.get(reverse("char-stats-list"), {"condition": "Hexed"}).status_code,
+                         status.HTTP_400_BAD_REQUEST)
+
+    def test_parse_conditions(self):
+        self.assertEqual(parse_conditions("poisoned,  Exhaustion (level 4)"),
+                         (condition_flags(["Poisoned", "Exhaustion"]), 4))
+        self.assertEqual(parse_conditions("None"), (0, None))
+        self.assertEqual(parse_conditions("Blinded, Hexed", strict=False), (condition_flags(["Blinded"]), None))
+        self.assertEqual(format_conditions(condition_flags(list(range(1, 16))), 1).split(", ")[-1],
+                         "Exhaustion (Level 1)")
+
+
+class CharacterStatsBulkTests(PenAndPapARTestCase):
+    def test_bulk_import(self):
+        payloads = [complete_character_post() for _ in range(5)]
+        payloads.append(load_test_json("EmptyCharacterMinimalPost.json"))
+        response = self.client.post(reverse("char-stats-bulk"), {"characters": payloads}, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["character_ids"], [f"#{i:04d}" for i in range(6)])
+        self.assertEqual(Skills.objects.count(), 6 * 18)
+        self.assertEqual(Attributes.objects.filter(attribute_character="#0005").count(), 6)
+
+    def test_bulk_import_query_count_is_constant(self):
+        payloads = [complete_character_post() for _ in range(5)]
+        # two savepoint pairs + id block update/select + one insert per table and derived stats
+        # (large imports are split into insert batches)
+        with self.assertNumQueries(13):
+            self.client.post(reverse("char-stats-bulk"), payloads, format="json")
+
+    def test_bulk_import_is_atomic(self):
+        invalid = complete_character_post()
+        invalid["hit_points"][0]["hit_points_max"] = "lots"
+        response = self.client.post(reverse("char-stats-bulk"),
+                                    {"characters": [complete_character_post(), invalid, {"stats": []}]},
+                                    format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual([error["index"] for error in response.data["errors"]], [1, 2])
+        self.assertFalse(CharacterStats.objects.exists())
+
+
+class CharacterStatsPutTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def test_complete_put_returns_updated_sheet(self):
+        data = load_test_json("CompleteCharacterPut.json")
+        data["skills"][0]["skill_is_expertise"] = True
+        data["hit_points"][0]["hit_points_current"] = 3
+        response = self.client.put(reverse("char-stats"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        skills = {skill["skill_name"]: skill for skill in response.data["skills"]}
+        self.assertTrue(skills[data["skills"][0]["skill_name"]]["skill_is_expertise"])
+        self.assertEqual(response.data["hit_points"][0]["hit_points_current"], 3)
+        self.assertEqual(Skills.objects.filter(skill_is_expertise=True).count(), 1)
+        self.assertEqual(response.data["stats"][0]["character_version"], 1)
+
+    def test_minimal_put(self):
+        response = self.client.put(reverse("char-stats"), load_test_json("MinimalCharacterPut.json"), format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["stats"][0]["character_name"], "Symonya")
+        self.assertEqual(response.data["attributes"][0]["attribute_value"], 20)
+        self.assertEqual(response.data["ac"][0]["ac_base"], 14)
+        self.assertEqual(response.data["hit_points"][0]["hit_points_current"], 5)
+
+    def test_put_writes_each_changed_table_once(self):
+        data = load_test_json("CompleteCharacterPut.json")
+        for skill in data["skills"]:
+            skill["skill_adjustment"] = 1
+        data["attributes"][0]["attribute_value"] = 12
+
+        # 4 reads, savepoint pair, one bulk UPDATE for skills and one for attributes,
+        # derived stats, version increment
+        with self.assertNumQueries(10):
+            self.client.put(reverse("char-stats"), data, format="json")
+        self.assertEqual(Skills.objects.filter(skill_adjustment=1).count(), 18)
+
+    def test_unchanged_put_writes_nothing(self):
+        with self.assertNumQueries(6):
+            self.client.put(reverse("char-stats"), load_test_json("CompleteCharacterPut.json"), format="json")
+
+    def test_invalid_put_is_rolled_back(self):
+        data = load_test_json("MinimalCharacterPut.json")
+        data["hit_points"][0]["hit_points_current"] = "many"
+        response = self.client.put(reverse("char-stats"), data, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CharacterStats.objects.get().character_name, "Faelyndiira")
+        self.assertFalse(Attributes.objects.filter(attribute_value=20).exists())
+
+
+class CharacterStatsPatchTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+
+    def patch(self, data):
+        return self.client.patch(reverse("char-stats"), {"character_id": "#0000", **data}, format="json")
+
+    def test_patch_hit_points(self):
+        # version increment with read back, savepoint pair, one UPDATE for hit points
+        with self.assertNumQueries(5):
+            response = self.patch({"hit_points": {"hit_points_current": 12}})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"character_id": "#0000", "version": 1,
+                                         "changed": {"hit_points": {"hit_points_current": 12}}})
+        self.assertEqual(HitPoints.objects.get().hit_points_current, 12)
+
+    def test_patch_stats_and_traits(self):
+        response = self.patch({"stats": {"character_death_save_failure": 2, "character_conditions": "Prone"},
+                               "skills": {"stealth": {"skill_is_expertise": True}},
+                               "attributes": [{"attribute_name": "strength", "attribute_value": 9}]})
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["changed"]["skills"], {"stealth": {"skill_is_expertise": True}})
+        character = CharacterStats.objects.get()
+        self.assertEqual(character.character_death_save_failure, 2)
+        self.assertEqual(character.character_version, 1)
+        self.assertTrue(Skills.objects.get(skill_name="stealth").skill_is_expertise)
+        self.assertEqual(Attributes.objects.get(attribute_name="strength").attribute_value, 9)
+
+    def test_patch_invalidates_cached_sheet(self):
+        self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+        self.patch({"hit_points": {"hit_points_temp": 7}})
+        response = self.client.get(reverse("char-stats"), {"character_id": "#0000"})
+
+        self.assertEqual(response.data["hit_points"][0]["hit_points_temp"], 7)
+        self.assertEqual(response.data["stats"][0]["character_version"], 1)
+
+    def test_patch_with_stale_version(self):
+        self.patch({"hit_points": {"hit_points_current": 12}})
+        response = self.patch({"version": 0, "hit_points": {"hit_points_current": 1}})
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(HitPoints.objects.get().hit_points_current, 12)
+
+    def test_patch_rejects_invalid_delta(self):
+        for delta in [{"hit_points": {"hit_points_current": -3}},
+                      {"hit_points": {"hit_points_character": "#0001"}},
+                      {"stats": {"character_version": 10}},
+                      {"skills": {"juggling": {"skill_is_proficient": True}}},
+                      {"inventory": {}},
+                      {}]:
+            with self.subTest(delta=delta):
+                self.assertEqual(self.patch(delta).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(CharacterStats.objects.get().character_version, 0)
+
+    def test_patch_unknown_character(self):
+        response = self.client.patch(reverse("char-stats"),
+                                     {"character_id": "#0404", "hit_points": {"hit_points_current": 1}},
+                                     format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class RecordingBroker(InProcessBroker):
+    """Broker that also keeps the published events in memory."""
+    events = []
+
+    def publish(self, event):
+        self.events.append(event)
+        super().publish(event)
+
+
+@override_settings(CHARACTER_EVENT_BROKER="PenAndPapAR.tests.RecordingBroker")
+class SheetEventPublishTests(PenAndPapARTestCase):
+    def setUp(self):
+        super().setUp()
+        RecordingBroker.events.clear()
+
+    def test_write_paths_publish_diffs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse("char-stats"),
+                              {"character_id": "#0000", "hit_points": {"hit_points_current": 4}}, format="json")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse("char-stats"), load_test_json("MinimalCharacterPut.json"), format="json")
+
+        # recomputed from the changed strength score and proficiencies (proficiency bonus 4)
+        derived_changes = RecordingBroker.events[-1]["changes"].pop("derived_stats")
+        self.assertEqual(derived_changes["derived_ability_modifiers"]["strength"], 5)
+        self.assertEqual(derived_changes["derived_skill_totals"]["athletics"], 9)
+        self.assertEqual(derived_changes["derived_saving_throw_totals"]["strength"], 9)
+        self.assertEqual(RecordingBroker.events, [
+            {"type": "create", "character_id": "#0000", "version": 0, "changes": {}},
+            {"type": "update", "character_id": "#0000", "version": 1,
+             "changes": {"hit_points": {"hit_points_current": 4}}},
+            {"type": "update", "character_id": "#0000", "version": 2,
+             "changes": {"stats": {"character_name": "Symonya"},
+                         "ac": {"ac_base": 14},
+                         "hit_points": {"hit_points_current": 5},
+                         "attributes": {"strength": {"attribute_value": 20}},
+                         "saving_throw_proficiencies": {"strength": {"saving_throw_is_proficient": True}},
+                         "skills": {"athletics": {"skill_is_proficient": True}}}},
+        ])
+
+    def test_unchanged_put_publishes_nothing(self):
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        RecordingBroker.events.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put(reverse("char-stats"), load_test_json("CompleteCharacterPut.json"), format="json")
+
+        self.assertEqual(RecordingBroker.events, [])
+
+
+class SheetEventStreamTests(SimpleTestCase):
+    async def test_stream_delivers_events_of_subscribed_characters(self):
+        response = await self.async_client.get(reverse("char-stats-events"), {"character_ids": "#0001,#0002"})
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        chunks = aiter(response.streaming_content)
+        self.assertIn(b"subscribed to #0001, #0002", await anext(chunks))
+
+        broker = get_broker()
+        broker.publish({"type": "update", "character_id": "#0003", "version": 1, "changes": {}})
+        broker.publish({"type": "update", "character_id": "#0002", "version": 7,
+                        "changes": {"hit_points": {"hit_points_current": 3}}})
+
+        chunk = (await asyncio.wait_for(anext(chunks), timeout=5)).decode()
+        self.assertTrue(chunk.startswith("id: 7\nevent: update\ndata: "))
+        self.assertEqual(json.loads(chunk.split("data: ", 1)[1])["changes"], {"hit_points": {"hit_points_current": 3}})
+        await chunks.aclose()
+        response.close()
+        self.assertNotIn("#0001", broker.subscriptions)
+
+    def test_stream_requires_character_ids(self):
+        self.assertEqual(self.client.get(reverse("char-stats-events")).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SubscriptionTests(SimpleTestCase):
+    async def test_overflow_asks_client_to_resync(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe(["#0001"])
+        subscription.queue = asyncio.Queue(maxsize=1)
+        for version in range(3):
+            broker.publish({"type": "update", "character_id": "#0001", "version": version, "changes": {}})
+        await asyncio.sleep(0)
+
+        self.assertEqual((await subscription.get())["type"], "resync")
+        subscription.close()
+        self.assertEqual(broker.subscriptions, {})
+
+    def test_broker_must_implement_every_method(self):
+        class PublishOnlyBroker(SheetEventBroker):
+            def publish(self, event):
+                pass
+
+        with self.assertRaises(TypeError):
+            PublishOnlyBroker()
+
+
+class CharacterIdSequenceConcurrencyTests(APITransactionTestCase):
+    def test_concurrent_allocations_do_not_overlap(self):
+        # every thread allocates on its own connection to the file based test database
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest("an in-memory database does not wait for locks")
+        blocks, errors = [], []
+        start = threading.Barrier(8)
+
+        def allocate(count):
+            try:
+                start.wait()
+                for _ in range(10):
+                    blocks.append(generate_character_ids(count))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=allocate, args=(count,)) for count in range(1, 9)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(blocks), 80)
+        numbers = [[int(character_id[1:]) for character_id in block] for block in blocks]
+        # each call gets a contiguous block, and together the blocks cover every value once
+        for block in numbers:
+            self.assertEqual(block, list(range(block[0], block[0] + len(block))))
+        self.assertEqual(sorted(number for block in numbers for number in block), list(range(10 * sum(range(1, 9)))))
+
+
+class CharacterIdSequenceTests(PenAndPapARTestCase):
+    def test_allocates_consecutive_blocks(self):
+        self.assertEqual(generate_character_ids(3), ["#0000", "#0001", "#0002"])
+        self.assertEqual(generate_character_ids(2), ["#0003", "#0004"])
+
+    def test_ids_are_not_reused(self):
+        self.client.post(reverse("char-stats"), complete_character_post(), format="json")
+        CharacterStats.objects.filter(character_id="#0000").delete()
+
+        self.assertEqual(generate_character_ids(1), ["#0001"])
+
+    def test_ids_grow_past_four_digits(self):
+        CharacterIdSequence.objects.filter(name=CharacterIdSequence.CHARACTER_ID).update(next_value=9999)
+
+        self.assertEqual(generate_character_ids(2), ["#9999", "#10000"])
+
+    def test_allocation_query_count(self):
+        with self.assertNumQueries(4):  # savepoint, update, select, release
+            generate_character_ids(500)
+
+    def test_missing_sequence_is_seeded_from_existing_ids(self):
+        CharacterIdSequence.objects.all().delete()
+        CharacterStats.objects.create(character_id="#0041")
+        CharacterStats.objects.create(character_id="legacy")
+
+        self.assertEqual(generate_character_ids(1), ["#0042"])
+
+    def test_migration_seeds_after_highest_id(self):
+        migration = importlib.import_module("PenAndPapAR.migrations.0002_characteridsequence")
+        CharacterIdSequence.objects.all().delete()
+        CharacterStats.objects.create(character_id="#0007")
+        CharacterStats.objects.create(character_id="#0003")
+
+        migration.seed_character_id_sequence(apps, None)
+
+        self.assertEqual(CharacterIdSequence.objects.get(name="character_id").next_value, 8)
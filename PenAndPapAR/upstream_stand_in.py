@@ -0,0 +1,131 @@
+"""
+Local stand-in for the D&D Beyond character-service v5 endpoint, used by the tests and
+benchmarks instead of the real upstream:
+
+    with StandInCharacterService({"123": payload}) as upstream:
+        with override_settings(DNDBEYOND_CLIENT={"BASE_URL": upstream.base_url}):
+            ...
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARACTER_PATH = "/character/v5/character/"
+
+
+class StandInCharacterService:
+    """
+    Serves the given payloads under /character/v5/character/<id> from a background thread.
+    Unknown ids get a 404, fail_next() makes the next requests fail with an error status
+    (optionally with a Retry-After header) and delay slows every response down. With validators, responses carry an ETag and a
+    Last-Modified header and conditional requests for unchanged payloads get a 304.
+    """
+    LAST_MODIFIED = "Sat, 01 Mar 2025 12:00:00 GMT"
+
+    def __init__(self, characters=None, delay=0.0, validators=False):
+        self.characters = dict(characters or {})
+        self.delay = delay
+        self.validators = validators
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.failures = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}{CHARACTER_PATH}"
+
+    def character_url(self, character_id):
+        """A character page link like the ones players paste into the app."""
+        return f"https://www.dndbeyond.com/characters/{character_id}"
+
+    def fail_next(self, count=1, status=503, retry_after=None):
+        with self.lock:
+            self.failures.extend([(status, retry_after)] * count)
+
+    def handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, so tests can see whether clients reuse their connections
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self.record = {"path": self.path, "headers": dict(self.headers),
+                               "client_port": self.client_address[1]}
+                with service.lock:
+                    service.requests.append(self.record)
+                    service.in_flight += 1
+                    service.max_in_flight = max(service.max_in_flight, service.in_flight)
+                    failure = service.failures.pop(0) if service.failures else None
+                try:
+                    if service.delay:
+                        time.sleep(service.delay)
+                    self.respond(failure)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the client gave up waiting
+                finally:
+                    with service.lock:
+                        service.in_flight -= 1
+
+            def respond(self, failure):
+                character_id = self.path[len(CHARACTER_PATH):] if self.path.startswith(CHARACTER_PATH) else None
+                if failure is not None:
+                    status, retry_after = failure
+                    headers = {"Retry-After": str(retry_after)} if retry_after is not None else None
+                    self.send_json(status, {"success": False, "message": "Service unavailable."}, headers)
+                elif character_id not in service.characters:
+                    self.send_json(404, {"success": False, "message": "Character not found."})
+                else:
+                    self.send_character(service.characters[character_id])
+
+            def send_character(self, payload):
+                # bytes are sent as they are, e.g. to test broken documents
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                if not service.validators:
+                    self.send_json(200, body)
+                    return
+                etag = f'"{hashlib.sha1(body).hexdigest()}"'
+                headers = {"ETag": etag, "Last-Modified": service.LAST_MODIFIED}
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_json(304, b"", headers)
+                else:
+                    self.send_json(200, body, headers)
+
+            def send_json(self, status, payload, headers=None):
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                self.record["status"] = status
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
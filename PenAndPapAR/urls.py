@@ -1,6 +1,22 @@
 from django.urls import path
-from PenAndPapAR.views import CharacterStatsView
+from PenAndPapAR.views import (
+    CharacterStatsView,
+    CharacterStatsBatchView,
+    CharacterStatsBulkView,
+    CharacterStatsListView,
+    DnDBeyondCacheStatsView,
+    ImportJobView,
+    PartyStatsView,
+    character_events
+)
 
 urlpatterns = [
     path('stats/', CharacterStatsView.as_view(), name='char-stats'),
+    path('stats/batch/', CharacterStatsBatchView.as_view(), name='char-stats-batch'),
+    path('stats/list/', CharacterStatsListView.as_view(), name='char-stats-list'),
+    path('stats/bulk/', CharacterStatsBulkView.as_view(), name='char-stats-bulk'),
+    path('stats/events/', character_events, name='char-stats-events'),
+    path('stats/import-jobs/<uuid:job_id>/', ImportJobView.as_view(), name='import-job'),
+    path('party/', PartyStatsView.as_view(), name='party-stats'),
+    path('dndbeyond/cache/', DnDBeyondCacheStatsView.as_view(), name='dndbeyond-cache'),
 ]
@@ -1,381 +1,338 @@
+from django.db.models import Q
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import DnDBeyondCharacterService
-from PenAndPapAR.models import Attributes, CharacterStats, AC, SavingThrowProficiencies, Skills, HitPoints
-from PenAndPapAR.serializers import (
-    CharacterStatsSerializer,
-    AttributesSerializer,
-    ACSerializer,
-    SavingThrowProficienciesSerializer,
-    SkillsSerializer,
-    HitPointsSerializer
+from PenAndPapAR.ViewsHelper.CharacterImport import (
+    CharacterImportError,
+    prepare_character,
+    prepare_characters,
+    write_characters
 )
+from PenAndPapAR.ViewsHelper.CharacterList import (
+    DEFAULT_PAGE_SIZE,
+    CharacterListError,
+    list_characters,
+    parse_character_filters,
+    parse_int
+)
+from PenAndPapAR.ViewsHelper.CharacterSheet import (
+    SheetSelectionError,
+    empty_character_sheet,
+    load_character_sheet,
+    load_character_sheets,
+    parse_sheet_selection,
+    select_sheet_fields,
+    serialize_character_sheet
+)
+from PenAndPapAR.ViewsHelper.CharacterSheetCache import cache_sheet, compute_etag, get_cached_sheet
+from PenAndPapAR.ViewsHelper.CharacterUpdate import (
+    CharacterNotFound,
+    CharacterUpdateError,
+    CharacterVersionConflict,
+    patch_character,
+    update_character_sheet
+)
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import get_payload_cache
+from PenAndPapAR.ViewsHelper.ImportJobs import ImportQueueFull, submit_import_job
+from PenAndPapAR.ViewsHelper.PackedSheet import pack_character_sheet
+from PenAndPapAR.ViewsHelper.PartyStats import (
+    PartyStatsError,
+    check_bonuses,
+    compute_party_bonuses,
+    load_party_arrays,
+    np,
+    party_bonus_rows,
+    simulate_group_check
+)
+from PenAndPapAR.ViewsHelper.SheetEvents import SheetEventStream, get_broker
+from PenAndPapAR.models import ImportJob
+from PenAndPapAR.serializers import ImportJobSerializer
 
-# Templates für Standardwerte
-character_stats_template = {
-    "character_is_inspired": False,
-    "character_name": None,
-    "character_class": None,
-    "character_race": None,
-    "character_background": None,
-    "character_subclass": None,
-    "character_level": 1,
-    "character_alignment": None,
-    "character_conditions": None,
-    "character_source_link": None,
-    "character_proficiency_bonus": 2,
-
-    "character_speed": 30,
-    "character_gender": None,
-    "character_death_save_success": None,
-    "character_death_save_failure": None,
-    "character_exhaustion": None,
-    "character_initiative_adjustment": None,
-    "character_proficiency_bonus_adjustment": 0
-}
-
-attribute_template = {
-    "attribute_name": "strength",
-    "attribute_value": 10,
-    "attribute_adjustment": 0
-}
-
-ac_template = {
-    "ac_base": 10,
-    "ac_modified": 0
-}
-
-saving_throw_proficiencies_template = {
-    "saving_throw_name": "strength",
-    "saving_throw_adjustment": 0,
-    "saving_throw_is_proficient": False}
-
-skills_template = {
-    "skill_name": "athletics",
-    "skill_adjustment": 0,
-    "skill_is_proficient": False,
-    "skill_is_expertise": False
-}
-
-hit_points_template = {
-    "hit_points_current": 30,
-    "hit_points_max": 30,
-    "hit_points_temp": 0,
-    "non_lethal_damage": 0
-}
-
-
-templates = [
-    character_stats_template,
-    attribute_template,
-    ac_template,
-    saving_throw_proficiencies_template,
-    skills_template,
-    hit_points_template
-]
+SSE_KEEPALIVE_SECONDS = 15
+SSE_RETRY_MS = 3000
 
 
 class CharacterStatsView(APIView):
     def get(self, request, *args, **kwargs):
-        print("GET Request Arrived")
         character_id = request.GET.get('character_id', "#0000")
+        packed = wants_packed_sheet(request)
+        try:
+            selection = sheet_selection(request, packed)
+        except SheetSelectionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        cached = get_cached_sheet(character_id)
+        if selection is not None:
+            # sparse sheets are cut from a cached complete sheet or read on their own, never cached
+            if cached is None:
+                sheet = load_character_sheet(character_id, selection)
+            else:
+                sheet = select_sheet_fields(cached[1], selection)
+            etag = compute_etag(sheet)
+        elif cached is None:
+            sheet = load_character_sheet(character_id)
+            etag = cache_sheet(character_id, sheet)
+        else:
+            etag, sheet = cached
 
+        etag = representation_etag(etag, request, packed)
+        headers = {"ETag": etag, "Vary": "Accept"}
 
-        character_stats = CharacterStats.objects.filter(character_id=character_id)
-        character_attributes = Attributes.objects.filter(attribute_character=character_id)
-        character_ac = AC.objects.filter(ac_character=character_id)
-        character_saving_throw_proficiencies = SavingThrowProficiencies.objects.filter(
-            saving_throw_proficiency_character=character_id)
-        character_skills = Skills.objects.filter(skill_character=character_id)
-        character_hit_points = HitPoints.objects.filter(hit_points_character=character_id)
-
-        stats_serializer = CharacterStatsSerializer(character_stats, many=True)
-        attributes_serializer = AttributesSerializer(character_attributes, many=True)
-        ac_serializer = ACSerializer(character_ac, many=True)
-        saving_throw_proficiencies_serializer = SavingThrowProficienciesSerializer(
-            character_saving_throw_proficiencies, many=True)
-        skills_serializer = SkillsSerializer(character_skills, many=True)
-        hit_points_serializer = HitPointsSerializer(character_hit_points, many=True)
-
-        serializer_set = [stats_serializer,
-                          attributes_serializer,
-                          ac_serializer,
-                          saving_throw_proficiencies_serializer,
-                          skills_serializer,
-                          hit_points_serializer]
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
 
-        return Response(
-            {
-                "stats": stats_serializer.data,
-                "attributes": attributes_serializer.data,
-                "ac": ac_serializer.data,
-                "saving_throw_proficiencies": saving_throw_proficiencies_serializer.data,
-                "skills": skills_serializer.data,
-                "hit_points": hit_points_serializer.data,
-            }, status=status.HTTP_200_OK)
+        if packed:
+            sheet = pack_character_sheet(sheet)
+        return Response(sheet, status=status.HTTP_200_OK, headers=headers)
 
     def post(self, request):
-        # prepare lists
-        skill_name_list = [
-            "acrobatics",
-            "animal_handling",
-            "arcana",
-            "athletics",
-            "deception",
-            "history",
-            "insight",
-            "intimidation",
-            "investigation",
-            "medicine",
-            "nature",
-            "perception",
-            "performance",
-            "persuasion",
-            "religion",
-            "sleight_of_hand",
-            "stealth",
-            "survival"
-        ]
-        topics = ["stats", "attributes", "ac", "saving_throw_proficiencies", "skills", "hit_points",]
-        attribute_name_list = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
-        saving_throw_name_list = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
-
         # prepare and validate data from request
         data = request.data
 
+        # characters from a link are imported in the background, the client polls the job
+        stats_data = data.get("stats") or [{}]
+        url = stats_data[0].get("character_source_link")
+        if url:
+            try:
+                job = submit_import_job(url)
+            except ImportQueueFull as e:
+                return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={"Retry-After": "5"})
+
+            status_url = reverse("import-job", kwargs={"job_id": job.job_id})
+            return Response({"message": "Import has been queued.", "job_id": job.job_id, "status": job.job_status,
+                             "status_url": status_url}, status=status.HTTP_202_ACCEPTED,
+                            headers={"Location": status_url})
+
+        # validate the whole character first, then write all tables in one transaction
+        try:
+            prepared_character = prepare_character(data)
+        except CharacterImportError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-        # test if link is not empty
-        if data["stats"][0]["character_source_link"] == "" or data["stats"][0]["character_source_link"] is None:
-            url = ""
-        else:
-            url = data["stats"][0]["character_source_link"]
-            
-            service = DnDBeyondCharacterService()
-            character_info = service.get_character_info(url)
-
-
-            if "error" in character_info:
-             return Response({"error": character_info["error"]}, status=status.HTTP_400_BAD_REQUEST)
-            
-            data = character_info
-            #data = jkerz_char_json
-
-        attributes_data = data.get("attributes")
-        saving_throw_proficiencies_data = data.get("saving_throw_proficiencies")
-        skills_data = data.get("skills")
-        
-        invalid_topic = validate_post_request(topics, data)
-
-        if(invalid_topic is not None):
-            return Response({"error": f"Missing data for topic '{invalid_topic}'."},
-                            status=status.HTTP_400_BAD_REQUEST)
-
-
-        # generate missing Traits
-        attributes_data.extend(generate_character_trait(attribute_name_list, attributes_data, "attribute"))
-        saving_throw_proficiencies_data.extend(generate_character_trait(saving_throw_name_list,
-                                                                        saving_throw_proficiencies_data,
-                                                                        "saving_throw"))
-        skills_data.extend(generate_character_trait(skill_name_list, skills_data, "skill"))
-
-        # generate and add Character ID to connect relations between tables
-        generated_id = generate_character_id()
-        data["stats"][0]["character_id"] = generated_id
-        data["ac"][0]["ac_character"] = generated_id
-        data["hit_points"][0]["hit_points_character"] = generated_id
-
-        data_list = [attributes_data, saving_throw_proficiencies_data, skills_data]
-        foreign_key_list = ["attribute_character", "saving_throw_proficiency_character", "skill_character"]
-
-        for datas in data_list:
-            for json_element in datas:
-                json_element.update({foreign_key_list[data_list.index(datas)]: generated_id})
-        # initialize serializers
-        stats_serializer = CharacterStatsSerializer(data=data["stats"], many=True)
-        attributes_serializer = AttributesSerializer(data=data["attributes"], many=True)
-        ac_serializer = ACSerializer(data=data["ac"], many=True)
-        saving_throw_proficiencies_serializer = SavingThrowProficienciesSerializer(data=data["saving_throw_proficiencies"],
-                                                                               many=True)
-        skills_serializer = SkillsSerializer(data=data["skills"], many=True)
-        hit_points_serializer = HitPointsSerializer(data=data["hit_points"], many=True)
-
-        serializer_set = [stats_serializer,
-                          attributes_serializer,
-                          ac_serializer,
-                          saving_throw_proficiencies_serializer,
-                          skills_serializer,
-                          hit_points_serializer]
-
-        # validate data with serializers and save valid data to db
-        counter = 0
-        for serializer in serializer_set:
-            if serializer.is_valid():
-                serializer.save()
-            else:
-                return Response({"error": f"Invalid data in character {topics[counter]}.\n"
-                                          f"{serializer.errors}"},
-                                status=status.HTTP_400_BAD_REQUEST)
-            counter += 1
+        character_id = write_characters([prepared_character])[0]
 
-        return Response({"message": "Data has been successfully processed."}, status=status.HTTP_200_OK)
+        return Response({"message": "Data has been successfully processed.", "character_id": character_id},
+                        status=status.HTTP_200_OK)
 
 
     def put(self, request):
         try:
-            print("PUT Request Arrived")
-            data = request.data
-            stats_data = request.data.get("stats")
-            attributes_data = request.data.get("attributes")
-            saving_throw_proficiencies_data = request.data.get("saving_throw_proficiencies")
-            ac_data = request.data.get("ac")
-            skills_data = request.data.get("skills")
-            hit_points_data = request.data.get("hit_points")
-
-            character_id = stats_data[0]["character_id"]
-
-            character_stats_db = CharacterStats.objects.filter(character_id=character_id)
-            character_attributes_db = Attributes.objects.filter(attribute_character=character_id)
-            character_ac_db = AC.objects.filter(ac_character=character_id)
-            character_saving_throw_proficiencies_db = SavingThrowProficiencies.objects.filter(
-                saving_throw_proficiency_character=character_id)
-            character_skills_db = Skills.objects.filter(skill_character=character_id)
-            character_hit_points_db = HitPoints.objects.filter(hit_points_character=character_id)
-
-            if stats_data:
-                for stat in stats_data:
-                    character_stats_db.update(**stat)
-
-            if attributes_data:
-                for attr in attributes_data:
-                    for attr_db in character_attributes_db:
-                        if attr_db.attribute_name == attr["attribute_name"]:
-                            if "attribute_value" in attr:
-                                attr_db.attribute_value = attr["attribute_value"]
-                            if "attribute_adjustment" in attr:
-                                attr_db.attribute_adjustment = attr["attribute_adjustment"]
-
-                            attr_db.save()
-                            break
-
-            if ac_data:
-                for ac_trait in ac_data:
-                    character_ac_db.update(**ac_trait)
-
-            if saving_throw_proficiencies_data:
-                for saving_throw_proficiency in saving_throw_proficiencies_data:
-                    for saving_throw_proficiency_db in character_saving_throw_proficiencies_db:
-                        if saving_throw_proficiency_db.saving_throw_name == saving_throw_proficiency["saving_throw_name"]:
-                            if "saving_throw_adjustment" in saving_throw_proficiency:
-                                saving_throw_proficiency_db.saving_throw_adjustment = saving_throw_proficiency[
-                                    "saving_throw_adjustment"]
-                            if "saving_throw_is_proficient" in saving_throw_proficiency:
-                                saving_throw_proficiency_db.saving_throw_is_proficient = saving_throw_proficiency[
-                                    "saving_throw_is_proficient"]
-                            saving_throw_proficiency_db.save()
-                            break
-            if skills_data:
-                for skill in skills_data:
-                    for skill_db in character_skills_db:
-                        if skill_db.skill_name == skill["skill_name"]:
-                            if "skill_adjustment" in skill:
-                                skill_db.skill_adjustment = skill["skill_adjustment"]
-                            if "skill_is_proficient" in skill:
-                                skill_db.skill_is_proficient = skill["skill_is_proficient"]
-                            if "skill_is_expertise" in skill:
-                                skill_db.skill_is_expertise = skill["skill_is_expertise"]
-                            skill_db.save()
-                            break
-
-            if hit_points_data:
-                for hit_point_trait in hit_points_data:
-                    character_hit_points_db.update(**hit_point_trait)
-
-            return Response({
-                "stats": CharacterStatsSerializer(character_stats_db, many=True).data,
-                "attributes": AttributesSerializer(character_attributes_db, many=True).data,
-                "ac": ACSerializer(character_ac_db, many=True).data,
-                "saving_throw_proficiencies": SavingThrowProficienciesSerializer(character_saving_throw_proficiencies_db,
-                                                                                 many=True).data,
-                "skills": SkillsSerializer(character_skills_db, many=True).data,
-                "hit_points": HitPointsSerializer(character_hit_points_db, many=True).data,
-            }, status=status.HTTP_200_OK)
+            character_id = request.data.get("stats")[0]["character_id"]
+
+            character, changes = update_character_sheet(character_id, request.data)
+            if character is None:
+                return Response(empty_character_sheet(), status=status.HTTP_200_OK)
+
+            return Response(serialize_character_sheet(character), status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": f"An error occurred: {e}"}, status=status.HTTP_400_BAD_REQUEST)
 
-def generate_character_id():
-    existing_ids = CharacterStats.objects.values_list('character_id', flat=True).order_by('character_id')
-    min_free_id = 0
+    def patch(self, request):
+        # {"character_id": "#0001", "version": 4, "hit_points": {"hit_points_current": 12}, ...}
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected an object."}, status=status.HTTP_400_BAD_REQUEST)
+        delta = dict(request.data)
+        character_id = delta.pop("character_id", None)
+        expected_version = delta.pop("version", None)
+        if not character_id:
+            return Response({"error": "Missing character_id."}, status=status.HTTP_400_BAD_REQUEST)
 
-    for i in existing_ids:
-        numeric_id = int(i[1:])  # Ignoriere das `#` am Anfang
-        if numeric_id == min_free_id:
-            min_free_id += 1  # Suche die nächste freie ID
-        else:
-            break
-    formatted_character_id = f"#{min_free_id:04d}"
-    return formatted_character_id
+        try:
+            version, changed = patch_character(character_id, delta, expected_version)
+        except CharacterNotFound as e:
+            return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except CharacterVersionConflict as e:
+            return Response({"error": str(e)}, status=status.HTTP_409_CONFLICT)
+        except CharacterUpdateError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-def validate_post_request(field_names, data):
+        return Response({"character_id": character_id, "version": version, "changed": changed},
+                        status=status.HTTP_200_OK)
 
-    for topic in field_names:
-        if topic not in data or not data[topic]:
-            return topic
-        else:
-            for stat in data[topic]:
-                for key, default_value in templates[field_names.index(topic)].items():
-                    if key not in stat or stat[key] is None:
-                        stat[key] = default_value
-    return None
 
+class CharacterStatsBulkView(APIView):
+    def post(self, request):
+        # accepts {"characters": [...]} or a plain list of character payloads
+        payloads = request.data.get("characters") if isinstance(request.data, dict) else request.data
 
-def generate_character_trait(name_list, trait_data, field):
-    for trait in trait_data:
-        if trait[f"{field}_name"] not in name_list:
-            return Response({"error": f"Invalid trait name '{trait[f'{field}_name']}'."}, )
-        else:
-            name_list.remove(trait[f"{field}_name"])
-
-    missing_traits = []
-    for trait in name_list:
-        if field == "attribute":
-            trait_data.append(
-                        {
-                            f"{field}_name": trait,
-                            f"{field}_value": 10,
-                            f"{field}_adjustment": 0,
-                        }
-            )
-        elif field == "saving_throw":
-            trait_data.append(
-                        {
-                            f"{field}_name": trait,
-                            f"{field}_adjustment": 0,
-                            f"{field}_is_proficient": False,
-                        }
-            )
-        elif field == "skill":
-            trait_data.append(
-                        {
-                            f"{field}_name": trait,
-                            f"{field}_adjustment": 0,
-                            f"{field}_is_proficient": False,
-                            f"{field}_is_expertise": False,
-                        }
-            )
-
-    return missing_traits
-
-def update_character_stats(data, data_db):
-
-    for skill in skills_data:
-        for skill_db in character_skills_db:
-            if skill_db.skill_name == skill["skill_name"]:
-                if "skill_adjustment" in skill:
-                    skill_db.skill_adjustment = skill["skill_adjustment"]
-                if "skill_is_proficient" in skill:
-                    skill_db.skill_is_proficient = skill["skill_is_proficient"]
-                if "skill_is_expertise" in skill:
-                    skill_db.skill_is_expertise = skill["skill_is_expertise"]
+        if not isinstance(payloads, list) or not payloads:
+            return Response({"error": "No characters given."}, status=status.HTTP_400_BAD_REQUEST)
+
+        prepared_characters, errors = prepare_characters(payloads)
+        if errors:
+            return Response({"error": "Invalid character data, nothing was imported.", "errors": errors},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        character_ids = write_characters(prepared_characters)
+
+        return Response({"message": f"{len(character_ids)} characters have been imported.",
+                         "character_ids": character_ids}, status=status.HTTP_201_CREATED)
+
+
+class CharacterStatsBatchView(APIView):
+    def get(self, request, *args, **kwargs):
+        character_ids = parse_character_ids(request.GET)
+
+        if not character_ids:
+            return Response({"error": "No character ids given."}, status=status.HTTP_400_BAD_REQUEST)
+
+        packed = wants_packed_sheet(request)
+        try:
+            selection = sheet_selection(request, packed)
+        except SheetSelectionError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
+        sheets = load_character_sheets(character_ids, selection)
+        if packed:
+            sheets = {character_id: pack_character_sheet(sheet) for character_id, sheet in sheets.items()}
+
+        return Response(
+            {
+                "characters": [sheets[character_id] for character_id in character_ids if character_id in sheets],
+                "missing": [character_id for character_id in character_ids if character_id not in sheets],
+            }, status=status.HTTP_200_OK)
+
+
+class CharacterStatsListView(APIView):
+    def get(self, request, *args, **kwargs):
+        # ?class=Wizard&race=Elf&level_min=3&level_max=8&name=Fae&condition=Poisoned&limit=50&cursor=...
+        # ?character_ids=#0001,#0002&condition=Stunned answers which party members are stunned
+        try:
+            filters = parse_character_filters(request.GET)
+            character_ids = parse_character_ids(request.GET)
+            if character_ids:
+                filters.append(Q(character_id__in=character_ids))
+            limit = parse_int(request.GET, "limit", DEFAULT_PAGE_SIZE)
+            characters, next_cursor = list_characters(filters, request.GET.get("cursor"), limit)
+        except CharacterListError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_url = None
+        if next_cursor:
+            query = request.GET.copy()
+            query["cursor"] = next_cursor
+            next_url = f"{request.path}?{query.urlencode()}"
+
+        return Response({"characters": characters, "next_cursor": next_cursor, "next": next_url},
+                        status=status.HTTP_200_OK)
+
+
+class PartyStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        # ?character_ids=#0001,#0002[&check=stealth&dc=15&trials=10000&advantage=1&seed=7]
+        if np is None:
+            return Response({"error": "Party statistics need the numpy package."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        character_ids = parse_character_ids(request.GET)
+        if not character_ids:
+            return Response({"error": "No character ids given."}, status=status.HTTP_400_BAD_REQUEST)
+
+        party = load_party_arrays(character_ids)
+        bonuses = compute_party_bonuses(party)
+        data = {
+            "characters": party_bonus_rows(party, bonuses),
+            "missing": [character_id for character_id in character_ids if character_id not in party.character_ids],
+        }
+
+        check = request.GET.get("check")
+        if check:
+            try:
+                dc = int(request.GET.get("dc", ""))
+                trials = int(request.GET.get("trials", 10_000))
+                seed = int(request.GET["seed"]) if request.GET.get("seed") else None
+            except ValueError:
+                return Response({"error": "dc, trials and seed must be integers."},
+                                status=status.HTTP_400_BAD_REQUEST)
+            try:
+                simulation = simulate_group_check(
+                    check_bonuses(bonuses, check), dc, trials,
+                    advantage=request.GET.get("advantage", "").lower() in ("1", "true", "yes"),
+                    disadvantage=request.GET.get("disadvantage", "").lower() in ("1", "true", "yes"),
+                    seed=seed)
+            except PartyStatsError as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            data["group_check"] = {
+                "check": check,
+                "dc": dc,
+                "trials": trials,
+                "group_probability": simulation["group_probability"],
+                "all_probability": simulation["all_probability"],
+                "any_probability": simulation["any_probability"],
+                "character_probabilities": dict(zip(party.character_ids,
+                                                    simulation["character_probabilities"].tolist())),
+            }
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class ImportJobView(APIView):
+    def get(self, request, job_id, *args, **kwargs):
+        job = ImportJob.objects.filter(job_id=job_id).first()
+        if job is None:
+            return Response({"error": "Import job not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response(ImportJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+class DnDBeyondCacheStatsView(APIView):
+    def get(self, request, *args, **kwargs):
+        # hit/miss counters of the upstream payload cache of this server process
+        return Response(get_payload_cache().stats(), status=status.HTTP_200_OK)
+
+
+async def character_events(request):
+    """
+    Server-Sent Events stream of sheet changes for the characters in ?character_id=...,
+    one "update" event with the changed values and the new version per write.
+    Needs the ASGI entry point, a WSGI worker would be blocked for the lifetime of the stream.
+    """
+    character_ids = parse_character_ids(request.GET)
+    if not character_ids:
+        return JsonResponse({"error": "No character ids given."}, status=status.HTTP_400_BAD_REQUEST)
+
+    stream = SheetEventStream(get_broker().subscribe(character_ids), SSE_KEEPALIVE_SECONDS, SSE_RETRY_MS)
+    return StreamingHttpResponse(stream, content_type="text/event-stream",
+                                 headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def wants_packed_sheet(request):
+    # ?packed=1 sends attributes, saving throws and skills as fixed-order arrays
+    return request.GET.get('packed', '').lower() in ("1", "true", "yes")
+
+
+def sheet_selection(request, packed):
+    # ?include=hit_points,ac&fields=hit_points_current, see parse_sheet_selection()
+    fields = request.GET.get('fields')
+    if fields and packed:
+        # packed trait rows need all of their fields
+        raise SheetSelectionError("fields cannot be combined with packed sheets.")
+    return parse_sheet_selection(request.GET.get('include'), fields)
+
+
+def representation_etag(etag, request, packed):
+    """
+    Adds the renderer format and the packed flag to the ETag of a sheet, so a cache never
+    answers a JSON request with the tag of a MessagePack or packed body.
+    """
+    variants = [request.accepted_renderer.format] if request.accepted_renderer.format != "json" else []
+    if packed:
+        variants.append("packed")
+    if not variants:
+        return etag
+    return f'{etag[:-1]}-{"-".join(variants)}"'
+
+
+def parse_character_ids(query_params):
+    # accepts ?character_id=#0001&character_id=#0002 as well as ?character_ids=#0001,#0002
+    character_ids = query_params.getlist('character_id')
+    for id_list in query_params.getlist('character_ids'):
+        character_ids.extend(character_id.strip() for character_id in id_list.split(',') if character_id.strip())
+    return list(dict.fromkeys(character_ids))
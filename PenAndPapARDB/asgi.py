@@ -3,6 +3,9 @@ ASGI config for PenAndPapARDB project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The Server-Sent Events stream /api/stats/events/ is an async view and should be served
+through this entry point, e.g. ``uvicorn PenAndPapARDB.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import importlib.util
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'PenAndPapAR.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -83,12 +86,182 @@ WSGI_APPLICATION = 'PenAndPapARDB.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+#
+# PENANDPAPAR_DB_PROFILE selects the database:
+# "sqlite" (default)  db.sqlite3 in WAL mode with synchronous=NORMAL, memory mapped reads, a busy
+#                     timeout and write transactions that take the lock when they begin, so
+#                     concurrent writers wait for each other instead of failing with "database is locked"
+# "sqlite-basic"      db.sqlite3 with the SQLite defaults
+# "postgresql"        PENANDPAPAR_DB_NAME/_USER/_PASSWORD/_HOST/_PORT, requires psycopg. Connections
+#                     are kept for PENANDPAPAR_DB_CONN_MAX_AGE seconds, or taken from a psycopg pool
+#                     of PENANDPAPAR_DB_POOL_MIN_SIZE to _MAX_SIZE connections with PENANDPAPAR_DB_POOL=1
+#                     (requires psycopg[pool]).
+# PENANDPAPAR_DB_CONN_MAX_AGE applies to the SQLite profiles as well, 0 closes connections after every request.
+
+_db_conn_max_age = int(os.environ.get('PENANDPAPAR_DB_CONN_MAX_AGE', 60))
+_db_pool = os.environ.get('PENANDPAPAR_DB_POOL', '') == '1'
+
+DATABASE_PROFILES = {
+    'sqlite': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('PENANDPAPAR_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': _db_conn_max_age,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': ('PRAGMA journal_mode=WAL;'
+                             'PRAGMA synchronous=NORMAL;'
+                             f"PRAGMA mmap_size={int(os.environ.get('PENANDPAPAR_DB_MMAP_SIZE', 256 * 1024 * 1024))};"),
+            'timeout': float(os.environ.get('PENANDPAPAR_DB_BUSY_TIMEOUT', 20)),
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # a file instead of the in-memory default, so tests with several threads wait for
+        # locks like the real database instead of failing with "database table is locked"
+        'TEST': {'NAME': os.environ.get('PENANDPAPAR_TEST_DB_NAME', BASE_DIR / 'test_db.sqlite3')},
+    },
+    'sqlite-basic': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('PENANDPAPAR_DB_NAME', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': _db_conn_max_age,
+    },
+    'postgresql': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PENANDPAPAR_DB_NAME', 'penandpapar'),
+        'USER': os.environ.get('PENANDPAPAR_DB_USER', 'penandpapar'),
+        'PASSWORD': os.environ.get('PENANDPAPAR_DB_PASSWORD', ''),
+        'HOST': os.environ.get('PENANDPAPAR_DB_HOST', 'localhost'),
+        'PORT': os.environ.get('PENANDPAPAR_DB_PORT', '5432'),
+        # a pool hands out connections itself, Django must close them after every request
+        'CONN_MAX_AGE': 0 if _db_pool else _db_conn_max_age,
+        'CONN_HEALTH_CHECKS': not _db_pool,
+        'OPTIONS': {
+            'pool': {
+                'min_size': int(os.environ.get('PENANDPAPAR_DB_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.environ.get('PENANDPAPAR_DB_POOL_MAX_SIZE', 10)),
+            },
+        } if _db_pool else {},
+    },
+}
+
+DATABASE_PROFILE = os.environ.get('PENANDPAPAR_DB_PROFILE', 'sqlite')
 
 DATABASES = {
+    'default': DATABASE_PROFILES[DATABASE_PROFILE],
+}
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# "character_sheets" holds serialized responses of CharacterStatsView.get.
+# PENANDPAPAR_SHEET_CACHE selects the backend: "locmem" (default), "file" or "redis".
+# PENANDPAPAR_SHEET_CACHE_LOCATION is the directory for "file" and the URL for "redis".
+
+SHEET_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'character-sheets'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache' / 'character_sheets'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+_sheet_cache_backend, _sheet_cache_location = SHEET_CACHE_BACKENDS[os.environ.get('PENANDPAPAR_SHEET_CACHE', 'locmem')]
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'character_sheets': {
+        'BACKEND': _sheet_cache_backend,
+        'LOCATION': os.environ.get('PENANDPAPAR_SHEET_CACHE_LOCATION', _sheet_cache_location),
+        'TIMEOUT': int(os.environ.get('PENANDPAPAR_SHEET_CACHE_TIMEOUT', 300)),
+    },
+}
+
+CHARACTER_SHEET_CACHE_ALIAS = 'character_sheets'
+
+# Broker that delivers sheet changes to /api/stats/events/ subscribers.
+# The in-process broker only reaches clients connected to the same server process.
+CHARACTER_EVENT_BROKER = 'PenAndPapAR.ViewsHelper.SheetEvents.InProcessBroker'
+
+
+# HTTP client for the D&D Beyond character service, see DEFAULT_CLIENT_SETTINGS in
+# PenAndPapAR/ViewsHelper/DNDBeyondWebdata.py. Timeouts are in seconds, MAX_CONCURRENT_REQUESTS
+# limits the upstream requests in flight per server process. STREAMING parses payloads while
+# they are received and keeps only the keys the import needs (requires the optional ijson package).
+DNDBEYOND_CLIENT = {
+    'BASE_URL': os.environ.get('PENANDPAPAR_DNDBEYOND_URL',
+                               'https://character-service.dndbeyond.com/character/v5/character/'),
+    'CONNECT_TIMEOUT': float(os.environ.get('PENANDPAPAR_DNDBEYOND_CONNECT_TIMEOUT', 3.05)),
+    'READ_TIMEOUT': float(os.environ.get('PENANDPAPAR_DNDBEYOND_READ_TIMEOUT', 10)),
+    'RETRIES': 2,
+    'BACKOFF_FACTOR': 0.5,
+    'MAX_RETRY_AFTER': 2.0,
+    'POOL_SIZE': 10,
+    'MAX_CONCURRENT_REQUESTS': int(os.environ.get('PENANDPAPAR_DNDBEYOND_MAX_CONCURRENT_REQUESTS', 8)),
+    'STREAMING': True,
+}
+
+# Raw and parsed upstream payloads by D&D Beyond character id. Entries are used without a
+# request for TTL seconds and revalidated afterwards, the least recently used of MAX_ENTRIES
+# is evicted first. Counters are served at /api/dndbeyond/cache/.
+DNDBEYOND_PAYLOAD_CACHE = {
+    'TTL': int(os.environ.get('PENANDPAPAR_DNDBEYOND_CACHE_TTL', 60)),
+    'MAX_ENTRIES': int(os.environ.get('PENANDPAPAR_DNDBEYOND_CACHE_MAX_ENTRIES', 256)),
+}
+
+# Characters posted with a character_source_link are imported by a pool of WORKERS threads
+# per server process, POST answers 202 with a job id. MAX_PENDING queued or running imports
+# are accepted, more get a 503. EAGER runs imports inside the request (used by the tests).
+IMPORT_JOBS = {
+    'WORKERS': int(os.environ.get('PENANDPAPAR_IMPORT_WORKERS', 4)),
+    'MAX_PENDING': int(os.environ.get('PENANDPAPAR_IMPORT_MAX_PENDING', 100)),
+    'EAGER': False,
+}
+
+
+# Per-request timings (database, D&D Beyond, serialization, total) are sent as a Server-Timing
+# header and logged as JSON to the "PenAndPapAR.timing" logger, see PenAndPapAR/middleware.py.
+# Requests taking at least QUERY_LOG_THRESHOLD_MS milliseconds also log their SQL statements.
+REQUEST_TIMING = {
+    'ENABLED': True,
+    'SERVER_TIMING_HEADER': True,
+    'QUERY_LOG_THRESHOLD_MS': (float(os.environ['PENANDPAPAR_QUERY_LOG_THRESHOLD_MS'])
+                               if os.environ.get('PENANDPAPAR_QUERY_LOG_THRESHOLD_MS') else None),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'PenAndPapAR.timing': {
+            'handlers': ['console'],
+            'level': os.environ.get('PENANDPAPAR_TIMING_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+#
+# AR clients can send and receive MessagePack (Content-Type/Accept: application/msgpack or
+# ?format=msgpack) when the optional msgpack package is installed, JSON stays the default.
+
+_MESSAGEPACK_INSTALLED = importlib.util.find_spec('msgpack') is not None
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['PenAndPapAR.renderers.MessagePackRenderer'] if _MESSAGEPACK_INSTALLED else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['PenAndPapAR.parsers.MessagePackParser'] if _MESSAGEPACK_INSTALLED else []),
+    ],
 }
 
 
@@ -0,0 +1,101 @@
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Every benchmark runs against a throwaway test database that is created the same
+way the Django test runner does it, so the development database is never touched.
+Run the scripts from the repository root, e.g. ``python benchmarks/bench_bulk_import.py``.
+"""
+import contextlib
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "PenAndPapARDB.settings")
+# the per-request timing lines of the middleware would drown the results
+os.environ.setdefault("PENANDPAPAR_TIMING_LOG_LEVEL", "WARNING")
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+TEST_JSONS = BASE_DIR / "PenAndPapARDB" / "TestJsons"
+
+
+@contextlib.contextmanager
+def benchmark_database(test_name=None):
+    """
+    Creates a fresh, migrated test database for the duration of the block.
+    SQLite databases are in memory unless a file path is passed as test_name (needed when
+    several threads write concurrently), even though the test suite uses a file by default.
+    """
+    test_settings = connection.settings_dict.setdefault("TEST", {})
+    if test_name is not None:
+        test_settings["NAME"] = str(test_name)
+    elif connection.vendor == "sqlite":
+        test_settings["NAME"] = None
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def load_test_json(name):
+    with open(TEST_JSONS / name, encoding="utf-8") as file:
+        return json.load(file)
+
+
+_COMPLETE_CHARACTER = load_test_json("CompleteCharacterPost.json")
+
+
+def synthetic_character(index):
+    """A complete character payload that differs per index."""
+    data = copy.deepcopy(_COMPLETE_CHARACTER)
+    stats = data["stats"][0]
+    stats["character_name"] = f"Synthetic {index}"
+    stats["character_level"] = index % 20 + 1
+    stats["character_source_link"] = None
+    for offset, attribute in enumerate(data["attributes"]):
+        attribute["attribute_value"] = 8 + (index + offset) % 11
+    for offset, skill in enumerate(data["skills"]):
+        skill["skill_is_proficient"] = (index + offset) % 3 == 0
+    data["hit_points"][0]["hit_points_current"] = index % 40
+    return data
+
+
+@contextlib.contextmanager
+def stopwatch(results, key):
+    start = time.perf_counter()
+    yield
+    results[key] = time.perf_counter() - start
+
+
+def percentiles(samples):
+    """p50/p95/p99 of a list of durations in seconds, returned in milliseconds."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "mean": statistics.fmean(ordered) * 1000}
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    print("  ".join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    print("  ".join("-" * width for width in widths))
+    for row in rows:
+        print("  ".join(str(value).ljust(width) for value, width in zip(row, widths)))
@@ -0,0 +1,244 @@
+"""
+Load test of /api/stats/ through the Django test client: GET of the complete sheet and of
+only the hit points (?include=hit_points), manual POST, link POST
+(imported in the request from the local D&D Beyond stand-in) and PUT, each sent by
+--concurrency threads against a file based test database seeded with --characters
+synthetic characters.
+
+Reports p50/p95/p99 latency, throughput and SQL statements per request (read from the
+Server-Timing header) and writes them as JSON, by default to
+benchmarks/results/api-<commit>.json. Pass an earlier result file as --compare to see
+the change of every number.
+
+The database profile comes from PENANDPAPAR_DB_PROFILE like for the server, see
+bench_db_profiles.py to compare them.
+
+    python benchmarks/bench_api.py [--characters 500] [--requests 500] [--concurrency 4]
+                                   [--scenarios get,get-hit-points,post,post-link,put] [--upstream-delay 0]
+                                   [--output FILE] [--compare FILE]
+"""
+import argparse
+import copy
+import itertools
+import json
+import logging
+import platform
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from _common import BASE_DIR, benchmark_database, load_test_json, percentiles, print_table, synthetic_character
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.CharacterSheetCache import sheet_cache
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import get_payload_cache
+from PenAndPapAR.upstream_stand_in import StandInCharacterService
+
+SCENARIOS = ["get", "get-hit-points", "post", "post-link", "put"]
+SEED_BATCH_SIZE = 500
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+# failed requests are counted and summarized, not logged one by one
+logging.getLogger("django.request").setLevel(logging.ERROR)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(count):
+    character_ids = []
+    for start in range(0, count, SEED_BATCH_SIZE):
+        prepared, errors = prepare_characters(
+            [synthetic_character(index) for index in range(start, min(count, start + SEED_BATCH_SIZE))])
+        assert not errors, errors
+        character_ids.extend(write_characters(prepared))
+    return character_ids
+
+
+def upstream_characters(count):
+    fixture = load_test_json("DnDBeyondCharacter.json")
+    characters = {}
+    for index in range(count):
+        data = copy.deepcopy(fixture)
+        data["data"]["id"] = index + 1
+        characters[str(index + 1)] = data
+    return characters
+
+
+def request_builders(character_ids, upstream):
+    """scenario -> function(index) returning the method, path, body and expected status of a request."""
+    put_sheet = load_test_json("CompleteCharacterPut.json")
+
+    def get(index):
+        return "get", f"/api/stats/?character_id={character_ids[index % len(character_ids)]}", None, 200
+
+    def get_hit_points(index):
+        return ("get", f"/api/stats/?character_id={character_ids[index % len(character_ids)]}&include=hit_points",
+                None, 200)
+
+    def post(index):
+        return "post", "/api/stats/", synthetic_character(index), 200
+
+    def post_link(index):
+        link = upstream.character_url(str(index + 1))
+        return "post", "/api/stats/", {"stats": [{"character_source_link": link}]}, 202
+
+    def put(index):
+        sheet = copy.deepcopy(put_sheet)
+        sheet["stats"][0]["character_id"] = character_ids[index % len(character_ids)]
+        sheet["hit_points"][0]["hit_points_current"] = index % 30
+        return "put", "/api/stats/", sheet, 200
+
+    return {"get": get, "get-hit-points": get_hit_points, "post": post, "post-link": post_link, "put": put}
+
+
+def run_scenario(build_request, requests, concurrency):
+    """Sends requests from concurrency threads, every thread with its own client and connection."""
+    indexes = itertools.count()
+    lock = threading.Lock()
+    samples, query_counts, errors = [], [], []
+
+    def worker():
+        client = APIClient()
+        try:
+            while True:
+                with lock:
+                    index = next(indexes)
+                if index >= requests:
+                    return
+                method, path, body, expected_status = build_request(index)
+                start = time.perf_counter()
+                if body is None:
+                    response = getattr(client, method)(path)
+                else:
+                    response = getattr(client, method)(path, body, format="json")
+                elapsed = time.perf_counter() - start
+                match = QUERY_COUNT.search(response.get("Server-Timing", ""))
+                with lock:
+                    if response.status_code == expected_status:
+                        samples.append(elapsed)
+                        query_counts.append(int(match.group(1)) if match else 0)
+                    else:
+                        errors.append(f"{response.status_code} {response.content[:200].decode(errors='replace')}")
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": len(errors),
+        "error_examples": sorted(set(errors))[:3],
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {key: round(value, 3) for key, value in percentiles(samples).items()},
+        "queries_per_request": round(sum(query_counts) / len(query_counts), 2) if query_counts else 0.0,
+    }
+
+
+def compare(results, previous):
+    rows = []
+    for scenario, result in results["scenarios"].items():
+        before = previous.get("scenarios", {}).get(scenario)
+        if before is None:
+            continue
+        for name, now, then in [
+            ("p50 ms", result["latency_ms"]["p50"], before["latency_ms"]["p50"]),
+            ("p95 ms", result["latency_ms"]["p95"], before["latency_ms"]["p95"]),
+            ("p99 ms", result["latency_ms"]["p99"], before["latency_ms"]["p99"]),
+            ("requests/s", result["throughput_rps"], before["throughput_rps"]),
+            ("queries/request", result["queries_per_request"], before["queries_per_request"]),
+        ]:
+            change = f"{(now - then) / then * 100:+.1f}%" if then else ""
+            rows.append([scenario, name, then, now, change])
+    print(f"\ncompared with {previous.get('commit')} ({previous.get('created')})")
+    print_table(["scenario", "metric", "before", "now", "change"], rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=500, help="Synthetic characters seeded before the run.")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads sending requests.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--upstream-delay", type=float, default=0.0,
+                        help="Seconds the D&D Beyond stand-in waits before every response.")
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--compare", type=Path)
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in args.scenarios.split(",") if scenario]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    commit = git_commit()
+    results = {
+        "benchmark": "api",
+        "commit": commit,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "database_profile": settings.DATABASE_PROFILE,
+        "settings": {"characters": args.characters, "requests": args.requests, "concurrency": args.concurrency,
+                     "upstream_delay": args.upstream_delay},
+        "scenarios": {},
+    }
+
+    # concurrent writers need a file database, the in-memory one locks whole tables
+    with tempfile.TemporaryDirectory() as directory, \
+            benchmark_database(Path(directory) / "bench_api.sqlite3" if connection.vendor == "sqlite" else None), \
+            StandInCharacterService(upstream_characters(args.requests), delay=args.upstream_delay) as upstream, \
+            override_settings(DNDBEYOND_CLIENT={"BASE_URL": upstream.base_url},
+                              IMPORT_JOBS={"EAGER": True}):
+        character_ids = seed(args.characters)
+        builders = request_builders(character_ids, upstream)
+        for scenario in scenarios:
+            sheet_cache().clear()
+            get_payload_cache().clear()
+            results["scenarios"][scenario] = run_scenario(builders[scenario], args.requests, args.concurrency)
+
+    print(f"{args.characters} characters, {args.requests} requests per scenario, "
+          f"concurrency {args.concurrency}, commit {commit}")
+    print_table(["scenario", "p50 ms", "p95 ms", "p99 ms", "requests/s", "queries/request", "errors"], [
+        [scenario, result["latency_ms"]["p50"], result["latency_ms"]["p95"], result["latency_ms"]["p99"],
+         result["throughput_rps"], result["queries_per_request"], result["errors"]]
+        for scenario, result in results["scenarios"].items()])
+
+    for scenario, result in results["scenarios"].items():
+        for example in result["error_examples"]:
+            print(f"{scenario}: {example}")
+
+    output = args.output or BASE_DIR / "benchmarks" / "results" / f"api-{commit or 'unknown'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nresults written to {output}")
+
+    if args.compare:
+        compare(results, json.loads(args.compare.read_text(encoding="utf-8")))
+
+
+if __name__ == "__main__":
+    main()
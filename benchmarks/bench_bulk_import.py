@@ -0,0 +1,88 @@
+"""
+Throughput of the bulk character import compared with saving every character
+through the row-by-row ModelSerializer path the POST handler used before.
+
+    python benchmarks/bench_bulk_import.py [--sizes 1000 10000] [--legacy-limit 1000]
+"""
+import argparse
+import time
+
+from _common import benchmark_database, print_table, synthetic_character
+
+from django.db import transaction
+
+from PenAndPapAR.ViewsHelper.CharacterImport import generate_character_ids, prepare_characters, write_characters
+from PenAndPapAR.models import CharacterStats
+from PenAndPapAR.serializers import (
+    CharacterStatsSerializer,
+    AttributesSerializer,
+    ACSerializer,
+    SavingThrowProficienciesSerializer,
+    SkillsSerializer,
+    HitPointsSerializer
+)
+
+
+def legacy_import(payloads):
+    # mirrors the former CharacterStatsView.post: one serializer.save() per table and row
+    serializers = [
+        ("stats", CharacterStatsSerializer, None),
+        ("attributes", AttributesSerializer, "attribute_character"),
+        ("ac", ACSerializer, "ac_character"),
+        ("saving_throw_proficiencies", SavingThrowProficienciesSerializer, "saving_throw_proficiency_character"),
+        ("skills", SkillsSerializer, "skill_character"),
+        ("hit_points", HitPointsSerializer, "hit_points_character"),
+    ]
+    for payload in payloads:
+        character_id = generate_character_ids(1)[0]
+        payload["stats"][0]["character_id"] = character_id
+        for topic, serializer_class, foreign_key in serializers:
+            if foreign_key:
+                for row in payload[topic]:
+                    row[foreign_key] = character_id
+            serializer = serializer_class(data=payload[topic], many=True)
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+
+def bulk_import(payloads):
+    prepared_characters, errors = prepare_characters(payloads)
+    assert not errors, errors
+    validated = time.perf_counter()
+    write_characters(prepared_characters)
+    return validated
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--legacy-limit", type=int, default=1000,
+                        help="largest size that is also run through the legacy path")
+    args = parser.parse_args()
+
+    rows = []
+    with benchmark_database():
+        for size in args.sizes:
+            payloads = [synthetic_character(index) for index in range(size)]
+            start = time.perf_counter()
+            validated = bulk_import(payloads)
+            end = time.perf_counter()
+            assert CharacterStats.objects.count() == size
+            rows.append(["bulk", size, f"{validated - start:.2f}", f"{end - validated:.2f}",
+                         f"{end - start:.2f}", f"{size / (end - start):.0f}"])
+            CharacterStats.objects.all().delete()
+
+            if size <= args.legacy_limit:
+                payloads = [synthetic_character(index) for index in range(size)]
+                start = time.perf_counter()
+                with transaction.atomic():
+                    legacy_import(payloads)
+                end = time.perf_counter()
+                rows.append(["legacy", size, "-", "-", f"{end - start:.2f}", f"{size / (end - start):.0f}"])
+                CharacterStats.objects.all().delete()
+
+    print_table(["path", "characters", "validate s", "write s", "total s", "characters/s"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Latency of the character list at growing page depth on --characters seeded characters:
+keyset pages (list_characters with a cursor, WHERE character_id > ...) against the same
+pages read with OFFSET, unfiltered and with the class, level and condition filters (the
+condition bitmask next to a LIKE on the text form). Prints the query plans of a class and a
+condition page to show which index answers them.
+
+Only CharacterStats rows are seeded, the list does not read the other tables.
+
+    python benchmarks/bench_character_list.py [--characters 100000] [--limit 50] [--iterations 20]
+"""
+import argparse
+import time
+
+from _common import benchmark_database, print_table
+
+from django.db.models import Q
+
+from PenAndPapAR.ViewsHelper.CharacterList import LIST_FIELDS, encode_cursor, list_characters, parse_character_filters
+from PenAndPapAR.ViewsHelper.Conditions import CONDITION_NAMES, condition_flag, format_conditions
+from PenAndPapAR.models import CharacterIdSequence, CharacterStats
+
+CLASSES = ["Barbarian", "Bard", "Cleric", "Druid", "Fighter", "Monk", "Paladin", "Ranger", "Rogue", "Sorcerer",
+           "Warlock", "Wizard"]
+RACES = ["Dwarf", "Elf", "Gnome", "Halfling", "Human", "Tiefling", "Dragonborn"]
+SEED_BATCH_SIZE = 5000
+
+
+def seed(count):
+    for start in range(0, count, SEED_BATCH_SIZE):
+        CharacterStats.objects.bulk_create([
+            CharacterStats(character_id=CharacterIdSequence.format_character_id(index),
+                           character_name=f"Synthetic {index}", character_class=CLASSES[index % len(CLASSES)],
+                           character_race=RACES[index % len(RACES)], character_level=index % 20 + 1,
+                           **conditions(index))
+            for index in range(start, min(count, start + SEED_BATCH_SIZE))])
+
+
+def conditions(index):
+    # every 7th character has one condition, cycling through all of them
+    flags = condition_flag(index // 7 % len(CONDITION_NAMES) + 1) if index % 7 == 0 else 0
+    return {"character_condition_flags": flags, "character_conditions": format_conditions(flags)}
+
+
+def best_ms(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return min(samples) * 1000
+
+
+def offset_page(filters, offset, limit):
+    return list(CharacterStats.objects.filter(*filters).order_by("character_id").values(*LIST_FIELDS)[
+        offset:offset + limit + 1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=100_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    filter_sets = {
+        "none": [],
+        "class=Wizard": [Q(character_class="Wizard")],
+        "level 5-8": [Q(character_level__gte=5, character_level__lte=8)],
+        "condition=Stunned": parse_character_filters({"condition": "Stunned"}),
+        "text LIKE %Stunned%": [Q(character_conditions__icontains="Stunned")],
+    }
+
+    rows = []
+    with benchmark_database():
+        seed(args.characters)
+        for label, filters in filter_sets.items():
+            ordered_ids = list(CharacterStats.objects.filter(*filters).order_by("character_id").values_list(
+                "character_id", flat=True))
+            pages = len(ordered_ids) // args.limit
+            for depth in sorted({1, 10, 100, 1000, pages - 1}):
+                if not 1 <= depth < pages:
+                    continue
+                offset = depth * args.limit
+                cursor = encode_cursor(ordered_ids[offset - 1])
+                assert [row["character_id"] for row in list_characters(filters, cursor, args.limit)[0]] == \
+                    ordered_ids[offset:offset + args.limit]
+                keyset_ms = best_ms(lambda: list_characters(filters, cursor, args.limit), args.iterations)
+                offset_ms = best_ms(lambda: offset_page(filters, offset, args.limit), args.iterations)
+                rows.append([label, depth + 1, f"{keyset_ms:.3f}", f"{offset_ms:.3f}", f"{offset_ms / keyset_ms:.1f}x"])
+
+        plans = {label: CharacterStats.objects.filter(*filter_sets[label], character_id__gt="#5000").order_by(
+            "character_id").values(*LIST_FIELDS)[:args.limit + 1].explain()
+            for label in ("class=Wizard", "condition=Stunned")}
+
+    print(f"{args.characters} characters, {args.limit} per page, best of {args.iterations}")
+    print_table(["filter", "page", "keyset ms", "offset ms", "keyset speedup"], rows)
+    for label, plan in plans.items():
+        print(f"\nquery plan of a {label} page:\n{plan}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Concurrent write throughput of the database profiles (PENANDPAPAR_DB_PROFILE in settings.py).
+Runs the post and put scenarios of bench_api.py once per profile in a separate process, as
+the profile is read when the settings are loaded.
+
+The postgresql profiles need a server configured through the PENANDPAPAR_DB_* variables
+and psycopg (psycopg[pool] for "postgresql-pool"), they are skipped unless named in --profiles.
+
+    python benchmarks/bench_db_profiles.py [--profiles sqlite-basic,sqlite] [--concurrency 8]
+                                           [--characters 200] [--requests 400]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from _common import print_table
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+# profile name -> environment of the benchmark process
+PROFILES = {
+    "sqlite-basic": {"PENANDPAPAR_DB_PROFILE": "sqlite-basic"},
+    "sqlite": {"PENANDPAPAR_DB_PROFILE": "sqlite"},
+    "postgresql": {"PENANDPAPAR_DB_PROFILE": "postgresql", "PENANDPAPAR_DB_POOL": ""},
+    "postgresql-pool": {"PENANDPAPAR_DB_PROFILE": "postgresql", "PENANDPAPAR_DB_POOL": "1"},
+}
+
+
+def run_profile(profile, args, output):
+    command = [sys.executable, str(BENCHMARKS_DIR / "bench_api.py"), "--scenarios", "post,put",
+               "--characters", str(args.characters), "--requests", str(args.requests),
+               "--concurrency", str(args.concurrency), "--output", str(output)]
+    process = subprocess.run(command, env={**os.environ, **PROFILES[profile]}, capture_output=True, text=True)
+    if process.returncode:
+        print(f"{profile} failed:\n{process.stderr.strip().splitlines()[-1] if process.stderr else ''}")
+        return None
+    return json.loads(output.read_text(encoding="utf-8"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--profiles", default="sqlite-basic,sqlite")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--characters", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=400)
+    args = parser.parse_args()
+
+    profiles = [profile for profile in args.profiles.split(",") if profile]
+    unknown = set(profiles) - set(PROFILES)
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(sorted(unknown))}")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        for profile in profiles:
+            results = run_profile(profile, args, Path(directory) / f"{profile}.json")
+            if results is None:
+                continue
+            for scenario, result in results["scenarios"].items():
+                rows.append([profile, scenario, result["throughput_rps"], result["latency_ms"]["p50"],
+                             result["latency_ms"]["p95"], result["latency_ms"]["p99"], result["errors"]])
+
+    print(f"{args.requests} requests per scenario from {args.concurrency} threads, {args.characters} characters")
+    print_table(["profile", "scenario", "requests/s", "p50 ms", "p95 ms", "p99 ms", "errors"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Time spent deriving skill and saving throw proficiencies from the modifiers of a large
+synthetic D&D Beyond payload: the former any() scan per trait against the (type, subType)
+index parse_character_data builds now, and the whole parse for reference.
+
+    python benchmarks/bench_parse_character.py [--modifiers 5000] [--iterations 50]
+"""
+import argparse
+import copy
+import time
+
+from _common import load_test_json, print_table
+
+from PenAndPapAR.ViewsHelper.CharacterImport import SAVING_THROW_NAMES, SKILL_NAMES
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import DnDBeyondCharacterService
+
+MODIFIER_SOURCES = ["race", "feats", "magic-items", "class", "background"]
+
+
+def large_character(modifier_count):
+    """The upstream fixture with modifier_count modifiers spread over all sources and 20 classes."""
+    data = copy.deepcopy(load_test_json("DnDBeyondCharacter.json"))
+    character = data["data"]
+    character["classes"] = [{"level": 1, "definition": {"name": f"Class {index}"},
+                              "subclassDefinition": {"name": f"Subclass {index}"}} for index in range(20)]
+    sub_types = ["strength-score", "speed", "armor-class", "initiative", "darkvision", "light-armor"]
+    character["modifiers"] = {source: [] for source in MODIFIER_SOURCES}
+    for index in range(modifier_count):
+        character["modifiers"][MODIFIER_SOURCES[index % len(MODIFIER_SOURCES)]].append(
+            {"type": "bonus", "subType": sub_types[index % len(sub_types)], "value": 1})
+    character["modifiers"]["class"] += [
+        {"type": "proficiency", "subType": "stealth"},
+        {"type": "expertise", "subType": "stealth"},
+        {"type": "proficiency", "subType": "dexterity-saving-throws"},
+    ]
+    return data
+
+
+def collect_modifiers(character):
+    modifiers = []
+    for source in MODIFIER_SOURCES:
+        modifiers.extend(character.get("modifiers", {}).get(source, []))
+    return modifiers
+
+
+def scanned_traits(character):
+    """Proficiencies the way parse_character_data derived them before the modifier index."""
+    modifiers = collect_modifiers(character)
+    skills = [(name,
+               any(m.get("type") == "proficiency" and name in m.get("subType", "").lower() for m in modifiers),
+               any(m.get("type") == "expertise" and name in m.get("subType", "").lower() for m in modifiers))
+              for name in SKILL_NAMES]
+    saves = [(name, any(m.get("type") == "proficiency" and (
+        f"{name}-saving-throws" in m.get("subType", "").lower() or
+        f"{stat_id}-saving-throws" in m.get("subType", "").lower()) for m in modifiers))
+             for stat_id, name in enumerate(SAVING_THROW_NAMES, start=1)]
+    return skills, saves
+
+
+def indexed_traits(character):
+    index = DnDBeyondCharacterService.index_modifiers(collect_modifiers(character))
+    skills = [(name, ("proficiency", name) in index, ("expertise", name) in index) for name in SKILL_NAMES]
+    saves = [(name, ("proficiency", f"{name}_saving_throws") in index or
+              ("proficiency", f"{stat_id}_saving_throws") in index)
+             for stat_id, name in enumerate(SAVING_THROW_NAMES, start=1)]
+    return skills, saves
+
+
+def time_per_call(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--modifiers", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    data = large_character(args.modifiers)
+    assert scanned_traits(data["data"]) == indexed_traits(data["data"])
+
+    scan_ms = time_per_call(lambda: scanned_traits(data["data"]), args.iterations)
+    index_ms = time_per_call(lambda: indexed_traits(data["data"]), args.iterations)
+    parse_ms = time_per_call(lambda: DnDBeyondCharacterService.parse_character_data(data), args.iterations)
+
+    print(f"{args.modifiers} modifiers, {len(SKILL_NAMES)} skills, {len(SAVING_THROW_NAMES)} saving throws")
+    print_table(["path", "ms per character", "speedup"], [
+        ["any() scan per trait", f"{scan_ms:.2f}", "1.0x"],
+        ["(type, subType) index", f"{index_ms:.2f}", f"{scan_ms / index_ms:.1f}x"],
+        ["parse_character_data (total)", f"{parse_ms:.2f}", ""],
+    ])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Time to compute the derived values of a party: compute_derived_stats once per character on
+.values() rows against load_party_arrays and compute_party_bonuses on NumPy arrays, with the
+database reads measured separately from the computation. Also times group check
+simulations of --trials rolls for the whole party.
+
+    python benchmarks/bench_party_stats.py [--characters 500] [--iterations 10] [--trials 10000]
+"""
+import argparse
+import time
+from collections import defaultdict
+
+from _common import benchmark_database, print_table, synthetic_character
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.DerivedFormulas import compute_derived_stats
+from PenAndPapAR.ViewsHelper.DerivedStats import STATS_INPUT_FIELDS
+from PenAndPapAR.ViewsHelper.PartyStats import (
+    SKILL_INDEX,
+    check_bonuses,
+    compute_party_bonuses,
+    load_party_arrays,
+    simulate_group_check
+)
+from PenAndPapAR.models import Attributes, CharacterStats, SavingThrowProficiencies, Skills
+
+
+def load_rows(character_ids):
+    """The rows compute_derived_stats needs, grouped by character."""
+    stats = {row["character_id"]: row for row in CharacterStats.objects.filter(
+        character_id__in=character_ids).values("character_id", *STATS_INPUT_FIELDS)}
+    traits = {}
+    for name, model, character_field in [
+            ("attributes", Attributes, "attribute_character"),
+            ("skills", Skills, "skill_character"),
+            ("saving_throws", SavingThrowProficiencies, "saving_throw_proficiency_character")]:
+        grouped = defaultdict(list)
+        for row in model.objects.filter(**{f"{character_field}__in": character_ids}).values():
+            grouped[row[f"{character_field}_id"]].append(row)
+        traits[name] = grouped
+    return stats, traits
+
+
+def compute_per_character(stats, traits):
+    return [compute_derived_stats(stats[character_id], traits["attributes"][character_id],
+                                  traits["skills"][character_id], traits["saving_throws"][character_id])
+            for character_id in stats]
+
+
+def best_ms(function, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return min(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=500)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--trials", type=int, default=10_000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        prepared, _ = prepare_characters([synthetic_character(index) for index in range(args.characters)])
+        character_ids = write_characters(prepared)
+
+        stats, traits = load_rows(character_ids)
+        party = load_party_arrays(character_ids)
+        per_character = compute_per_character(stats, traits)
+        bonuses = compute_party_bonuses(party)
+        assert per_character[0]["derived_skill_totals"]["stealth"] == int(
+            bonuses["derived_skill_totals"][0, SKILL_INDEX["stealth"]]), "the two paths disagree"
+
+        timings = [
+            ("load rows (.values())", best_ms(lambda: load_rows(character_ids), args.iterations),
+             "load rows (.values())"),
+            ("load_party_arrays", best_ms(lambda: load_party_arrays(character_ids), args.iterations),
+             "load rows (.values())"),
+            ("compute_derived_stats per character",
+             best_ms(lambda: compute_per_character(stats, traits), args.iterations),
+             "compute_derived_stats per character"),
+            ("compute_party_bonuses", best_ms(lambda: compute_party_bonuses(party), args.iterations),
+             "compute_derived_stats per character"),
+        ]
+        stealth = check_bonuses(bonuses, "stealth")
+        for party_size in (4, 8, args.characters):
+            timings.append((f"group check, {party_size} characters", best_ms(
+                lambda: simulate_group_check(stealth[:party_size], 15, args.trials, seed=0), args.iterations),
+                None))
+
+    by_name = {name: ms for name, ms, _ in timings}
+    print(f"{args.characters} characters, {args.trials} trials per group check, best of {args.iterations}")
+    print_table(["path", "ms", "speedup"], [
+        [name, f"{ms:.3f}", f"{by_name[baseline] / ms:.1f}x" if baseline else ""]
+        for name, ms, baseline in timings])
+
+
+if __name__ == "__main__":
+    main()
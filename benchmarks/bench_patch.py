@@ -0,0 +1,63 @@
+"""
+Latency and payload size of a hit point change sent as PATCH delta compared with
+sending the whole sheet through PUT, both through the Django test client.
+
+    python benchmarks/bench_patch.py [--iterations 500]
+"""
+import argparse
+import json
+import time
+
+from _common import benchmark_database, load_test_json, percentiles, print_table, synthetic_character
+
+from rest_framework.test import APIClient
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+
+
+def run(client, method, build_payload, iterations):
+    samples = []
+    request_bytes = response_bytes = 0
+    for iteration in range(iterations):
+        payload = build_payload(iteration)
+        body = json.dumps(payload)
+        start = time.perf_counter()
+        response = getattr(client, method)("/api/stats/", body, content_type="application/json")
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.content
+        request_bytes = len(body)
+        response_bytes = len(response.content)
+    return percentiles(samples), request_bytes, response_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=500)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        prepared_characters, _ = prepare_characters([synthetic_character(0)])
+        character_id = write_characters(prepared_characters)[0]
+        client = APIClient()
+
+        sheet = load_test_json("CompleteCharacterPut.json")
+        sheet["stats"][0]["character_id"] = character_id
+
+        def full_put(iteration):
+            sheet["hit_points"][0]["hit_points_current"] = iteration % 30
+            return sheet
+
+        def delta_patch(iteration):
+            return {"character_id": character_id, "hit_points": {"hit_points_current": iteration % 30}}
+
+        rows = []
+        for name, method, build_payload in [("PUT full sheet", "put", full_put),
+                                            ("PATCH delta", "patch", delta_patch)]:
+            latency, request_bytes, response_bytes = run(client, method, build_payload, args.iterations)
+            rows.append([name, f"{latency['p50']:.2f}", f"{latency['p95']:.2f}", request_bytes, response_bytes])
+
+    print_table(["request", "p50 ms", "p95 ms", "request bytes", "response bytes"], rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""
+Statements issued and latency of the PUT update path compared with the nested-loop,
+row-by-row implementation CharacterStatsView.put used before.
+
+    python benchmarks/bench_put_update.py [--iterations 200]
+"""
+import argparse
+import copy
+import time
+
+from _common import benchmark_database, load_test_json, print_table, synthetic_character
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.CharacterSheet import serialize_character_sheet
+from PenAndPapAR.ViewsHelper.CharacterUpdate import update_character_sheet
+from PenAndPapAR.models import Attributes, CharacterStats, AC, SavingThrowProficiencies, Skills, HitPoints
+from PenAndPapAR.serializers import (
+    CharacterStatsSerializer,
+    AttributesSerializer,
+    ACSerializer,
+    SavingThrowProficienciesSerializer,
+    SkillsSerializer,
+    HitPointsSerializer
+)
+
+
+def legacy_put(data):
+    # the former CharacterStatsView.put, without the request handling
+    character_id = data["stats"][0]["character_id"]
+    character_stats_db = CharacterStats.objects.filter(character_id=character_id)
+    character_attributes_db = Attributes.objects.filter(attribute_character=character_id)
+    character_ac_db = AC.objects.filter(ac_character=character_id)
+    character_saving_throw_proficiencies_db = SavingThrowProficiencies.objects.filter(
+        saving_throw_proficiency_character=character_id)
+    character_skills_db = Skills.objects.filter(skill_character=character_id)
+    character_hit_points_db = HitPoints.objects.filter(hit_points_character=character_id)
+
+    for stat in data.get("stats") or []:
+        character_stats_db.update(**stat)
+    for attr in data.get("attributes") or []:
+        for attr_db in character_attributes_db:
+            if attr_db.attribute_name == attr["attribute_name"]:
+                for field in ["attribute_value", "attribute_adjustment"]:
+                    if field in attr:
+                        setattr(attr_db, field, attr[field])
+                attr_db.save()
+                break
+    for ac_trait in data.get("ac") or []:
+        character_ac_db.update(**ac_trait)
+    for save in data.get("saving_throw_proficiencies") or []:
+        for save_db in character_saving_throw_proficiencies_db:
+            if save_db.saving_throw_name == save["saving_throw_name"]:
+                for field in ["saving_throw_adjustment", "saving_throw_is_proficient"]:
+                    if field in save:
+                        setattr(save_db, field, save[field])
+                save_db.save()
+                break
+    for skill in data.get("skills") or []:
+        for skill_db in character_skills_db:
+            if skill_db.skill_name == skill["skill_name"]:
+                for field in ["skill_adjustment", "skill_is_proficient", "skill_is_expertise"]:
+                    if field in skill:
+                        setattr(skill_db, field, skill[field])
+                skill_db.save()
+                break
+    for hit_point_trait in data.get("hit_points") or []:
+        character_hit_points_db.update(**hit_point_trait)
+
+    return {
+        "stats": CharacterStatsSerializer(character_stats_db, many=True).data,
+        "attributes": AttributesSerializer(character_attributes_db, many=True).data,
+        "ac": ACSerializer(character_ac_db, many=True).data,
+        "saving_throw_proficiencies": SavingThrowProficienciesSerializer(character_saving_throw_proficiencies_db,
+                                                                         many=True).data,
+        "skills": SkillsSerializer(character_skills_db, many=True).data,
+        "hit_points": HitPointsSerializer(character_hit_points_db, many=True).data,
+    }
+
+
+def bulk_put(data):
+    character, _ = update_character_sheet(data["stats"][0]["character_id"], data)
+    return serialize_character_sheet(character)
+
+
+def scenarios():
+    complete = load_test_json("CompleteCharacterPut.json")
+    for section in ["ac", "hit_points"]:
+        for row in complete[section]:
+            row.pop("id", None)
+
+    all_skills = copy.deepcopy(complete)
+
+    def toggle_skills(data, iteration):
+        for skill in data["skills"]:
+            skill["skill_adjustment"] = iteration % 2
+        return data
+
+    def change_hp(data, iteration):
+        data["hit_points"][0]["hit_points_current"] = iteration % 30
+        return data
+
+    return [
+        ("all 18 skills changed", all_skills, toggle_skills),
+        ("full sheet, hp changed", copy.deepcopy(complete), change_hp),
+        ("full sheet, unchanged", copy.deepcopy(complete), lambda data, iteration: data),
+        ("minimal put", load_test_json("MinimalCharacterPut.json"), lambda data, iteration: data),
+    ]
+
+
+def measure(put, data, mutate, iterations):
+    start = time.perf_counter()
+    for iteration in range(iterations):
+        put(mutate(copy.deepcopy(data), iteration))
+    elapsed = time.perf_counter() - start
+
+    # one more call with a value the loop did not just write, so changed scenarios really change
+    connection.queries_log.clear()
+    with CaptureQueriesContext(connection) as queries:
+        put(mutate(copy.deepcopy(data), iterations))
+    return len(queries), elapsed / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+
+    rows = []
+    with benchmark_database():
+        prepared_characters, _ = prepare_characters([synthetic_character(0)])
+        write_characters(prepared_characters)
+
+        for name, data, mutate in scenarios():
+            legacy_statements, legacy_ms = measure(legacy_put, data, mutate, args.iterations)
+            bulk_statements, bulk_ms = measure(bulk_put, data, mutate, args.iterations)
+            rows.append([name, legacy_statements, bulk_statements, f"{legacy_ms:.2f}", f"{bulk_ms:.2f}"])
+
+    print_table(["scenario", "legacy stmts", "bulk stmts", "legacy ms", "bulk ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
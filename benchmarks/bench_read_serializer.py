@@ -0,0 +1,90 @@
+"""
+Time to build character sheets for reads: the ModelSerializer classes on model instances,
+the compiled ReadSerializer on the same instances, and load_character_sheets, which reads
+.values() rows. Serialization alone and load plus serialization are measured separately.
+
+    python benchmarks/bench_read_serializer.py [--characters 200] [--iterations 20]
+"""
+import argparse
+import time
+
+from _common import benchmark_database, print_table, synthetic_character
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.CharacterSheet import (
+    character_sheet_queryset,
+    load_character_sheets,
+    serialize_character_sheet
+)
+from PenAndPapAR.serializers import (
+    ACSerializer,
+    AttributesSerializer,
+    CharacterStatsSerializer,
+    HitPointsSerializer,
+    SavingThrowProficienciesSerializer,
+    SkillsSerializer
+)
+
+
+def model_serializer_sheet(character):
+    """The sheet as serialize_character_sheet built it before the ReadSerializer."""
+    ac = getattr(character, "ac", None)
+    hit_points = getattr(character, "hit_points", None)
+    return {
+        "stats": CharacterStatsSerializer([character], many=True).data,
+        "attributes": AttributesSerializer(character.attributes_set.all(), many=True).data,
+        "ac": ACSerializer([ac] if ac else [], many=True).data,
+        "saving_throw_proficiencies": SavingThrowProficienciesSerializer(
+            character.savingthrowproficiencies_set.all(), many=True).data,
+        "skills": SkillsSerializer(character.skills_set.all(), many=True).data,
+        "hit_points": HitPointsSerializer([hit_points] if hit_points else [], many=True).data,
+    }
+
+
+def best_ms_per_sheet(function, sheets, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return min(samples) / sheets * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=200)
+    parser.add_argument("--iterations", type=int, default=20)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        prepared, _ = prepare_characters([synthetic_character(index) for index in range(args.characters)])
+        character_ids = write_characters(prepared)
+        characters = list(character_sheet_queryset().filter(character_id__in=character_ids))
+        assert all(serialize_character_sheet(character) == model_serializer_sheet(character)
+                   for character in characters)
+
+        timings = {
+            "ModelSerializer": best_ms_per_sheet(
+                lambda: [model_serializer_sheet(character) for character in characters],
+                len(characters), args.iterations),
+            "ReadSerializer, instances": best_ms_per_sheet(
+                lambda: [serialize_character_sheet(character) for character in characters],
+                len(characters), args.iterations),
+            "load + ModelSerializer": best_ms_per_sheet(
+                lambda: [model_serializer_sheet(character)
+                         for character in character_sheet_queryset().filter(character_id__in=character_ids)],
+                len(characters), args.iterations),
+            "load_character_sheets (.values())": best_ms_per_sheet(
+                lambda: load_character_sheets(character_ids), len(characters), args.iterations),
+        }
+
+    baselines = {"ModelSerializer": "ModelSerializer", "ReadSerializer, instances": "ModelSerializer",
+                 "load + ModelSerializer": "load + ModelSerializer",
+                 "load_character_sheets (.values())": "load + ModelSerializer"}
+    print(f"{args.characters} sheets with 30 trait rows each, best of {args.iterations}")
+    print_table(["path", "ms per sheet", "speedup"], [
+        [name, f"{ms:.3f}", f"{timings[baselines[name]] / ms:.1f}x"] for name, ms in timings.items()])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+SQL statements and time of re-syncing linked characters from the local upstream stand-in
+when nothing changed upstream, with the stored content hashes (default) and with --force,
+which loads and compares every sheet like re-syncs did before the hashes. A third run
+changes the hit points of every upstream character to show what a one-section change writes.
+
+    python benchmarks/bench_resync.py [--characters 200]
+"""
+import argparse
+import copy
+import time
+
+from _common import benchmark_database, load_test_json, print_table, synthetic_character
+
+from django.db import connection, reset_queries
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.CharacterResync import linked_characters, resync_characters
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import get_payload_cache
+from PenAndPapAR.upstream_stand_in import StandInCharacterService
+
+
+def upstream_characters(count):
+    fixture = load_test_json("DnDBeyondCharacter.json")
+    characters = {}
+    for index in range(count):
+        data = copy.deepcopy(fixture)
+        data["data"]["id"] = index + 1
+        data["data"]["name"] = f"Upstream {index}"
+        characters[str(index + 1)] = data
+    return characters
+
+
+def seed(upstream, count):
+    payloads = []
+    for index in range(count):
+        data = synthetic_character(index)
+        data["stats"][0]["character_update_link"] = upstream.character_url(str(index + 1))
+        payloads.append(data)
+    prepared, errors = prepare_characters(payloads)
+    assert not errors, errors
+    write_characters(prepared)
+
+
+def measure(force):
+    """Statements by kind and seconds of one re-sync of every linked character."""
+    get_payload_cache().clear()
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        result = resync_characters(linked_characters(), workers=8, rate=0, force=force)
+        elapsed = time.perf_counter() - start
+    assert not result.failed, result.failed
+
+    kinds = {"SELECT": 0, "UPDATE": 0, "other": 0}
+    for query in queries.captured_queries:
+        verb = query["sql"].split(" ", 1)[0]
+        kinds[verb if verb in kinds else "other"] += 1
+    return result, kinds, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--characters", type=int, default=200)
+    args = parser.parse_args()
+
+    characters = upstream_characters(args.characters)
+    rows = []
+    with benchmark_database(), StandInCharacterService(characters) as upstream, \
+            override_settings(DNDBEYOND_CLIENT={"BASE_URL": upstream.base_url}):
+        seed(upstream, args.characters)
+        resync_characters(linked_characters(), rate=0)  # applies the upstream sheets and stores the hashes
+
+        runs = [("unchanged, --force", True), ("unchanged, content hash", False)]
+        for name, force in runs:
+            result, kinds, elapsed = measure(force)
+            rows.append([name, len(result.updated), len(result.skipped), kinds["SELECT"], kinds["UPDATE"],
+                         kinds["other"], f"{elapsed * 1000:.0f}"])
+
+        for character in characters.values():
+            character["data"]["currentHp"] -= 1
+        result, kinds, elapsed = measure(force=False)
+        rows.append(["hit points changed, content hash", len(result.updated), len(result.skipped),
+                     kinds["SELECT"], kinds["UPDATE"], kinds["other"], f"{elapsed * 1000:.0f}"])
+
+    print(f"{args.characters} linked characters")
+    print_table(["re-sync", "updated", "skipped", "SELECT", "UPDATE", "other", "ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
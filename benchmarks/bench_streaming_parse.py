@@ -0,0 +1,74 @@
+"""
+Peak Python memory and time of fetching a large D&D Beyond payload from the local upstream
+stand-in, read as a whole (response.json()) and streamed with ijson.
+
+    python benchmarks/bench_streaming_parse.py [--items 5000] [--iterations 5]
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from _common import load_test_json, print_table
+
+from django.test import override_settings
+
+from PenAndPapAR.ViewsHelper.DNDBeyondWebdata import DnDBeyondCharacterService, ijson
+from PenAndPapAR.upstream_stand_in import StandInCharacterService
+
+
+def large_character(items):
+    """The upstream fixture with an inventory, spells and notes the import does not need."""
+    data = load_test_json("DnDBeyondCharacter.json")
+    character = data["data"]
+    character["inventory"] = [
+        {"id": index, "quantity": 1, "equipped": index % 7 == 0,
+         "definition": {"name": f"Item {index}", "description": f"<p>{'A well crafted item. ' * 20}</p>",
+                        "weight": 1.5, "tags": ["Utility", "Adventuring Gear"]}}
+        for index in range(items)]
+    character["spells"] = {"class": [{"definition": {"name": f"Spell {index}", "description": "Arcane words. " * 40}}
+                                     for index in range(items // 5)]}
+    character["notes"] = {"backstory": "Once upon a time. " * 5000}
+    return data
+
+
+def measure(upstream, streaming, iterations):
+    """Peak traced memory of one fetch and the best time of several untraced ones."""
+    client_settings = {"BASE_URL": upstream.base_url, "STREAMING": streaming}
+    with override_settings(DNDBEYOND_CLIENT=client_settings):
+        DnDBeyondCharacterService.fetch_character_data("1")  # warm up the connection pool
+        tracemalloc.start()
+        data = DnDBeyondCharacterService.fetch_character_data("1")
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        assert data["data"]["name"] == "Thorin Emberforge"
+
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            DnDBeyondCharacterService.fetch_character_data("1")
+            samples.append(time.perf_counter() - start)
+    return peak, min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    # encoded once, so the stand-in does not allocate the document in the measured window
+    body = json.dumps(large_character(args.items)).encode("utf-8")
+    size = len(body)
+    rows = []
+    with StandInCharacterService({"1": body}) as upstream:
+        for name, streaming in [("response.json()", False), ("ijson stream", True)]:
+            peak, seconds = measure(upstream, streaming, args.iterations)
+            rows.append([name, f"{peak / 1024 / 1024:.2f}", f"{seconds * 1000:.1f}"])
+
+    print(f"payload {size / 1024 / 1024:.2f} MiB, ijson backend {ijson.backend if ijson else 'not installed'}")
+    print_table(["read", "peak MiB", "best ms"], rows)
+
+
+if __name__ == "__main__":
+    main()
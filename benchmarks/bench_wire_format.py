@@ -0,0 +1,70 @@
+"""
+Payload size and encode/decode time of a character sheet in the wire formats of
+CharacterStatsView.get: JSON and MessagePack, each plain and packed (?packed=1).
+
+    python benchmarks/bench_wire_format.py [--iterations 2000]
+"""
+import argparse
+import gzip
+import json
+import time
+
+from _common import benchmark_database, print_table, synthetic_character
+
+import msgpack
+from rest_framework.renderers import JSONRenderer
+
+from PenAndPapAR.parsers import MessagePackParser
+from PenAndPapAR.renderers import MessagePackRenderer
+from PenAndPapAR.ViewsHelper.CharacterImport import prepare_characters, write_characters
+from PenAndPapAR.ViewsHelper.CharacterSheet import load_character_sheet
+from PenAndPapAR.ViewsHelper.PackedSheet import pack_character_sheet
+
+
+class BytesStream:
+    def __init__(self, content):
+        self.content = content
+
+    def read(self):
+        return self.content
+
+
+def time_per_call(function, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - start) / iterations * 1_000_000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    with benchmark_database():
+        prepared_characters, _ = prepare_characters([synthetic_character(0)])
+        character_id = write_characters(prepared_characters)[0]
+        # the same plain dicts and lists the view gets from the sheet cache
+        sheet = json.loads(json.dumps(load_character_sheet(character_id)))
+
+    formats = [
+        ("json", JSONRenderer(), lambda content: json.loads(content)),
+        ("msgpack", MessagePackRenderer(), lambda content: MessagePackParser().parse(BytesStream(content))),
+    ]
+    rows = []
+    for representation, data in [("plain", sheet), ("packed", pack_character_sheet(sheet))]:
+        for name, renderer, decode in formats:
+            content = renderer.render(data)
+            assert decode(content) == json.loads(json.dumps(data))
+            rows.append([
+                name, representation, len(content), len(gzip.compress(content)),
+                f"{time_per_call(lambda: renderer.render(data), args.iterations):.1f}",
+                f"{time_per_call(lambda: decode(content), args.iterations):.1f}",
+            ])
+
+    print(f"msgpack {'.'.join(map(str, msgpack.version))}, one sheet with 30 trait rows")
+    print_table(["format", "representation", "bytes", "gzip bytes", "encode us", "decode us"], rows)
+
+
+if __name__ == "__main__":
+    main()